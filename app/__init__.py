@@ -3,10 +3,8 @@ import sys
 import logging
 from flask import Flask
 from flask_moment import Moment
-from openai import OpenAI
 from logging.handlers import RotatingFileHandler
 from pathlib import Path
-import queue
 
 from config import Config
 from utils.audio_processing import AudioProcessor
@@ -26,8 +24,11 @@ def create_app(config_class=Config):
     )
     logger = logging.getLogger(__name__)
 
-    # 設置全域進度追蹤器
-    app.progress_tracker = {}
+    # 設置全域進度廣播匯流排
+    from .services.progress_bus import ProgressBus
+    app.progress_bus = ProgressBus()
+    # 摘要生成的事件 (同一會議的多個 SSE 連線共用同一次生成)
+    app.summary_bus = ProgressBus(max_retained=100)
 
     # 檢查 HuggingFace Token 是否存在
     if not app.config['HF_TOKEN']:
@@ -49,12 +50,30 @@ def create_app(config_class=Config):
         # 確保資料庫表格已建立
         db.init_db()
 
-    # 初始化音訊處理器並附加到 app
-    client = OpenAI()
-    app.audio_processor = AudioProcessor(
-        hf_token=app.config['HF_TOKEN'],
-        openai_client=client
-    )
+    # 所有 LLM 請求共用的呼叫層 (連線池、併發上限、重試與延遲統計)，用戶端在第一次使用時才建立
+    from utils.llm_provider import LLMProvider, configure_provider
+    app.llm = LLMProvider.from_config(app.config)
+    configure_provider(app.llm)
+
+    # 初始化音訊處理器並附加到 app (語者辨識模型在第一次使用時才載入)
+    app.audio_processor = AudioProcessor(hf_token=app.config['HF_TOKEN'], llm_provider=app.llm,
+                                         transcription_timeout=app.config['TRANSCRIPTION_TIMEOUT_SECONDS'])
+
+    # 初始化重複上傳的處理結果快取
+    from .services.artifact_cache import ArtifactCache
+    ArtifactCache(app)
+
+    # 初始化 LLM 回應快取
+    from .services.llm_cache import LLMResponseCache
+    LLMResponseCache(app)
+
+    # 初始化逐字稿快取 (行程內 LRU)
+    from .services.transcript_cache import TranscriptCache
+    TranscriptCache(app)
+
+    # 初始化背景工作佇列 (所有設定完成後才啟動 worker)
+    from .services.job_queue import JobQueue
+    JobQueue(app)
 
     # 確保所有必要的資料夾都存在
     # 由於此邏輯位於應用程式工廠中，它只會在啟動時執行一次。
@@ -78,6 +97,9 @@ def create_app(config_class=Config):
     from .api import bp as api_bp
     app.register_blueprint(api_bp)
 
+    # 啟動背景工作佇列並接手上次中斷的工作
+    app.job_queue.autostart()
+
     logger.info("Flask 應用程式已建立並設定完成。")
 
     return app
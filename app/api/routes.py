@@ -1,20 +1,31 @@
+import json
 import logging
+import queue
+import threading
 from pathlib import Path
-from threading import Thread
 
-from flask import jsonify, current_app, Response, request
+from flask import jsonify, current_app, Response, request, stream_with_context
 from werkzeug.utils import secure_filename
 import uuid
 import os
 
 from . import bp
-from app.db import (get_meeting_by_id, delete_meeting_by_id, get_meeting_summary, 
-                    save_meeting_summary, get_speaker_names, get_all_meetings, 
+from app.db import (close_db, get_meeting_by_id, delete_meeting_by_id, get_meeting_summary, 
+                    save_meeting_summary, get_speaker_names, search_transcripts,
+                    get_meetings_page, get_summary_state, save_summary_state,
+                    count_meetings_by_status, encode_meeting_cursor, decode_meeting_cursor,
                     add_meeting, update_speaker_name, delete_speaker_name,
-                    update_supplementary_summary)
-from utils.subtitle_processing import parse_srt_content
+                    update_supplementary_summary, get_queue_depth, get_queue_position,
+                    get_latest_job, get_stage_checkpoints, update_meeting_status)
+from app.services.artifact_cache import save_upload_with_hash
+from app.services.http_cache import meeting_validators, not_modified_response, cacheable_response
+from app.services.processing import load_transcript_records, read_transcript_records, is_meeting_busy
+from app.services.progress_bus import TERMINAL_STEPS
+from utils.subtitle_processing import format_segments, find_segment_window, page_segments, format_time
+from utils.search_text import build_match_query, make_snippet
 from utils.document_parser import read_document_text
-from utils.transcription_processor import create_summary_prompt, parse_summary_from_json
+from utils.transcription_processor import summarize_meeting, extract_partial_summary, apply_speaker_names
+from utils.waveform import generate_waveform_peaks, read_peaks_file, select_peaks
 
 logger = logging.getLogger(__name__)
 
@@ -22,31 +33,28 @@ logger = logging.getLogger(__name__)
 # 會議基本管理 API
 # ===============================================
 
+def _format_meeting_listing(meeting):
+    """將會議列表資料格式化為 API 回應"""
+    return {
+        'id': meeting['id'],
+        'original_filename': meeting['original_filename'],
+        'status': meeting['status'],
+        'created_at': meeting['created_at'],
+        'duration': meeting['duration'],
+        'num_speakers': meeting['num_speakers']
+    }
+
 @bp.route('/recent-meetings')
 def get_recent_meetings():
     """API: 獲取最近的會議記錄（用於首頁顯示）"""
     try:
         # 獲取最近5筆會議記錄
-        all_meetings = get_all_meetings()
-        recent_meetings = all_meetings[:5] if all_meetings else []
-        
-        # 格式化回傳資料
-        formatted_meetings = []
-        for meeting in recent_meetings:
-            formatted_meeting = {
-                'id': meeting['id'],
-                'original_filename': meeting['original_filename'],
-                'status': meeting['status'],
-                'created_at': meeting['created_at'],
-                'duration': meeting['duration'],
-                'num_speakers': meeting['num_speakers']
-            }
-            formatted_meetings.append(formatted_meeting)
+        recent_meetings, _ = get_meetings_page(limit=5)
         
         return jsonify({
             'status': 'success',
-            'meetings': formatted_meetings,
-            'total_count': len(all_meetings) if all_meetings else 0
+            'meetings': [_format_meeting_listing(meeting) for meeting in recent_meetings],
+            'total_count': count_meetings_by_status()['total']
         })
     except Exception as e:
         logger.error(f"獲取最近會議記錄時發生錯誤: {e}", exc_info=True)
@@ -55,6 +63,35 @@ def get_recent_meetings():
             'message': '獲取會議記錄失敗'
         }), 500
 
+@bp.route('/meetings')
+def list_meetings():
+    """API: 分頁獲取會議列表 (使用 before / after 游標)"""
+    try:
+        limit = min(max(request.args.get('limit', current_app.config['MEETINGS_PAGE_SIZE'], type=int), 1), 100)
+        before = request.args.get('before')
+        after = request.args.get('after')
+        meetings, has_more = get_meetings_page(
+            limit=limit,
+            before=decode_meeting_cursor(before) if before else None,
+            after=decode_meeting_cursor(after) if after else None
+        )
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    except Exception as e:
+        logger.error(f"獲取會議列表時發生錯誤: {e}", exc_info=True)
+        return jsonify({'status': 'error', 'message': '獲取會議記錄失敗'}), 500
+
+    # 往前翻頁時 has_more 代表更新的資料；往後翻頁時代表更舊的資料
+    has_older = has_more if not after else True
+    has_newer = has_more if after else bool(before)
+    return jsonify({
+        'status': 'success',
+        'meetings': [_format_meeting_listing(meeting) for meeting in meetings],
+        'next_cursor': encode_meeting_cursor(meetings[-1]) if meetings and has_older else None,
+        'prev_cursor': encode_meeting_cursor(meetings[0]) if meetings and has_newer else None,
+        'counts': count_meetings_by_status()
+    })
+
 @bp.route('/meeting', methods=['POST'])
 def create_meeting():
     """API: 創建新會議並上傳檔案"""
@@ -84,7 +121,8 @@ def create_meeting():
         if file_length > config['MAX_CONTENT_LENGTH']:
             return jsonify({'status': 'error', 'message': f'檔案大小超過 {config["MAX_CONTENT_LENGTH"] // 1024 // 1024}MB 的限制'}), 413
             
-        file.save(file_path)
+        # 寫入磁碟的同時計算內容雜湊，用於重複上傳的快取
+        content_hash = save_upload_with_hash(file, file_path)
     except Exception as e:
         logger.error(f"儲存檔案失敗: {e}", exc_info=True)
         return jsonify({'status': 'error', 'message': '儲存檔案時發生錯誤'}), 500
@@ -95,14 +133,10 @@ def create_meeting():
     else:
         num_speakers = None
     
-    add_meeting(meeting_id, filename, file.filename)
+    add_meeting(meeting_id, filename, file.filename, content_hash=content_hash)
     
-    # 啟動後台處理
-    from app.services.processing import process_meeting
-    app = current_app._get_current_object()
-    thread = Thread(target=process_meeting, args=(app, meeting_id, str(file_path), num_speakers))
-    thread.daemon = True
-    thread.start()
+    # 排入背景工作佇列
+    current_app.job_queue.enqueue(meeting_id, file_path, num_speakers)
     
     return jsonify({'status': 'success', 'meeting_id': meeting_id})
 
@@ -111,10 +145,113 @@ def get_meeting_status(meeting_id):
     """API: 獲取會議處理狀態"""
     meeting = get_meeting_by_id(meeting_id)
     if meeting:
-        return jsonify({'status': meeting['status'], 'error_message': meeting['error_message']})
+        return jsonify({
+            'status': meeting['status'],
+            'error_message': meeting['error_message'],
+            'queue_position': get_queue_position(meeting_id),
+            'queue_depth': get_queue_depth()
+        })
     else:
         return jsonify({'status': 'not_found'}), 404
 
+@bp.route('/meeting/<meeting_id>/retry', methods=['POST'])
+def retry_meeting(meeting_id):
+    """API: 重新處理失敗或中斷的會議，已完成且產出仍有效的階段會直接沿用"""
+    meeting = get_meeting_by_id(meeting_id)
+    if not meeting:
+        return jsonify({'status': 'error', 'message': '會議記錄不存在'}), 404
+
+    if meeting['status'] == 'completed':
+        return jsonify({'status': 'error', 'message': '會議已處理完成，無需重試'}), 400
+
+    if get_queue_position(meeting_id) is not None:
+        return jsonify({'status': 'error', 'message': '會議已在處理佇列中'}), 409
+
+    # 上一次處理失敗後，其他階段可能仍在寫入產出檔案
+    if is_meeting_busy(meeting_id):
+        return jsonify({'status': 'error', 'message': '會議仍在結束上一次的處理，請稍後再試'}), 409
+
+    # 預設沿用上次的語者數量設定 (重新分群過時以其為準)，也可以在請求中指定新的值
+    data = request.get_json(silent=True) or {}
+    checkpoints = get_stage_checkpoints(meeting_id)
+    diarize_checkpoint = checkpoints.get('diarize')
+    if diarize_checkpoint and diarize_checkpoint['params']:
+        num_speakers = diarize_checkpoint['params'].get('num_speakers')
+    else:
+        latest_job = get_latest_job(meeting_id)
+        num_speakers = latest_job['num_speakers'] if latest_job else None
+    if 'num_speakers' in data:
+        num_speakers = data['num_speakers'] if isinstance(data['num_speakers'], int) and data['num_speakers'] > 0 else None
+
+    completed_stages = sorted(checkpoints.keys())
+    file_path = current_app.config['UPLOADS_FOLDER'] / meeting['filename']
+    update_meeting_status(meeting_id, 'uploaded', error_message='')
+    current_app.job_queue.enqueue(meeting_id, file_path, num_speakers, meeting['supplementary_file_path'])
+
+    return jsonify({
+        'status': 'success',
+        'meeting_id': meeting_id,
+        'completed_stages': completed_stages
+    })
+
+@bp.route('/meeting/<meeting_id>/recluster', methods=['POST'])
+def recluster_meeting_api(meeting_id):
+    """API: 以新的語者數量或分群門檻重新分群 (不重跑語者辨識模型)"""
+    meeting = get_meeting_by_id(meeting_id)
+    if not meeting:
+        return jsonify({'status': 'error', 'message': '會議記錄不存在'}), 404
+
+    if meeting['status'] != 'completed':
+        return jsonify({'status': 'error', 'message': '會議尚未處理完成'}), 400
+
+    data = request.get_json(silent=True) or {}
+    num_speakers = data.get('num_speakers')
+    threshold = data.get('threshold')
+    if num_speakers is not None and (not isinstance(num_speakers, int) or num_speakers <= 0):
+        return jsonify({'status': 'error', 'message': '語者數量必須為正整數'}), 400
+    if threshold is not None and (not isinstance(threshold, (int, float)) or threshold <= 0):
+        return jsonify({'status': 'error', 'message': '分群門檻必須為正數'}), 400
+
+    try:
+        from app.services.processing import recluster_meeting
+        actual_num_speakers = recluster_meeting(
+            meeting_id,
+            num_speakers=num_speakers,
+            threshold=float(threshold) if threshold is not None else None
+        )
+        return jsonify({'status': 'success', 'num_speakers': actual_num_speakers})
+    except FileNotFoundError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 404
+    except Exception as e:
+        logger.error(f"重新分群時發生錯誤 (會議 ID: {meeting_id}): {e}", exc_info=True)
+        return jsonify({'status': 'error', 'message': '重新分群失敗'}), 500
+
+@bp.route('/llm-cache')
+def get_llm_cache_stats():
+    """API: 獲取 LLM 回應快取的命中統計"""
+    return jsonify({'status': 'success', 'data': current_app.llm_cache.stats()})
+
+@bp.route('/transcript-cache')
+def get_transcript_cache_stats():
+    """API: 獲取逐字稿快取的命中率與記憶體用量"""
+    return jsonify({'status': 'success', 'data': current_app.transcript_cache.stats()})
+
+@bp.route('/llm-stats')
+def get_llm_stats():
+    """API: 獲取 LLM 請求統計 (次數、重試、失敗、同時請求數與延遲)"""
+    return jsonify({'status': 'success', 'data': current_app.llm.stats()})
+
+@bp.route('/queue')
+def get_queue_status():
+    """API: 獲取背景處理佇列狀態"""
+    depth = get_queue_depth()
+    return jsonify({
+        'status': 'success',
+        'queued': depth['queued'],
+        'running': depth['running'],
+        'workers': current_app.job_queue.num_workers
+    })
+
 @bp.route('/meeting/<meeting_id>/delete', methods=['DELETE'])
 def delete_meeting(meeting_id):
     """API: 刪除指定的會議記錄及其相關檔案"""
@@ -133,8 +270,9 @@ def delete_meeting(meeting_id):
                 logger.info(f"已刪除上傳檔案: {uploaded_file}")
 
         # 刪除處理過程中的檔案
-        for ext in ['webm', 'wav']:
-            processed_file = config['PROCESSED_FOLDER'] / f"{meeting_id}.{ext}"
+        for processed_name in [f"{meeting_id}.webm", f"{meeting_id}.wav", f"{meeting_id}_diarization.npz",
+                               f"{meeting_id}_waveform.bin"]:
+            processed_file = config['PROCESSED_FOLDER'] / processed_name
             if processed_file.exists():
                 processed_file.unlink()
                 logger.info(f"已刪除處理檔案: {processed_file}")
@@ -159,6 +297,13 @@ def delete_meeting(meeting_id):
 # 輔助文件處理 API
 # ===============================================
 
+def _bypass_llm_cache():
+    """輔助函式：請求是否要求略過 LLM 回應快取 (查詢參數或 JSON 的 bypass_cache)。"""
+    if request.args.get('bypass_cache', '').lower() == 'true':
+        return True
+    payload = request.get_json(silent=True) or {}
+    return bool(payload.get('bypass_cache'))
+
 @bp.route('/meeting/<meeting_id>/process-supplement', methods=['POST'])
 def process_supplementary_file(meeting_id):
     """API: 處理輔助文件，產生摘要並儲存"""
@@ -180,7 +325,6 @@ def process_supplementary_file(meeting_id):
             return jsonify({'status': 'success', 'message': '文件內容為空，無需處理'})
 
         # 2. 呼叫 OpenAI 產生摘要
-        client = current_app.audio_processor.openai_client
         prompt = f"""
         你是一個專業的會議助理。請閱讀以下文件內容，並為其產生一份簡潔的摘要，提煉出最重要的核心重點。
         摘要應包含：
@@ -195,15 +339,15 @@ def process_supplementary_file(meeting_id):
         {document_text[:8000]}
         """
         
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
+        summary = current_app.llm.complete({
+            'messages': [
                 {"role": "system", "content": "你是一個專業的會議助理。"},
                 {"role": "user", "content": prompt}
             ],
-            temperature=0.3,
-        )
-        summary = response.choices[0].message.content
+            'temperature': 0.3,
+        }, use_cache=not _bypass_llm_cache())
+        if not summary:
+            raise RuntimeError("模型未返回輔助文件摘要")
 
         # 3. 儲存摘要到資料庫
         update_supplementary_summary(meeting_id, summary)
@@ -221,8 +365,8 @@ def process_supplementary_file(meeting_id):
 # 字幕與逐字稿 API
 # ===============================================
 
-def _get_subtitle_content(meeting_id):
-    """輔助函式：獲取字幕內容，返回 (內容, 原始檔名) 或 (錯誤JSON, 狀態碼)。"""
+def _get_subtitle_file(meeting_id):
+    """輔助函式：獲取字幕檔案，返回 (字幕檔路徑, 會議記錄) 或 (錯誤JSON, 狀態碼)。"""
     meeting = get_meeting_by_id(meeting_id)
     if not meeting:
         logger.warning(f"API請求：找不到會議記錄: {meeting_id}")
@@ -245,46 +389,138 @@ def _get_subtitle_content(meeting_id):
     if not subtitle_file.exists():
         logger.error(f"字幕檔案於檔案系統中不存在: {subtitle_file}")
         return jsonify({'error': '字幕檔案遺失', 'code': 'SUBTITLE_FILE_MISSING'}), 404
-        
+
+    return subtitle_file, meeting
+
+@bp.route('/meeting/<meeting_id>/subtitle')
+def get_meeting_subtitle(meeting_id):
+    """API: 獲取原始純文字字幕 (支援 ETag / Last-Modified 條件式請求與 gzip 壓縮)"""
+    result = _get_subtitle_file(meeting_id)
+    if not isinstance(result[0], Path):
+        return result # 這是錯誤回應 (jsonify, status)
+
+    subtitle_file, meeting = result
+    etag, last_modified = meeting_validators(meeting, [subtitle_file])
+    cached = not_modified_response(etag, last_modified)
+    if cached is not None:
+        return cached
+
     try:
         content = subtitle_file.read_text(encoding='utf-8')
         logger.info(f"成功為會議 {meeting_id} 載入字幕")
-        return content, meeting['original_filename']
     except Exception as e:
         logger.error(f"讀取字幕檔案時發生錯誤: {e}", exc_info=True)
         return jsonify({'error': '讀取字幕檔案失敗', 'code': 'FILE_READ_ERROR'}), 500
 
-@bp.route('/meeting/<meeting_id>/subtitle')
-def get_meeting_subtitle(meeting_id):
-    """API: 獲取原始純文字字幕"""
-    result = _get_subtitle_content(meeting_id)
-    if isinstance(result, tuple) and len(result) == 2 and isinstance(result[0], str):
-        content, original_filename = result
-        return Response(content, mimetype='text/plain; charset=utf-8', headers={
-            'X-Meeting-ID': meeting_id,
-            'X-Original-Filename': original_filename
-        })
-    return result # 這是錯誤回應 (jsonify, status)
+    response = Response(content, mimetype='text/plain; charset=utf-8', headers={
+        'X-Meeting-ID': meeting_id,
+        'X-Original-Filename': meeting['original_filename']
+    })
+    return cacheable_response(response, etag, last_modified)
+
+def _transcript_validators(meeting):
+    """輔助函式：逐字稿回應的快取驗證器 (片段記錄由語者字幕檔產生，重新處理時一併更新)"""
+    paths = [current_app.config['BASE_DIR'] / meeting['speaker_srt_path']] if meeting['speaker_srt_path'] else []
+    return meeting_validators(meeting, paths)
+
+# /transcription 可透過 fields 參數選擇的回應欄位
+TRANSCRIPTION_FIELDS = ('segments', 'srt_content', 'transcription_text', 'speaker_names')
+
+# 分頁查詢時單頁最多的片段數
+MAX_SEGMENT_PAGE_SIZE = 1000
+
+def _select_segments(meeting_id, records):
+    """
+    輔助函式：依查詢參數選出片段 (使用逐字稿快取中預先建立的索引二分搜尋)。
+    
+    - start / end: 只返回與此時間區間 (秒) 重疊的片段
+    - after: 片段編號游標，只返回編號大於此值的片段
+    - limit: 單頁片段數，未指定時返回區間內所有片段
+
+    Returns:
+        tuple: (片段記錄列表, 下一頁游標)
+
+    Raises:
+        ValueError: 參數格式錯誤
+    """
+    args = request.args
+    try:
+        start = float(args['start']) if 'start' in args else None
+        end = float(args['end']) if 'end' in args else None
+        after = int(args['after']) if 'after' in args else None
+        limit = int(args['limit']) if 'limit' in args else None
+    except ValueError:
+        raise ValueError('start、end 必須為秒數，after、limit 必須為整數')
+    if limit is not None and not 1 <= limit <= MAX_SEGMENT_PAGE_SIZE:
+        raise ValueError(f'limit 必須介於 1 到 {MAX_SEGMENT_PAGE_SIZE} 之間')
+
+    index = None
+    if start is not None or end is not None or after is not None:
+        index = current_app.transcript_cache.segment_index_of(meeting_id, records)
+    lo, hi = find_segment_window(records, start, end, index=index)
+    selected, next_cursor = page_segments(records, lo, hi, after=after, limit=limit, index=index)
+    if start is not None:
+        # 範圍內可能夾帶被較長片段包住、實際已在 start 之前結束的短片段
+        selected = [record for record in selected if record['end'] > start]
+    return selected, next_cursor
 
 @bp.route('/meeting/<meeting_id>/subtitle/formatted')
 def get_meeting_subtitle_formatted(meeting_id):
     """API: 獲取格式化為 JSON 的字幕"""
-    result = _get_subtitle_content(meeting_id)
-    if isinstance(result, tuple) and len(result) == 2 and isinstance(result[0], str):
-        content, _ = result
-        # 獲取發言者名稱映射
-        speaker_names = get_speaker_names(meeting_id)
-        segments = parse_srt_content(content, speaker_names)
+    meeting = get_meeting_by_id(meeting_id)
+    if not meeting:
+        logger.warning(f"API請求：找不到會議記錄: {meeting_id}")
+        return jsonify({'error': '會議記錄不存在', 'code': 'MEETING_NOT_FOUND'}), 404
+
+    if meeting['status'] != 'completed':
         return jsonify({
-            'meeting_id': meeting_id,
-            'total_segments': len(segments),
-            'segments': segments
-        })
-    return result # 這是錯誤回應
+            'error': '會議尚未處理完成',
+            'code': 'PROCESSING_NOT_COMPLETE',
+            'current_status': meeting['status']
+        }), 400
+
+    etag, last_modified = _transcript_validators(meeting)
+    cached = not_modified_response(etag, last_modified)
+    if cached is not None:
+        return cached
+
+    try:
+        records = load_transcript_records(meeting)
+    except Exception as e:
+        logger.error(f"讀取逐字稿片段時發生錯誤: {e}", exc_info=True)
+        return jsonify({'error': '讀取字幕檔案失敗', 'code': 'FILE_READ_ERROR'}), 500
+    if records is None:
+        return jsonify({'error': '字幕檔案遺失', 'code': 'SUBTITLE_FILE_MISSING'}), 404
+
+    try:
+        selected, next_cursor = _select_segments(meeting_id, records)
+    except ValueError as e:
+        return jsonify({'error': str(e), 'code': 'INVALID_PARAMETER'}), 400
+
+    # 獲取發言者名稱映射
+    speaker_names = get_speaker_names(meeting_id)
+    response = jsonify({
+        'meeting_id': meeting_id,
+        'total_segments': len(records),
+        'segments': format_segments(selected, speaker_names),
+        'next_cursor': next_cursor
+    })
+    return cacheable_response(response, etag, last_modified)
 
 @bp.route('/meeting/<meeting_id>/transcription')
 def get_meeting_transcription(meeting_id):
-    """API: 獲取會議逐字稿"""
+    """
+    API: 獲取會議逐字稿
+
+    支援 fields (以逗號分隔，例如 fields=segments) 選擇回應欄位，
+    以及 start / end / after / limit 分段讀取片段 (見 _select_segments)。
+    """
+    fields = request.args.get('fields')
+    fields = [f.strip() for f in fields.split(',') if f.strip()] if fields else list(TRANSCRIPTION_FIELDS)
+    unknown_fields = [f for f in fields if f not in TRANSCRIPTION_FIELDS]
+    if unknown_fields:
+        return jsonify({'status': 'error', 'message': f"不支援的欄位: {', '.join(unknown_fields)}"}), 400
+
     try:
         meeting = get_meeting_by_id(meeting_id)
         if not meeting:
@@ -292,63 +528,145 @@ def get_meeting_transcription(meeting_id):
         
         if meeting['status'] != 'completed' or not meeting['speaker_srt_path']:
             return jsonify({'status': 'error', 'message': '會議逐字稿尚未生成'}), 400
-            
-        srt_file_path = current_app.config['BASE_DIR'] / meeting['speaker_srt_path']
-        if not srt_file_path.exists():
+
+        etag, last_modified = _transcript_validators(meeting)
+        cached = not_modified_response(etag, last_modified)
+        if cached is not None:
+            return cached
+
+        records = load_transcript_records(meeting)
+        if records is None:
             return jsonify({'status': 'error', 'message': '逐字稿檔案不存在'}), 404
-        
-        with open(srt_file_path, 'r', encoding='utf-8') as f:
-            srt_content = f.read()
+
+        try:
+            selected, next_cursor = _select_segments(meeting_id, records)
+        except ValueError as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
         
         # 獲取發言者名稱映射
         speaker_names = get_speaker_names(meeting_id)
         
-        # 使用字幕處理函數解析內容
-        segments = parse_srt_content(srt_content, speaker_names)
+        data = {}
+        if 'segments' in fields:
+            data['segments'] = format_segments(selected, speaker_names)
+            data['total_segments'] = len(records)
+            data['next_cursor'] = next_cursor
+        if 'srt_content' in fields:
+            # 原始 SRT 只需讀檔，不再重新解析
+            srt_file_path = current_app.config['BASE_DIR'] / meeting['speaker_srt_path']
+            data['srt_content'] = srt_file_path.read_text(encoding='utf-8') if srt_file_path.exists() else ''
+        if 'transcription_text' in fields:
+            data['transcription_text'] = current_app.transcript_cache.transcription_of(meeting_id, records)
+        if 'speaker_names' in fields:
+            data['speaker_names'] = speaker_names
         
-        return jsonify({
-            'status': 'success',
-            'data': {
-                'segments': segments,
-                'srt_content': srt_content,
-                'transcription_text': _parse_srt_to_transcription(srt_content),
-                'speaker_names': speaker_names
-            }
-        })
+        return cacheable_response(jsonify({'status': 'success', 'data': data}), etag, last_modified)
         
     except Exception as e:
         logger.error(f"獲取會議逐字稿時發生錯誤: {e}", exc_info=True)
         return jsonify({'status': 'error', 'message': '獲取逐字稿時發生錯誤'}), 500
 
-def _parse_srt_to_transcription(srt_content):
-    """將 SRT 格式轉換為逐字稿格式"""
-    lines = srt_content.strip().split('\n')
-    transcription_lines = []
-    
-    i = 0
-    while i < len(lines):
-        line = lines[i].strip()
-        
-        # 跳過序號行
-        if line.isdigit():
-            i += 1
-            continue
-            
-        # 跳過時間戳行
-        if '-->' in line:
-            i += 1
-            continue
-            
-        # 跳過空行
-        if not line:
-            i += 1
-            continue
-            
-        # 這是字幕內容行
-        transcription_lines.append(line)
-        i += 1
-    
-    return '\n'.join(transcription_lines)
+# 波形請求的峰值數量上限 (約為 4K 螢幕寬度的兩倍)
+MAX_WAVEFORM_PEAKS = 8192
+
+@bp.route('/meeting/<meeting_id>/waveform')
+def get_meeting_waveform(meeting_id):
+    """
+    API: 獲取播放器用的波形峰值
+
+    - peaks: 需要的峰值數量 (通常為畫布的像素寬度)，預設 1000
+    - start / end: 只返回此時間區間 (秒) 的峰值，用於放大檢視
+
+    返回 application/octet-stream，內容為交錯的 int8 (min, max) 峰值，
+    解析度與位置透過 X-Waveform-* 標頭提供。舊的會議沒有峰值檔時，從 WAV 計算並保存。
+    """
+    meeting = get_meeting_by_id(meeting_id)
+    if not meeting:
+        return jsonify({'error': '會議記錄不存在', 'code': 'MEETING_NOT_FOUND'}), 404
+
+    args = request.args
+    try:
+        num_peaks = int(args.get('peaks', 1000))
+        start = float(args['start']) if 'start' in args else 0.0
+        end = float(args['end']) if 'end' in args else None
+    except ValueError:
+        return jsonify({'error': 'peaks 必須為整數，start、end 必須為秒數', 'code': 'INVALID_PARAMETER'}), 400
+    if not 1 <= num_peaks <= MAX_WAVEFORM_PEAKS:
+        return jsonify({'error': f'peaks 必須介於 1 到 {MAX_WAVEFORM_PEAKS} 之間', 'code': 'INVALID_PARAMETER'}), 400
+
+    processed_folder = current_app.config['PROCESSED_FOLDER']
+    waveform_path = processed_folder / f"{meeting_id}_waveform.bin"
+    wav_path = processed_folder / f"{meeting_id}.wav"
+    try:
+        if not waveform_path.exists():
+            if not wav_path.exists():
+                return jsonify({'error': '音訊檔案不存在', 'code': 'AUDIO_NOT_FOUND'}), 404
+            logger.info(f"會議 {meeting_id} 尚無波形峰值，從音訊檔計算並保存")
+            generate_waveform_peaks(wav_path, waveform_path)
+
+        stat = waveform_path.stat()
+        waveform = read_peaks_file(waveform_path)
+        samples_per_peak, first, peaks = select_peaks(waveform, num_peaks, start, end)
+    except Exception as e:
+        logger.error(f"讀取波形峰值時發生錯誤: {e}", exc_info=True)
+        return jsonify({'error': '讀取波形峰值失敗', 'code': 'FILE_READ_ERROR'}), 500
+
+    sample_rate = waveform['sample_rate']
+    response = Response(peaks.tobytes(), mimetype='application/octet-stream', headers={
+        'X-Waveform-Sample-Rate': str(sample_rate),
+        'X-Waveform-Samples-Per-Peak': str(samples_per_peak),
+        'X-Waveform-Start': f"{first * samples_per_peak / sample_rate:.3f}",
+        'X-Waveform-Duration': f"{waveform['total_samples'] / sample_rate:.3f}",
+        'Cache-Control': 'no-cache',
+    })
+    # 峰值檔重新產生時 ETag 隨之改變
+    response.set_etag(f"{stat.st_mtime_ns:x}-{stat.st_size:x}-{samples_per_peak}-{first}-{len(peaks)}")
+    return response.make_conditional(request)
+
+# ===============================================
+# 逐字稿搜尋 API
+# ===============================================
+
+@bp.route('/search')
+def search_meetings():
+    """
+    API: 全文搜尋所有會議的逐字稿
+
+    參數: q (關鍵字，以空白分隔的多個關鍵字須同時出現)、limit、offset、meeting_id (只搜尋單一會議)
+    """
+    query = request.args.get('q', '').strip()
+    match_query = build_match_query(query)
+    if not match_query:
+        return jsonify({'status': 'error', 'message': '請輸入搜尋關鍵字'}), 400
+
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    try:
+        rows = search_transcripts(match_query, limit=limit, offset=offset,
+                                  meeting_id=request.args.get('meeting_id'),
+                                  max_candidates=current_app.config['SEARCH_MAX_CANDIDATES'])
+    except Exception as e:
+        logger.error(f"搜尋逐字稿時發生錯誤 (查詢: {query}): {e}", exc_info=True)
+        return jsonify({'status': 'error', 'message': '搜尋失敗'}), 500
+
+    return jsonify({
+        'status': 'success',
+        'query': query,
+        'hits': [
+            {
+                'meeting_id': row['meeting_id'],
+                'original_filename': row['original_filename'],
+                'segment_index': row['seg_index'],
+                'start_time': row['start_time'],
+                'start_time_formatted': format_time(row['start_time']),
+                'end_time': row['end_time'],
+                'speaker': row['speaker'],
+                'snippet': make_snippet(row['content'], query),
+                'score': row['score']
+            }
+            for row in rows
+        ]
+    })
 
 # ===============================================
 # AI 摘要功能 API
@@ -372,6 +690,106 @@ def get_meeting_summary_api(meeting_id):
             'message': '此會議的摘要不存在或尚未生成'
         }), 404
 
+def _load_meeting_transcription(meeting):
+    """輔助函式：讀取會議的逐字稿文字，找不到或無法解析時拋出 FileNotFoundError"""
+    transcription_text = current_app.transcript_cache.get_transcription(
+        meeting['id'], lambda: read_transcript_records(meeting))
+    if transcription_text is None:
+        raise FileNotFoundError("找不到語者字幕檔案。")
+    if not transcription_text:
+        raise FileNotFoundError("無法從 SRT 檔案中提取逐字稿內容。")
+    return transcription_text
+
+def _generate_and_save_summary(meeting, transcription_text, use_cache, on_partial=None):
+    """
+    輔助函式：產生會議摘要並寫入資料庫，返回 get_meeting_summary 的結果
+
+    較長的逐字稿會分段摘要後再分層合併；沿用上次內容未變動的片段摘要，只修改名稱時不需呼叫模型。
+    on_partial 會收到最終摘要串流中目前已生成的摘要文字 (已套用發言者名稱)。
+    """
+    meeting_id = meeting['id']
+    # 獲取發言者名稱映射和輔助文件摘要
+    speaker_names = get_speaker_names(meeting_id)
+    supplementary_summary = meeting['supplementary_summary']
+    previous_state = get_summary_state(meeting_id) if use_cache else None
+    # 呼叫模型可能需要數十秒，期間先歸還資料庫連線 (之後寫入時會重新借用)
+    close_db()
+
+    stream_callback = None
+    if on_partial:
+        def stream_callback(partial_json):
+            text = extract_partial_summary(partial_json)
+            if text:
+                on_partial(apply_speaker_names(text, speaker_names))
+
+    parsed_summary, summary_state = summarize_meeting(
+        transcription_text,
+        speaker_names,
+        supplementary_summary,
+        model=current_app.llm.model,
+        use_cache=use_cache,
+        previous_state=previous_state,
+        on_partial=stream_callback
+    )
+    save_summary_state(meeting_id, summary_state)
+
+    # 處理 action_items
+    action_items_str = "\n".join(f"- {item}" for item in parsed_summary.get("action_items", []))
+    final_summary = parsed_summary.get('summary', '')
+    if action_items_str:
+        final_summary += "\n\n**行動項目:**\n" + action_items_str
+
+    save_meeting_summary(
+        meeting_id,
+        global_summary=final_summary,
+        chunk_summaries="\n".join(parsed_summary['chunk_summaries']) or None,
+        speaker_highlights=parsed_summary.get('speaker_highlights')
+    )
+    return get_meeting_summary(meeting_id)
+
+# 正在生成摘要的會議：同一會議同時只進行一次生成，之後的請求改為訂閱 app.summary_bus 上的事件
+_summary_generations = set()
+_summary_lock = threading.Lock()
+
+def _begin_summary_generation(meeting_id):
+    """輔助函式：會議沒有生成中的摘要時登記並發布 started 事件，返回是否由呼叫端負責生成"""
+    with _summary_lock:
+        if meeting_id in _summary_generations:
+            return False
+        _summary_generations.add(meeting_id)
+        current_app.summary_bus.publish(meeting_id, {'step': 'started'})
+        return True
+
+def _run_summary_generation(meeting, transcription_text, use_cache, stream=True):
+    """
+    輔助函式：生成摘要並將結束事件 (stream 時也包含 partial 事件) 發布到 app.summary_bus，返回結束事件。
+    必須先由 _begin_summary_generation 登記，需要在 app context 中呼叫。
+    """
+    summary_bus = current_app.summary_bus
+    meeting_id = meeting['id']
+    on_partial = None
+    if stream:
+        on_partial = lambda text: summary_bus.publish(meeting_id, {'step': 'partial', 'text': text})
+    try:
+        summary = _generate_and_save_summary(meeting, transcription_text, use_cache, on_partial=on_partial)
+        event = {'step': 'completed', 'summary': summary}
+    except Exception as e:
+        logger.error(f"生成摘要時發生錯誤 (會議 ID: {meeting_id}): {e}", exc_info=True)
+        event = {'step': 'failed', 'message': f'生成摘要失敗: {str(e)}'}
+    # 先發布結束事件再解除登記：之後才連線的請求取得的是這次的結果，不會與新的生成交錯
+    with _summary_lock:
+        summary_bus.publish(meeting_id, event)
+        _summary_generations.discard(meeting_id)
+    return event
+
+def _wait_for_summary_generation(meeting_id):
+    """輔助函式：等待會議生成中的摘要結束，返回結束事件"""
+    with current_app.summary_bus.subscribe(meeting_id) as subscription:
+        while True:
+            event = subscription.get()
+            if event['step'] in TERMINAL_STEPS:
+                return event
+
 @bp.route('/meeting/<meeting_id>/generate-summary', methods=['POST'])
 def generate_meeting_summary(meeting_id):
     """API: 為會議生成或重新生成 AI 摘要"""
@@ -384,61 +802,82 @@ def generate_meeting_summary(meeting_id):
 
     # 獲取逐字稿
     try:
-        with (current_app.config['BASE_DIR'] / meeting['speaker_srt_path']).open('r', encoding='utf-8') as f:
-            srt_content = f.read()
-        transcription_text = _parse_srt_to_transcription(srt_content)
-        if not transcription_text:
-            raise FileNotFoundError("無法從 SRT 檔案中提取逐字稿內容。")
+        transcription_text = _load_meeting_transcription(meeting)
     except (FileNotFoundError, TypeError) as e:
         logger.error(f"無法讀取或解析會議 {meeting_id} 的逐字稿: {e}")
         return jsonify({'status': 'error', 'message': '找不到或無法解析逐字稿內容'}), 404
 
-    try:
-        # 獲取發言者名稱映射和輔助文件摘要
-        speaker_names = get_speaker_names(meeting_id)
-        supplementary_summary = meeting.get('supplementary_summary')
-
-        # 準備發送給 OpenAI 的提示
-        prompt = create_summary_prompt(
-            transcription_text,
-            speaker_names,
-            supplementary_summary
-        )
-        
-        # 呼叫 OpenAI API
-        client = current_app.audio_processor.openai_client
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "你是一個專業的會議記錄員，擅長從逐字稿中提取摘要、行動項目和關鍵重點。"},
-                {"role": "user", "content": prompt}
-            ],
-            response_format={"type": "json_object"},
-            temperature=0.5
-        )
-        
-        summary_json = response.choices[0].message.content
-        parsed_summary = parse_summary_from_json(summary_json)
-        
-        # 處理 action_items
-        action_items_str = "\n".join(f"- {item}" for item in parsed_summary.get("action_items", []))
-        final_summary = parsed_summary.get('summary', '')
-        if action_items_str:
-            final_summary += "\n\n**行動項目:**\n" + action_items_str
-
-        save_meeting_summary(
-            meeting_id,
-            global_summary=final_summary,
-            chunk_summaries=None,
-            speaker_highlights=parsed_summary.get('speaker_highlights')
-        )
-        
-        new_summary = get_meeting_summary(meeting_id)
-        return jsonify({'status': 'success', 'summary': new_summary})
-
-    except Exception as e:
-        logger.error(f"生成摘要時發生錯誤 (會議 ID: {meeting_id}): {e}", exc_info=True)
-        return jsonify({'status': 'error', 'message': f'生成摘要失敗: {str(e)}'}), 500
+    if _begin_summary_generation(meeting_id):
+        event = _run_summary_generation(meeting, transcription_text, use_cache=not _bypass_llm_cache(), stream=False)
+    else:
+        # 已有生成中的摘要 (例如另一個分頁的串流)，等待其結果而不重複生成
+        close_db()
+        event = _wait_for_summary_generation(meeting_id)
+
+    if event['step'] == 'failed':
+        return jsonify({'status': 'error', 'message': event['message']}), 500
+    return jsonify({'status': 'success', 'summary': event['summary']})
+
+@bp.route('/meeting/<meeting_id>/generate-summary/stream')
+def stream_meeting_summary(meeting_id):
+    """
+    API: 以 SSE 串流生成 AI 摘要
+
+    事件依序為 started、多個 partial (目前已生成的摘要文字)，最後為 completed (完整摘要) 或 failed。
+    摘要在背景執行緒中產生，用戶端中途斷線時仍會完成並寫入資料庫。
+    同一會議已有生成中的摘要時 (重新整理頁面、多個分頁) 不會重複生成，而是接上既有的事件串流，
+    先收到最新的事件 (partial 為累積的完整文字) 再接續之後的事件。
+    """
+    meeting = get_meeting_by_id(meeting_id)
+    app = current_app._get_current_object()
+    summary_bus = current_app.summary_bus
+    heartbeat_interval = current_app.config['SSE_HEARTBEAT_INTERVAL']
+    use_cache = not _bypass_llm_cache()
+
+    def format_event(event):
+        return f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+    def run(transcription_text):
+        with app.app_context():
+            _run_summary_generation(meeting, transcription_text, use_cache)
+
+    def generate_events():
+        if meeting is None:
+            yield format_event({'step': 'failed', 'message': '找不到會議記錄'})
+            return
+        if meeting['status'] != 'completed':
+            yield format_event({'step': 'failed', 'message': '會議尚未處理完成'})
+            return
+        try:
+            transcription_text = _load_meeting_transcription(meeting)
+        except (FileNotFoundError, TypeError) as e:
+            logger.error(f"無法讀取或解析會議 {meeting_id} 的逐字稿: {e}")
+            yield format_event({'step': 'failed', 'message': '找不到或無法解析逐字稿內容'})
+            return
+        # stream_with_context 會讓請求的 app context 保留到串流結束，先歸還資料庫連線
+        close_db()
+
+        starting = _begin_summary_generation(meeting_id)
+        # 訂閱時會先收到最新的事件：剛登記的 started，或既有生成目前的進度
+        with summary_bus.subscribe(meeting_id) as subscription:
+            if starting:
+                threading.Thread(target=run, args=(transcription_text,), daemon=True,
+                                 name=f"summary-{meeting_id[:8]}").start()
+            while True:
+                try:
+                    event = subscription.get(timeout=heartbeat_interval)
+                except queue.Empty:
+                    # SSE 註解行，維持連線不被代理中斷
+                    yield ": keep-alive\n\n"
+                    continue
+                yield format_event(event)
+                if event['step'] in TERMINAL_STEPS:
+                    break
+
+    response = Response(stream_with_context(generate_events()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 # ===============================================
 # 發言者管理 API
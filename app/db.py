@@ -1,5 +1,7 @@
 import logging
+import queue
 import sqlite3
+import threading
 from datetime import datetime
 
 from flask import current_app, g
@@ -40,30 +42,186 @@ def custom_convert_timestamp(val):
 
 sqlite3.register_converter("timestamp", custom_convert_timestamp)
 
-def get_db():
+# 連線池的預設設定 (未使用 Config 的 Flask app，例如效能測試腳本)
+_POOL_DEFAULTS = {
+    'DB_POOL_SIZE': 8,
+    'DB_POOL_TIMEOUT': 1,
+    'DB_BUSY_TIMEOUT_MS': 5000,
+    'DB_CACHE_SIZE_KB': 16 * 1024,
+}
+
+def _apply_pragmas(conn, busy_timeout_ms, cache_size_kb):
     """
-    為當前的 application context 打開一個新的資料庫連線(如果還沒有的話)。
+    設定連線的 SQLite 參數。
+
+    WAL 模式下讀取不會被寫入阻擋 (寫入也不會被讀取阻擋)，搭配 synchronous=NORMAL 每次提交只需寫入 WAL 檔；
+    busy_timeout 讓同時寫入的連線等待鎖釋放，而不是立即拋出 "database is locked"。
     """
-    if 'db' not in g:
-        g.db = sqlite3.connect(
-            current_app.config['DB_PATH'],
-            detect_types=sqlite3.PARSE_DECLTYPES
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA busy_timeout={int(busy_timeout_ms)}')
+    conn.execute(f'PRAGMA cache_size={-int(cache_size_kb)}')
+    conn.execute('PRAGMA temp_store=MEMORY')
+
+class ConnectionPool:
+    """
+    執行緒安全的 SQLite 連線池。
+
+    每個 app context (HTTP 請求或背景工作) 透過 get_db() 借用一個連線，結束時歸還而不關閉，
+    避免每次請求都重新開啟資料庫與設定參數。連線數達到上限時先等待其他執行緒歸還，
+    等待逾時則開啟一個額外的連線 (歸還時直接關閉)，長時間借用連線的呼叫端不會讓其他請求失敗。
+    """
+
+    def __init__(self, db_path, max_size=8, timeout=1, busy_timeout_ms=5000, cache_size_kb=16 * 1024):
+        self.db_path = db_path
+        self.max_size = max(1, max_size)
+        self.timeout = timeout
+        self.busy_timeout_ms = busy_timeout_ms
+        self.cache_size_kb = cache_size_kb
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._waits = 0
+        # 超過上限時額外開啟的連線 (以 id 記錄，歸還時關閉)
+        self._overflow = set()
+        self._overflow_opened = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.db_path,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            timeout=self.busy_timeout_ms / 1000,
+            check_same_thread=False  # 連線會在不同執行緒間借用，同一時間只由一個執行緒使用
         )
         # 讓查詢結果可以像字典一樣透過欄位名稱存取
-        g.db.row_factory = sqlite3.Row
+        conn.row_factory = sqlite3.Row
+        _apply_pragmas(conn, self.busy_timeout_ms, self.cache_size_kb)
+        return conn
+
+    def acquire(self):
+        """借用一個連線：優先使用閒置連線，未達上限時建立新連線，否則等待歸還，逾時則開啟額外的連線。"""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            can_create = self._created < self.max_size
+            if can_create:
+                self._created += 1
+            else:
+                self._waits += 1
+        if can_create:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            pass
+        conn = self._connect()
+        with self._lock:
+            self._overflow.add(id(conn))
+            self._overflow_opened += 1
+            in_overflow = len(self._overflow)
+        logger.warning(f"資料庫連線池已滿 ({self.max_size})，開啟額外連線 (目前 {in_overflow} 個)")
+        return conn
+
+    def release(self, conn):
+        """歸還連線；未提交的交易會被回滾，無法回滾的連線直接關閉並釋出名額。額外的連線直接關閉。"""
+        with self._lock:
+            is_overflow = id(conn) in self._overflow
+            self._overflow.discard(id(conn))
+        if is_overflow:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+            return
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error as e:
+            logger.warning(f"資料庫連線無法回滾，已關閉: {e}")
+            self._discard(conn)
+            return
+        self._idle.put(conn)
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._created -= 1
+
+    def close_all(self):
+        """關閉所有閒置連線 (借出中的連線會在歸還後繼續使用)。"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+    def stats(self):
+        with self._lock:
+            created, waits = self._created, self._waits
+            overflow, overflow_opened = len(self._overflow), self._overflow_opened
+        idle = self._idle.qsize()
+        return {'max_size': self.max_size, 'open': created, 'idle': idle, 'in_use': created - idle, 'waits': waits,
+                'overflow_in_use': overflow, 'overflow_opened': overflow_opened}
+
+_pool_lock = threading.Lock()
+
+def get_pool(app=None):
+    """取得 app 的資料庫連線池，第一次使用時依設定建立。"""
+    app = app or current_app._get_current_object()
+    pool = app.extensions.get('db_pool')
+    if pool is None:
+        with _pool_lock:
+            pool = app.extensions.get('db_pool')
+            if pool is None:
+                settings = {key: app.config.get(key, default) for key, default in _POOL_DEFAULTS.items()}
+                pool = ConnectionPool(
+                    app.config['DB_PATH'],
+                    max_size=settings['DB_POOL_SIZE'],
+                    timeout=settings['DB_POOL_TIMEOUT'],
+                    busy_timeout_ms=settings['DB_BUSY_TIMEOUT_MS'],
+                    cache_size_kb=settings['DB_CACHE_SIZE_KB']
+                )
+                app.extensions['db_pool'] = pool
+    return pool
+
+def get_db():
+    """
+    為當前的 application context 從連線池借用一個資料庫連線(如果還沒有的話)。
+    """
+    if 'db' not in g:
+        g.db = get_pool().acquire()
     return g.db
 
 def close_db(e=None):
-    """關閉請求結束時的資料庫連線。"""
+    """將請求或背景工作結束時的資料庫連線歸還連線池。"""
     db = g.pop('db', None)
     if db is not None:
-        db.close()
+        get_pool().release(db)
+
+def _add_column_if_missing(cursor, table, column, definition):
+    """為既有的資料表補上新欄位 (CREATE TABLE IF NOT EXISTS 不會修改舊表)。"""
+    columns = {row[1] for row in cursor.execute(f'PRAGMA table_info({table})')}
+    if column not in columns:
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
 
 def init_db():
     """初始化資料庫綱要 (schema)。"""
     try:
         # 這裡不使用 get_db() 因為我們希望在應用程式啟動時獨立執行
         db = sqlite3.connect(current_app.config['DB_PATH'])
+        # WAL 模式會保存在資料庫檔案中，之後所有連線都沿用
+        db.execute('PRAGMA journal_mode=WAL')
         cursor = db.cursor()
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS meetings (
@@ -84,9 +242,19 @@ def init_db():
                 speaker_highlights TEXT,
                 summary_generated_at TIMESTAMP,
                 supplementary_file_path TEXT,
-                supplementary_summary TEXT
+                supplementary_summary TEXT,
+                content_hash TEXT
             )
         ''')
+        _add_column_if_missing(cursor, 'meetings', 'content_hash', 'TEXT')
+        # 最近一次摘要 reduce 階段的輸入雜湊與模型原始輸出 (發言者仍為代號)，供增量重新產生摘要
+        _add_column_if_missing(cursor, 'meetings', 'summary_input_hash', 'TEXT')
+        _add_column_if_missing(cursor, 'meetings', 'summary_output', 'TEXT')
+        # 逐字稿、發言者名稱或摘要變更時遞增，作為 HTTP 快取驗證器 (ETag / Last-Modified) 的一部分
+        _add_column_if_missing(cursor, 'meetings', 'content_version', 'INTEGER NOT NULL DEFAULT 0')
+        _add_column_if_missing(cursor, 'meetings', 'content_updated_at', 'TIMESTAMP')
+        # 會議列表依建立時間分頁 (keyset pagination)
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_meetings_created_at ON meetings (created_at, id)')
         
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS speaker_names (
@@ -99,17 +267,124 @@ def init_db():
             )
         ''')
         
+        # 背景處理工作佇列
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                meeting_id TEXT NOT NULL,
+                file_path TEXT NOT NULL,
+                num_speakers INTEGER,
+                supplementary_file_path TEXT,
+                status TEXT NOT NULL DEFAULT 'queued',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                started_at TIMESTAMP,
+                finished_at TIMESTAMP,
+                FOREIGN KEY (meeting_id) REFERENCES meetings (id) ON DELETE CASCADE
+            )
+        ''')
+        # 執行中工作的擁有者 (每個行程唯一的識別碼) 與心跳時間，用來判斷工作是否因行程結束而中斷
+        _add_column_if_missing(cursor, 'jobs', 'owner_id', 'TEXT')
+        _add_column_if_missing(cursor, 'jobs', 'heartbeat_at', 'TIMESTAMP')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_jobs_meeting ON jobs (meeting_id)')
+
+        # 處理階段檢查點 (用於失敗後的重試與續跑)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS meeting_stages (
+                meeting_id TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                artifacts TEXT NOT NULL,
+                params TEXT,
+                result TEXT,
+                completed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (meeting_id, stage),
+                FOREIGN KEY (meeting_id) REFERENCES meetings (id) ON DELETE CASCADE
+            )
+        ''')
+
+        # 以上傳內容雜湊為鍵的處理結果快取
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS artifact_cache (
+                cache_key TEXT PRIMARY KEY,
+                content_hash TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                params TEXT,
+                path TEXT NOT NULL,
+                size_bytes INTEGER NOT NULL,
+                result TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                last_used_at TIMESTAMP
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_artifact_cache_lru ON artifact_cache (last_used_at)')
+
+        # 解析後的逐字稿片段 (處理完成時寫入，避免每次請求都重新解析 SRT)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS transcript_segments (
+                meeting_id TEXT NOT NULL,
+                seg_index INTEGER NOT NULL,
+                start_time REAL NOT NULL,
+                end_time REAL NOT NULL,
+                speaker TEXT NOT NULL,
+                content TEXT NOT NULL,
+                original_content TEXT NOT NULL,
+                PRIMARY KEY (meeting_id, seg_index),
+                FOREIGN KEY (meeting_id) REFERENCES meetings (id) ON DELETE CASCADE
+            )
+        ''')
+
+        # 各逐字稿片段的摘要，以片段內容的雜湊為鍵；重新產生摘要時只需重新摘要內容有變動的片段
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS summary_chunks (
+                meeting_id TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                chunk_index INTEGER NOT NULL,
+                summary TEXT NOT NULL,
+                PRIMARY KEY (meeting_id, content_hash),
+                FOREIGN KEY (meeting_id) REFERENCES meetings (id) ON DELETE CASCADE
+            )
+        ''')
+
+        # LLM 回應快取 (以模型、參數與提示的雜湊為鍵)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                cache_key TEXT PRIMARY KEY,
+                model TEXT,
+                response TEXT NOT NULL,
+                size_bytes INTEGER NOT NULL,
+                hit_count INTEGER NOT NULL DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                last_used_at TIMESTAMP
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_llm_cache_lru ON llm_cache (last_used_at)')
+
+        # 逐字稿全文索引，rowid 與 transcript_segments 相同；內容與發言者名稱都以雙字詞切分後寫入
+        search_index_exists = cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'transcript_search'"
+        ).fetchone() is not None
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS transcript_search USING fts5 (
+                content,
+                speaker,
+                meeting_id UNINDEXED
+            )
+        ''')
+        if not search_index_exists:
+            _backfill_search_index(db)
+
         db.commit()
         db.close()
         logger.info("資料庫已初始化。")
     except Exception as e:
         logger.error(f"無法初始化資料庫: {e}")
 
-def add_meeting(meeting_id, filename, original_filename, supplementary_file_path=None):
+def add_meeting(meeting_id, filename, original_filename, supplementary_file_path=None, content_hash=None):
     """新增一筆新的會議記錄到資料庫。"""
-    sql = 'INSERT INTO meetings (id, filename, original_filename, status, supplementary_file_path) VALUES (?, ?, ?, ?, ?)'
+    sql = 'INSERT INTO meetings (id, filename, original_filename, status, supplementary_file_path, content_hash) VALUES (?, ?, ?, ?, ?, ?)'
     conn = get_db()
-    conn.execute(sql, (meeting_id, filename, original_filename, 'uploaded', supplementary_file_path))
+    conn.execute(sql, (meeting_id, filename, original_filename, 'uploaded', supplementary_file_path, content_hash))
     conn.commit()
 
 def get_meeting_by_id(meeting_id):
@@ -124,6 +399,78 @@ def get_all_meetings():
     cursor = get_db().execute(sql)
     return cursor.fetchall()
 
+# 會議列表只需要的欄位 (不含摘要等大型文字欄位)
+MEETING_LISTING_COLUMNS = (
+    'id', 'original_filename', 'status', 'created_at', 'processed_at',
+    'duration', 'num_speakers', 'srt_path', 'rttm_path', 'speaker_srt_path'
+)
+
+def get_meetings_page(limit=20, before=None, after=None):
+    """
+    以 keyset pagination 獲取一頁會議列表，依建立時間降序排列，只選取列表需要的欄位。
+
+    Args:
+        limit (int): 每頁筆數。
+        before (tuple): (created_at, id) 游標，取得比此筆更舊的會議 (下一頁)。
+        after (tuple): (created_at, id) 游標，取得比此筆更新的會議 (上一頁)。
+
+    Returns:
+        tuple[list, bool]: (會議列表, 該方向是否還有更多資料)。
+        每筆會議額外包含 cursor_created_at 欄位，用於產生游標。
+    """
+    columns = ', '.join(MEETING_LISTING_COLUMNS)
+    # 以 CAST 取得原始字串，避免轉成 datetime 後無法原樣作為游標比較
+    sql = f'SELECT {columns}, CAST(created_at AS TEXT) AS cursor_created_at FROM meetings'
+    params = []
+
+    if after is not None:
+        sql += ' WHERE created_at > ? OR (created_at = ? AND id > ?) ORDER BY created_at ASC, id ASC'
+        params.extend([after[0], after[0], after[1]])
+    else:
+        if before is not None:
+            sql += ' WHERE created_at < ? OR (created_at = ? AND id < ?)'
+            params.extend([before[0], before[0], before[1]])
+        sql += ' ORDER BY created_at DESC, id DESC'
+
+    # 多取一筆以判斷是否還有更多資料
+    sql += ' LIMIT ?'
+    params.append(limit + 1)
+
+    rows = get_db().execute(sql, params).fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if after is not None:
+        rows.reverse()
+    return rows, has_more
+
+def encode_meeting_cursor(meeting):
+    """將會議列表中的一筆資料編碼為分頁游標字串。"""
+    import base64
+    import json
+
+    payload = json.dumps([meeting['cursor_created_at'], meeting['id']])
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+def decode_meeting_cursor(cursor):
+    """將分頁游標字串解碼為 (created_at, id)，格式錯誤時拋出 ValueError。"""
+    import base64
+    import binascii
+    import json
+
+    try:
+        created_at, meeting_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (binascii.Error, UnicodeError, json.JSONDecodeError, TypeError, ValueError):
+        raise ValueError(f"無效的分頁游標: {cursor}")
+    return created_at, meeting_id
+
+def count_meetings_by_status():
+    """獲取各狀態的會議數量，返回 {'total': n, 'completed': n, ...}。"""
+    sql = 'SELECT status, COUNT(*) AS count FROM meetings GROUP BY status'
+    rows = get_db().execute(sql).fetchall()
+    counts = {row['status']: row['count'] for row in rows}
+    counts['total'] = sum(counts.values())
+    return counts
+
 def update_meeting_status(meeting_id, status, **kwargs):
     """更新會議的狀態和其他詳細資訊。"""
     conn = get_db()
@@ -142,12 +489,29 @@ def update_meeting_status(meeting_id, status, **kwargs):
     conn.execute(sql, params)
     conn.commit()
 
+def _invalidate_transcript_cache(meeting_id):
+    """清除行程內快取的逐字稿 (在變更提交後呼叫，快取未啟用的應用程式不受影響)。"""
+    cache = current_app.extensions.get('transcript_cache')
+    if cache is not None:
+        cache.invalidate(meeting_id)
+
+def _bump_content_version(conn, meeting_id):
+    """遞增會議的內容版本 (與呼叫端的變更在同一個交易中提交)，讓用戶端快取的逐字稿與下載檔案失效。"""
+    conn.execute('''UPDATE meetings SET content_version = content_version + 1, content_updated_at = CURRENT_TIMESTAMP
+                    WHERE id = ?''', (meeting_id,))
+
 def delete_meeting_by_id(meeting_id):
     """透過 ID 從資料庫刪除一筆會議記錄。"""
     sql = 'DELETE FROM meetings WHERE id = ?'
     conn = get_db()
+    conn.execute('DELETE FROM jobs WHERE meeting_id = ?', (meeting_id,))
+    conn.execute('DELETE FROM meeting_stages WHERE meeting_id = ?', (meeting_id,))
+    _delete_search_rows(conn, meeting_id)
+    conn.execute('DELETE FROM transcript_segments WHERE meeting_id = ?', (meeting_id,))
+    conn.execute('DELETE FROM summary_chunks WHERE meeting_id = ?', (meeting_id,))
     cursor = conn.execute(sql, (meeting_id,))
     conn.commit()
+    _invalidate_transcript_cache(meeting_id)
     return cursor.rowcount > 0  # 返回是否成功刪除
 
 def save_meeting_summary(meeting_id, global_summary, chunk_summaries, speaker_highlights):
@@ -173,6 +537,38 @@ def save_meeting_summary(meeting_id, global_summary, chunk_summaries, speaker_hi
         datetime.now(),
         meeting_id
     ))
+    _bump_content_version(conn, meeting_id)
+    conn.commit()
+
+def get_summary_state(meeting_id):
+    """
+    獲取會議上次產生摘要時保存的中間結果。
+
+    Returns:
+        dict: {'chunks': {片段雜湊: 片段摘要}, 'input_hash': reduce 輸入雜湊, 'output': 模型原始輸出}
+    """
+    conn = get_db()
+    rows = conn.execute('SELECT content_hash, summary FROM summary_chunks WHERE meeting_id = ?',
+                        (meeting_id,)).fetchall()
+    meeting = conn.execute('SELECT summary_input_hash, summary_output FROM meetings WHERE id = ?',
+                           (meeting_id,)).fetchone()
+    return {
+        'chunks': {row['content_hash']: row['summary'] for row in rows},
+        'input_hash': meeting['summary_input_hash'] if meeting else None,
+        'output': meeting['summary_output'] if meeting else None
+    }
+
+def save_summary_state(meeting_id, state):
+    """以本次產生摘要的中間結果取代舊的結果 (只保留目前逐字稿仍存在的片段)。"""
+    conn = get_db()
+    conn.execute('DELETE FROM summary_chunks WHERE meeting_id = ?', (meeting_id,))
+    conn.executemany(
+        'INSERT OR REPLACE INTO summary_chunks (meeting_id, content_hash, chunk_index, summary) VALUES (?, ?, ?, ?)',
+        [(meeting_id, content_hash, index, summary)
+         for index, (content_hash, summary) in enumerate(state['chunks'].items())]
+    )
+    conn.execute('UPDATE meetings SET summary_input_hash = ?, summary_output = ? WHERE id = ?',
+                 (state['input_hash'], state['output'], meeting_id))
     conn.commit()
 
 def get_meeting_summary(meeting_id):
@@ -211,7 +607,7 @@ def init_app(app):
     """
     向 Flask app 註冊資料庫函式。這會由應用程式工廠呼叫。
     """
-    # 註冊 teardown 函式，在每個請求結束後自動關閉資料庫連線
+    # 註冊 teardown 函式，在每個請求或背景工作結束後將資料庫連線歸還連線池
     app.teardown_appcontext(close_db)
 
 def get_speaker_names(meeting_id):
@@ -227,14 +623,20 @@ def update_speaker_name(meeting_id, original_speaker_id, custom_name):
     sql = '''INSERT OR REPLACE INTO speaker_names (meeting_id, original_speaker_id, custom_name)
              VALUES (?, ?, ?)'''
     conn.execute(sql, (meeting_id, original_speaker_id, custom_name))
+    _update_search_speaker(conn, meeting_id, original_speaker_id, custom_name)
+    _bump_content_version(conn, meeting_id)
     conn.commit()
+    _invalidate_transcript_cache(meeting_id)
 
 def delete_speaker_name(meeting_id, original_speaker_id):
     """刪除發言者名稱映射，恢復原始名稱"""
     conn = get_db()
     sql = 'DELETE FROM speaker_names WHERE meeting_id = ? AND original_speaker_id = ?'
     conn.execute(sql, (meeting_id, original_speaker_id))
+    _update_search_speaker(conn, meeting_id, original_speaker_id, original_speaker_id)
+    _bump_content_version(conn, meeting_id)
     conn.commit()
+    _invalidate_transcript_cache(meeting_id)
 
 def update_supplementary_summary(meeting_id, summary):
     """更新會議的輔助文件摘要。"""
@@ -242,3 +644,384 @@ def update_supplementary_summary(meeting_id, summary):
     conn = get_db()
     conn.execute(sql, (summary, meeting_id))
     conn.commit()
+
+# ===============================================
+# 背景工作佇列
+# ===============================================
+
+def enqueue_job(meeting_id, file_path, num_speakers=None, supplementary_file_path=None):
+    """新增一筆待處理的工作，返回工作 ID。"""
+    sql = '''INSERT INTO jobs (meeting_id, file_path, num_speakers, supplementary_file_path, status)
+             VALUES (?, ?, ?, ?, 'queued')'''
+    conn = get_db()
+    cursor = conn.execute(sql, (meeting_id, file_path, num_speakers, supplementary_file_path))
+    conn.commit()
+    return cursor.lastrowid
+
+def claim_next_job(owner_id):
+    """
+    取出最早排入且尚未被處理的工作，將其標記為 running 並記錄擁有者行程與心跳時間。
+    使用條件式 UPDATE 確保多個 worker (甚至多個行程) 不會取得同一筆工作。
+    """
+    conn = get_db()
+    while True:
+        job = conn.execute(
+            "SELECT * FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1"
+        ).fetchone()
+        if job is None:
+            return None
+
+        now = datetime.now()
+        cursor = conn.execute(
+            '''UPDATE jobs SET status = 'running', started_at = ?, attempts = attempts + 1,
+                              owner_id = ?, heartbeat_at = ?
+               WHERE id = ? AND status = 'queued'
+            ''',
+            (now, owner_id, now, job['id'])
+        )
+        conn.commit()
+        if cursor.rowcount == 1:
+            return job
+        # 已被其他 worker 搶先取得，再試下一筆
+
+def finish_job(job_id, status):
+    """將工作標記為結束 (done 或 failed)。"""
+    sql = 'UPDATE jobs SET status = ?, finished_at = ? WHERE id = ?'
+    conn = get_db()
+    conn.execute(sql, (status, datetime.now(), job_id))
+    conn.commit()
+
+def heartbeat_jobs(owner_id):
+    """更新此擁有者所有執行中工作的心跳時間，返回更新的工作數量。"""
+    conn = get_db()
+    cursor = conn.execute(
+        "UPDATE jobs SET heartbeat_at = ? WHERE status = 'running' AND owner_id = ?",
+        (datetime.now(), owner_id)
+    )
+    conn.commit()
+    return cursor.rowcount
+
+def requeue_interrupted_jobs(stale_before):
+    """
+    將擁有者已失效 (心跳早於 stale_before) 的執行中工作重新排入佇列，並把對應會議的狀態重設為 uploaded。
+    其他行程仍在處理 (心跳持續更新) 的工作不受影響。返回被重新排入的工作數量。
+    """
+    stale = "status = 'running' AND (owner_id IS NULL OR heartbeat_at IS NULL OR heartbeat_at < ?)"
+    conn = get_db()
+    conn.execute(
+        f'''UPDATE meetings SET status = 'uploaded'
+            WHERE id IN (SELECT meeting_id FROM jobs WHERE {stale})''',
+        (stale_before,)
+    )
+    cursor = conn.execute(
+        f"UPDATE jobs SET status = 'queued', started_at = NULL, owner_id = NULL, heartbeat_at = NULL WHERE {stale}",
+        (stale_before,)
+    )
+    conn.commit()
+    return cursor.rowcount
+
+def get_queue_depth():
+    """獲取佇列中等待與執行中的工作數量。"""
+    sql = '''SELECT
+                 SUM(CASE WHEN status = 'queued' THEN 1 ELSE 0 END) AS queued,
+                 SUM(CASE WHEN status = 'running' THEN 1 ELSE 0 END) AS running
+             FROM jobs WHERE status IN ('queued', 'running')'''
+    row = get_db().execute(sql).fetchone()
+    return {'queued': row['queued'] or 0, 'running': row['running'] or 0}
+
+def get_queue_position(meeting_id):
+    """
+    獲取會議在佇列中的位置 (從 1 開始)。
+    執行中返回 0，不在佇列中則返回 None。
+    """
+    conn = get_db()
+    job = conn.execute(
+        '''SELECT id, status FROM jobs
+           WHERE meeting_id = ? AND status IN ('queued', 'running')
+           ORDER BY id DESC LIMIT 1''',
+        (meeting_id,)
+    ).fetchone()
+    if job is None:
+        return None
+    if job['status'] == 'running':
+        return 0
+    row = conn.execute(
+        "SELECT COUNT(*) AS ahead FROM jobs WHERE status = 'queued' AND id < ?",
+        (job['id'],)
+    ).fetchone()
+    return row['ahead'] + 1
+
+def get_latest_job(meeting_id):
+    """獲取會議最近一次的處理工作。"""
+    sql = 'SELECT * FROM jobs WHERE meeting_id = ? ORDER BY id DESC LIMIT 1'
+    return get_db().execute(sql, (meeting_id,)).fetchone()
+
+# ===============================================
+# 處理階段檢查點
+# ===============================================
+
+def save_stage_checkpoint(meeting_id, stage, artifacts, params=None, result=None):
+    """記錄會議某個處理階段已完成，以及其產出檔案的資訊。"""
+    import json
+
+    sql = '''INSERT OR REPLACE INTO meeting_stages (meeting_id, stage, artifacts, params, result, completed_at)
+             VALUES (?, ?, ?, ?, ?, ?)'''
+    conn = get_db()
+    conn.execute(sql, (
+        meeting_id,
+        stage,
+        json.dumps(artifacts, ensure_ascii=False),
+        json.dumps(params, sort_keys=True) if params is not None else None,
+        json.dumps(result),
+        datetime.now()
+    ))
+    conn.commit()
+
+def get_stage_checkpoints(meeting_id):
+    """獲取會議所有已完成的處理階段，返回 {階段名稱: {'artifacts', 'params', 'result', 'completed_at'}}。"""
+    import json
+
+    sql = 'SELECT stage, artifacts, params, result, completed_at FROM meeting_stages WHERE meeting_id = ?'
+    rows = get_db().execute(sql, (meeting_id,)).fetchall()
+    checkpoints = {}
+    for row in rows:
+        try:
+            checkpoints[row['stage']] = {
+                'artifacts': json.loads(row['artifacts']),
+                'params': json.loads(row['params']) if row['params'] else None,
+                'result': json.loads(row['result']) if row['result'] else None,
+                'completed_at': row['completed_at']
+            }
+        except json.JSONDecodeError:
+            logger.warning(f"無法解析會議 {meeting_id} 的階段檢查點: {row['stage']}")
+    return checkpoints
+
+# ===============================================
+# 處理結果快取
+# ===============================================
+
+def get_cache_entry(cache_key):
+    """透過快取鍵獲取一筆快取記錄，並更新其最近使用時間。"""
+    conn = get_db()
+    entry = conn.execute('SELECT * FROM artifact_cache WHERE cache_key = ?', (cache_key,)).fetchone()
+    if entry is not None:
+        conn.execute('UPDATE artifact_cache SET last_used_at = ? WHERE cache_key = ?', (datetime.now(), cache_key))
+        conn.commit()
+    return entry
+
+def add_cache_entry(cache_key, content_hash, stage, params, path, size_bytes, result):
+    """新增或覆寫一筆快取記錄。"""
+    import json
+
+    sql = '''INSERT OR REPLACE INTO artifact_cache
+             (cache_key, content_hash, stage, params, path, size_bytes, result, created_at, last_used_at)
+             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)'''
+    now = datetime.now()
+    conn = get_db()
+    conn.execute(sql, (
+        cache_key, content_hash, stage,
+        json.dumps(params, sort_keys=True) if params is not None else None,
+        path, size_bytes, json.dumps(result), now, now
+    ))
+    conn.commit()
+
+def delete_cache_entry(cache_key):
+    """刪除一筆快取記錄。"""
+    conn = get_db()
+    conn.execute('DELETE FROM artifact_cache WHERE cache_key = ?', (cache_key,))
+    conn.commit()
+
+def get_cache_total_size():
+    """獲取快取檔案的總大小 (bytes)。"""
+    row = get_db().execute('SELECT COALESCE(SUM(size_bytes), 0) AS total FROM artifact_cache').fetchone()
+    return row['total']
+
+def get_lru_cache_entries(limit=50):
+    """依最近使用時間由舊到新獲取快取記錄，用於淘汰。"""
+    sql = 'SELECT cache_key, path, size_bytes FROM artifact_cache ORDER BY last_used_at ASC LIMIT ?'
+    return get_db().execute(sql, (limit,)).fetchall()
+
+
+# ===============================================
+# LLM 回應快取
+# ===============================================
+
+def get_llm_cache_entry(cache_key, created_after=None):
+    """獲取一筆未過期的 LLM 回應快取，命中時更新最近使用時間與命中次數。"""
+    conn = get_db()
+    sql = 'SELECT * FROM llm_cache WHERE cache_key = ?'
+    params = [cache_key]
+    if created_after is not None:
+        sql += ' AND created_at >= ?'
+        params.append(created_after)
+    entry = conn.execute(sql, params).fetchone()
+    if entry is not None:
+        conn.execute('UPDATE llm_cache SET last_used_at = ?, hit_count = hit_count + 1 WHERE cache_key = ?',
+                     (datetime.now(), cache_key))
+        conn.commit()
+    return entry
+
+def add_llm_cache_entry(cache_key, model, response):
+    """新增或覆寫一筆 LLM 回應快取。"""
+    sql = '''INSERT OR REPLACE INTO llm_cache (cache_key, model, response, size_bytes, hit_count, created_at, last_used_at)
+             VALUES (?, ?, ?, ?, 0, ?, ?)'''
+    now = datetime.now()
+    conn = get_db()
+    conn.execute(sql, (cache_key, model, response, len(response.encode('utf-8')), now, now))
+    conn.commit()
+
+def delete_expired_llm_cache_entries(created_before):
+    """刪除建立時間早於指定時間的 LLM 回應快取，返回刪除筆數。"""
+    conn = get_db()
+    cursor = conn.execute('DELETE FROM llm_cache WHERE created_at < ?', (created_before,))
+    conn.commit()
+    return cursor.rowcount
+
+def evict_llm_cache_entries(max_bytes):
+    """總大小超過上限時，依最近使用時間由舊到新刪除 LLM 回應快取，返回刪除筆數。"""
+    conn = get_db()
+    total = conn.execute('SELECT COALESCE(SUM(size_bytes), 0) FROM llm_cache').fetchone()[0]
+    if total <= max_bytes:
+        return 0
+
+    evicted = []
+    for entry in conn.execute('SELECT cache_key, size_bytes FROM llm_cache ORDER BY last_used_at ASC'):
+        if total <= max_bytes:
+            break
+        evicted.append((entry['cache_key'],))
+        total -= entry['size_bytes']
+    conn.executemany('DELETE FROM llm_cache WHERE cache_key = ?', evicted)
+    conn.commit()
+    return len(evicted)
+
+def get_llm_cache_usage():
+    """獲取 LLM 回應快取的筆數、總大小與累計命中次數。"""
+    sql = '''SELECT COUNT(*) AS entries, COALESCE(SUM(size_bytes), 0) AS size_bytes,
+                    COALESCE(SUM(hit_count), 0) AS total_hits
+             FROM llm_cache'''
+    return dict(get_db().execute(sql).fetchone())
+
+# ===============================================
+# 逐字稿片段
+# ===============================================
+
+def save_transcript_segments(meeting_id, segments, content_changed=True):
+    """
+    以新的解析結果取代會議的所有逐字稿片段，並同步更新全文索引。segments 為 build_segment_records 的輸出。
+    content_changed 為 False 時 (從既有字幕檔回填片段記錄，內容不變) 不遞增內容版本，也不清除逐字稿快取。
+    """
+    sql = '''INSERT INTO transcript_segments
+             (meeting_id, seg_index, start_time, end_time, speaker, content, original_content)
+             VALUES (?, ?, ?, ?, ?, ?, ?)'''
+    conn = get_db()
+    _delete_search_rows(conn, meeting_id)
+    conn.execute('DELETE FROM transcript_segments WHERE meeting_id = ?', (meeting_id,))
+    conn.executemany(sql, [
+        (meeting_id, seg['index'], seg['start'], seg['end'], seg['speaker'], seg['content'], seg['original_content'])
+        for seg in segments
+    ])
+    _index_meeting_segments(conn, meeting_id)
+    if content_changed:
+        _bump_content_version(conn, meeting_id)
+    conn.commit()
+    if content_changed:
+        _invalidate_transcript_cache(meeting_id)
+
+def get_transcript_segments(meeting_id):
+    """依序獲取會議的逐字稿片段，返回與 build_segment_records 相同格式的字典列表。"""
+    sql = '''SELECT seg_index, start_time, end_time, speaker, content, original_content
+             FROM transcript_segments WHERE meeting_id = ? ORDER BY seg_index'''
+    rows = get_db().execute(sql, (meeting_id,)).fetchall()
+    return [
+        {
+            'index': row['seg_index'],
+            'start': row['start_time'],
+            'end': row['end_time'],
+            'speaker': row['speaker'],
+            'content': row['content'],
+            'original_content': row['original_content']
+        }
+        for row in rows
+    ]
+
+def has_transcript_segments(meeting_id):
+    """檢查會議是否已寫入逐字稿片段。"""
+    sql = 'SELECT 1 FROM transcript_segments WHERE meeting_id = ? LIMIT 1'
+    return get_db().execute(sql, (meeting_id,)).fetchone() is not None
+
+# ===============================================
+# 逐字稿全文搜尋
+# ===============================================
+
+def _index_meeting_segments(conn, meeting_id):
+    """將會議的逐字稿片段寫入全文索引 (不提交)，發言者使用目前的自定義名稱。"""
+    from utils.search_text import tokenize_for_search
+
+    # 初始化資料庫時使用的連線沒有設定 row_factory，這裡以位置存取欄位
+    speaker_names = dict(conn.execute(
+        'SELECT original_speaker_id, custom_name FROM speaker_names WHERE meeting_id = ?', (meeting_id,)
+    ).fetchall())
+    rows = conn.execute('SELECT rowid, speaker, content FROM transcript_segments WHERE meeting_id = ?',
+                        (meeting_id,)).fetchall()
+    sql = 'INSERT INTO transcript_search (rowid, content, speaker, meeting_id) VALUES (?, ?, ?, ?)'
+    conn.executemany(sql, [
+        (rowid, tokenize_for_search(content), tokenize_for_search(speaker_names.get(speaker, speaker)), meeting_id)
+        for rowid, speaker, content in rows
+    ])
+
+def _delete_search_rows(conn, meeting_id):
+    """刪除會議在全文索引中的所有資料列 (不提交)。"""
+    conn.execute('''DELETE FROM transcript_search
+                    WHERE rowid IN (SELECT rowid FROM transcript_segments WHERE meeting_id = ?)''', (meeting_id,))
+
+def _update_search_speaker(conn, meeting_id, original_speaker_id, display_name):
+    """發言者改名後更新全文索引中的發言者名稱 (不提交)。"""
+    from utils.search_text import tokenize_for_search
+
+    conn.execute('''UPDATE transcript_search SET speaker = ?
+                    WHERE rowid IN (SELECT rowid FROM transcript_segments WHERE meeting_id = ? AND speaker = ?)''',
+                 (tokenize_for_search(display_name), meeting_id, original_speaker_id))
+
+def _backfill_search_index(conn):
+    """全文索引剛建立時，為既有的逐字稿片段建立索引 (不提交)。"""
+    rows = conn.execute('SELECT DISTINCT meeting_id FROM transcript_segments').fetchall()
+    for row in rows:
+        _index_meeting_segments(conn, row[0])
+    if rows:
+        logger.info(f"已為 {len(rows)} 個會議補建全文索引")
+
+def search_transcripts(match_query, limit=20, offset=0, meeting_id=None, max_candidates=5000):
+    """
+    以 FTS5 搜尋逐字稿，依 BM25 相關度排序。
+
+    為了讓常見詞的查詢時間有上限，只對最新的 max_candidates 筆命中片段計算相關度並排序；
+    命中數量少於此值時即為完整排序。
+
+    Args:
+        match_query (str): FTS5 MATCH 查詢字串 (見 utils.search_text.build_match_query)
+        meeting_id (str): 只搜尋指定的會議
+        max_candidates (int): 參與排序的命中片段上限
+
+    Returns:
+        list: sqlite3.Row，包含 meeting_id, original_filename, seg_index, start_time, end_time, speaker, content, score
+    """
+    candidates_sql = 'SELECT rowid, bm25(transcript_search) AS score FROM transcript_search WHERE transcript_search MATCH ?'
+    params = [match_query]
+    if meeting_id:
+        candidates_sql += ' AND meeting_id = ?'
+        params.append(meeting_id)
+    candidates_sql += ' ORDER BY rowid DESC LIMIT ?'
+    params.extend([max_candidates, limit, offset])
+
+    # 先在候選片段中排序取出前幾名，再與片段、會議與發言者名稱表連接
+    sql = f'''WITH candidates AS ({candidates_sql}),
+                   hits AS (SELECT rowid, score FROM candidates ORDER BY score LIMIT ? OFFSET ?)
+              SELECT t.meeting_id, m.original_filename, t.seg_index, t.start_time, t.end_time,
+                     COALESCE(n.custom_name, t.speaker) AS speaker, t.content, hits.score
+              FROM hits
+              JOIN transcript_segments AS t ON t.rowid = hits.rowid
+              JOIN meetings AS m ON m.id = t.meeting_id
+              LEFT JOIN speaker_names AS n
+                     ON n.meeting_id = t.meeting_id AND n.original_speaker_id = t.speaker
+              ORDER BY hits.score'''
+    return get_db().execute(sql, params).fetchall()
@@ -1,6 +1,5 @@
 import uuid
 from pathlib import Path
-from threading import Thread
 from werkzeug.utils import secure_filename
 import logging
 import os
@@ -17,10 +16,15 @@ from flask import (
     Response
 )
 import time
+import queue
 from datetime import datetime
 
-from app.db import add_meeting, get_all_meetings, get_meeting_by_id, get_meeting_summary, get_speaker_names, update_speaker_name, delete_speaker_name
-from app.services.processing import process_meeting
+from app.db import (add_meeting, get_meetings_page, count_meetings_by_status, encode_meeting_cursor,
+                    decode_meeting_cursor, get_meeting_by_id, get_meeting_summary, get_speaker_names, update_speaker_name, delete_speaker_name)
+from app.services.artifact_cache import save_upload_with_hash
+from app.services.http_cache import meeting_validators, not_modified_response, cacheable_response
+from app.services.processing import load_transcript_records
+from app.services.progress_bus import TERMINAL_STEPS
 from utils.export_utils import format_summary_for_export, create_summary_docx
 from . import bp
 
@@ -85,7 +89,8 @@ def upload_file():
                 Path(supplementary_file_path).unlink()
             return jsonify({'status': 'error', 'message': f'檔案大小超過 {config["MAX_CONTENT_LENGTH"] // 1024 // 1024}MB 的限制'}), 413
             
-        file.save(file_path)
+        # 寫入磁碟的同時計算內容雜湊，用於重複上傳的快取
+        content_hash = save_upload_with_hash(file, file_path)
     except Exception as e:
         logger.error(f"儲存檔案失敗: {e}", exc_info=True)
         if supplementary_file_path and Path(supplementary_file_path).exists():
@@ -98,21 +103,36 @@ def upload_file():
     else:
         num_speakers = None
     
-    add_meeting(meeting_id, filename, file.filename, supplementary_file_path)
+    add_meeting(meeting_id, filename, file.filename, supplementary_file_path, content_hash)
     
-    app = current_app._get_current_object()
-    
-    thread = Thread(target=process_meeting, args=(app, meeting_id, str(file_path), num_speakers, supplementary_file_path))
-    thread.daemon = True
-    thread.start()
+    # 排入背景工作佇列
+    current_app.job_queue.enqueue(meeting_id, file_path, num_speakers, supplementary_file_path)
     
     return jsonify({'status': 'success', 'meeting_id': meeting_id})
 
 @bp.route('/meetings')
 def meetings_list():
-    """會議列表頁面"""
-    meetings = get_all_meetings()
-    return render_template('meetings.html', meetings=meetings)
+    """會議列表頁面 (以建立時間游標分頁)"""
+    before = request.args.get('before')
+    after = request.args.get('after')
+    try:
+        meetings, has_more = get_meetings_page(
+            limit=current_app.config['MEETINGS_PAGE_SIZE'],
+            before=decode_meeting_cursor(before) if before else None,
+            after=decode_meeting_cursor(after) if after else None
+        )
+    except ValueError:
+        return redirect(url_for('main.meetings_list'))
+
+    has_older = has_more if not after else True
+    has_newer = has_more if after else bool(before)
+    return render_template(
+        'meetings.html',
+        meetings=meetings,
+        counts=count_meetings_by_status(),
+        next_cursor=encode_meeting_cursor(meetings[-1]) if meetings and has_older else None,
+        prev_cursor=encode_meeting_cursor(meetings[0]) if meetings and has_newer else None
+    )
 
 @bp.route('/meetings/<meeting_id>')
 def meeting_detail(meeting_id):
@@ -128,21 +148,37 @@ def meeting_detail(meeting_id):
 # 檔案操作路由
 # ===============================================
 
+# 播放用的音訊版本 (依偏好順序)：處理時產生的 opus webm 約為 16kHz WAV 的十分之一大小
+AUDIO_RENDITIONS = {
+    'webm': ('{meeting_id}.webm', 'audio/webm'),
+    'wav': ('{meeting_id}.wav', 'audio/wav'),
+}
+
 @bp.route('/stream_audio/<meeting_id>')
 def stream_audio(meeting_id):
-    """串流處理後的音訊檔案"""
+    """
+    串流處理後的音訊檔案
+
+    支援 HTTP Range (206 Partial Content)，拖曳播放位置時瀏覽器只需下載需要的片段；
+    回應帶有 ETag 與 Last-Modified，檔案未變更時以 304 回應。
+    可用 ?rendition=webm|wav 指定版本 (播放器依瀏覽器支援的格式選擇)，未指定時使用第一個存在的版本。
+    """
     meeting = get_meeting_by_id(meeting_id)
     if not meeting:
         return "Meeting not found", 404
-        
-    # 我們假設處理後的音訊是 wav 格式
-    processed_filename = f"{meeting_id}.wav"
-    file_path = current_app.config['PROCESSED_FOLDER'] / processed_filename
-    
-    if not file_path.exists():
-        return "Processed audio file not found", 404
-        
-    return send_file(file_path, mimetype='audio/wav')
+
+    rendition = request.args.get('rendition')
+    if rendition is not None and rendition not in AUDIO_RENDITIONS:
+        return "Unsupported rendition", 400
+
+    for name in ([rendition] if rendition else AUDIO_RENDITIONS):
+        filename, mimetype = AUDIO_RENDITIONS[name]
+        file_path = current_app.config['PROCESSED_FOLDER'] / filename.format(meeting_id=meeting_id)
+        if file_path.exists():
+            # conditional=True 會處理 Range、If-None-Match、If-Modified-Since 與 If-Range
+            return send_file(file_path, mimetype=mimetype, conditional=True, etag=True)
+
+    return "Processed audio file not found", 404
 
 @bp.route('/download/<meeting_id>/summary/<file_type>')
 def download_summary(meeting_id, file_type):
@@ -160,6 +196,12 @@ def download_summary(meeting_id, file_type):
         flash('找不到會議摘要', 'error')
         return redirect(url_for('main.meeting_detail', meeting_id=meeting_id))
     
+    # 摘要重新產生或發言者改名時內容版本會遞增，用戶端已有最新檔案時不再重新產生
+    etag, last_modified = meeting_validators(meeting)
+    cached = not_modified_response(etag, last_modified)
+    if cached is not None:
+        return cached
+
     # 獲取發言者名稱映射
     speaker_names = get_speaker_names(meeting_id)
         
@@ -170,7 +212,7 @@ def download_summary(meeting_id, file_type):
         content = format_summary_for_export(summary_data, meeting, speaker_names)
         
         # 準備下載
-        return Response(
+        response = Response(
             content,
             mimetype='text/plain; charset=utf-8',
             headers={
@@ -183,16 +225,17 @@ def download_summary(meeting_id, file_type):
         docx_file = create_summary_docx(summary_data, meeting, speaker_names)
         
         # 準備下載
-        return send_file(
+        response = send_file(
             docx_file,
             as_attachment=True,
             download_name=f"{original_name}_summary.docx",
             mimetype='application/vnd.openxmlformats-officedocument.wordprocessingml.document'
         )
+    return cacheable_response(response, etag, last_modified)
 
 @bp.route('/download/<meeting_id>/<file_type>')
 def download_file_route(meeting_id, file_type):
-    """下載處理結果檔案"""
+    """下載處理結果檔案 (支援 ETag / Last-Modified 條件式請求，SRT 在用戶端支援時以 gzip 壓縮)"""
     from utils.subtitle_processing import apply_speaker_names_to_srt
     from io import BytesIO
     
@@ -223,34 +266,43 @@ def download_file_route(meeting_id, file_type):
         'speaker_srt': '_語者標註.srt'
     }
     download_name = f"{original_name}{extension_map[file_type]}"
+
+    # 驗證器包含內容版本：發言者改名後即使檔案未變更，套用名稱後的 SRT 也會不同
+    etag, last_modified = meeting_validators(meeting, [file_path])
+    cached = not_modified_response(etag, last_modified)
+    if cached is not None:
+        return cached
     
-    # 對於SRT檔案，檢查是否需要應用發言者名稱映射
-    if file_type in ['srt', 'speaker_srt']:
+    # 語者字幕需要套用發言者名稱映射 (轉錄字幕沒有發言者標籤，不需處理)
+    if file_type == 'speaker_srt':
         # 獲取發言者名稱映射
         speaker_names = get_speaker_names(meeting_id)
         
         if speaker_names:
-            # 讀取原始檔案內容
-            with open(file_path, 'r', encoding='utf-8') as f:
-                original_content = f.read()
-            
-            # 應用發言者名稱映射
-            modified_content = apply_speaker_names_to_srt(original_content, speaker_names)
+            # 由逐字稿快取中的片段記錄組合，不必每次重新讀檔與解析；組合結果也保存在快取中
+            records = load_transcript_records(meeting)
+            if records:
+                modified_content = current_app.transcript_cache.speaker_srt_of(meeting_id, records, speaker_names)
+            else:
+                modified_content = apply_speaker_names_to_srt(file_path.read_text(encoding='utf-8'), speaker_names)
             
             # 創建記憶體中的檔案物件
             modified_file = BytesIO(modified_content.encode('utf-8'))
-            modified_file.seek(0)
             
             # 返回修改後的檔案
-            return send_file(
+            response = send_file(
                 modified_file,
                 as_attachment=True,
                 download_name=download_name,
                 mimetype='text/srt; charset=utf-8'
             )
+            return cacheable_response(response, etag, last_modified)
     
-    # 對於RTTM檔案或沒有發言者名稱映射的情況，直接返回原始檔案
-    return send_file(file_path, as_attachment=True, download_name=download_name)
+    # 轉錄字幕、RTTM 或沒有發言者名稱映射的情況，直接返回原始檔案 (驗證器由上方統一設定)
+    mimetype = 'text/plain; charset=utf-8' if file_type == 'rttm' else 'text/srt; charset=utf-8'
+    response = send_file(file_path, as_attachment=True, download_name=download_name, mimetype=mimetype,
+                         conditional=False, etag=False, last_modified=None)
+    return cacheable_response(response, etag, last_modified)
 
 # ===============================================
 # SSE 串流路由
@@ -258,48 +310,47 @@ def download_file_route(meeting_id, file_type):
 
 @bp.route('/meetings/<meeting_id>/stream')
 def meeting_progress_stream(meeting_id):
-    """提供會議處理進度的 SSE 串流"""
+    """提供會議處理進度的 SSE 串流 (支援多個分頁同時訂閱，以及處理結束後才連線)"""
     logger.info(f"SSE: Client connected for meeting_id: {meeting_id}")
-    # 在路由函數中獲取 progress_tracker，而不是在生成器中
-    progress_tracker = current_app.progress_tracker
-    q = progress_tracker.get(meeting_id)
-    
+    # 在路由函數中獲取 progress_bus 與會議狀態，而不是在生成器中
+    progress_bus = current_app.progress_bus
+    meeting = get_meeting_by_id(meeting_id)
+    heartbeat_interval = current_app.config['SSE_HEARTBEAT_INTERVAL']
+
+    def format_event(event):
+        return f"data: {json.dumps(event)}\n\n"
+
     def generate_progress():
-        logger.info(f"SSE - {meeting_id}: Starting progress generator.")
-        if not q:
-            logger.warning(f"SSE - {meeting_id}: No progress queue found. Sending error message.")
-            # 如果處理已開始但佇列不存在，表示可能已完成或出錯
-            # 發送一個完成事件來確保前端停止輪詢
-            error_message = json.dumps({'step': 'error', 'message': '無法追蹤進度，處理程序可能未正確啟動或已結束。'})
-            yield f"data: {error_message}\n\n"
+        if meeting is None:
+            yield format_event({'step': 'error', 'message': '找不到指定的會議記錄'})
             return
 
-        client_connected = True
-        try:
-            while client_connected:
-                try:
-                    message = q.get(timeout=30)  # 等待新訊息，設置超時以防萬一
-                    logger.info(f"SSE - {meeting_id}: Got message from queue: {message}")
+        with progress_bus.subscribe(meeting_id) as subscription:
+            # 匯流排中沒有此會議的記錄 (例如伺服器重啟後)，改以資料庫狀態回應已結束的會議
+            if progress_bus.latest(meeting_id) is None and meeting['status'] in TERMINAL_STEPS:
+                if meeting['status'] == 'completed':
+                    yield format_event({'step': 'completed', 'progress': 100, 'message': '處理完成！'})
+                else:
+                    yield format_event({'step': 'failed', 'progress': 100,
+                                        'message': meeting['error_message'] or '處理失敗'})
+                return
 
-                    if message.get('status') == 'done':
-                        logger.info(f"SSE - {meeting_id}: 'done' message received. Breaking loop.")
+            try:
+                while True:
+                    try:
+                        event = subscription.get(timeout=heartbeat_interval)
+                    except queue.Empty:
+                        # SSE 註解行，維持連線不被代理中斷
+                        yield ": keep-alive\n\n"
+                        continue
+
+                    yield format_event(event)
+                    if event.get('step') in TERMINAL_STEPS:
                         break
-                    
-                    # 格式化為 SSE 格式
-                    sse_data = f"data: {json.dumps(message)}\n\n"
-                    logger.info(f"SSE - {meeting_id}: Sending data to client: {sse_data.strip()}")
-                    yield sse_data
-                except Exception as e:
-                    # 如果超時或佇列為空，跳出循環
-                    logger.info(f"SSE - {meeting_id}: Queue timeout or empty. Breaking loop. Exception: {e}")
-                    break
-        except GeneratorExit:
-            # This exception is raised when the client disconnects
-            client_connected = False
-            logger.info(f"SSE - {meeting_id}: Client disconnected. Closing generator.")
-        finally:
-            logger.info(f"SSE - {meeting_id}: Progress generator finished.")
-    
+            except GeneratorExit:
+                logger.info(f"SSE - {meeting_id}: Client disconnected. Closing generator.")
+                raise
+
     # 回傳一個串流回應，確保代理不會緩衝
     response = Response(generate_progress(), mimetype='text/event-stream')
     response.headers['Cache-Control'] = 'no-cache'
@@ -0,0 +1,112 @@
+import hashlib
+import json
+import logging
+import shutil
+import threading
+from pathlib import Path
+
+from app.db import (get_cache_entry, add_cache_entry, delete_cache_entry,
+                    get_cache_total_size, get_lru_cache_entries)
+
+logger = logging.getLogger(__name__)
+
+# 上傳檔案寫入磁碟時，每次讀取的區塊大小
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+def save_upload_with_hash(file_storage, dest_path: Path) -> str:
+    """
+    將上傳檔案以串流方式寫入磁碟，同時計算 SHA-256。
+
+    Returns:
+        str: 檔案內容的十六進位雜湊值
+    """
+    digest = hashlib.sha256()
+    stream = file_storage.stream
+    with open(dest_path, 'wb') as f:
+        while True:
+            chunk = stream.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            f.write(chunk)
+    return digest.hexdigest()
+
+class ArtifactCache:
+    """
+    以「上傳內容雜湊 + 處理階段 + 參數」為鍵的處理結果快取。
+
+    重複上傳相同的錄音時，可直接沿用先前的 SRT 與 RTTM，不必再呼叫 Whisper 與 pyannote。
+    快取檔案存放在 ARTIFACT_CACHE_FOLDER，總大小超過 ARTIFACT_CACHE_MAX_MB 時依最近使用時間淘汰。
+    所有方法都需要在 app context 中呼叫。
+    """
+
+    def __init__(self, app=None):
+        self.cache_dir = None
+        self.max_bytes = 0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.cache_dir = Path(app.config['ARTIFACT_CACHE_FOLDER'])
+        self.max_bytes = app.config['ARTIFACT_CACHE_MAX_MB'] * 1024 * 1024
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        app.artifact_cache = self
+
+    @staticmethod
+    def make_key(content_hash, stage, params=None):
+        payload = json.dumps({'hash': content_hash, 'stage': stage, 'params': params}, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def fetch(self, content_hash, stage, params, dest_path: Path):
+        """
+        若快取命中，將快取檔案複製到 dest_path。
+
+        Returns:
+            tuple[bool, object]: (是否命中, 階段結果)
+        """
+        if not content_hash or self.max_bytes <= 0:
+            return False, None
+
+        cache_key = self.make_key(content_hash, stage, params)
+        entry = get_cache_entry(cache_key)
+        if entry is None:
+            return False, None
+
+        cached_path = self.cache_dir / entry['path']
+        if not cached_path.exists():
+            logger.warning(f"快取檔案遺失，移除快取記錄: {cached_path}")
+            delete_cache_entry(cache_key)
+            return False, None
+
+        shutil.copyfile(cached_path, dest_path)
+        logger.info(f"快取命中: {stage} ({content_hash[:12]})")
+        return True, json.loads(entry['result']) if entry['result'] else None
+
+    def store(self, content_hash, stage, params, src_path: Path, result=None):
+        """將階段產出複製進快取，必要時淘汰最久未使用的項目。"""
+        if not content_hash or self.max_bytes <= 0 or not src_path.exists():
+            return
+
+        cache_key = self.make_key(content_hash, stage, params)
+        relative_path = f"{cache_key}{src_path.suffix}"
+        shutil.copyfile(src_path, self.cache_dir / relative_path)
+        add_cache_entry(cache_key, content_hash, stage, params, relative_path,
+                        src_path.stat().st_size, result)
+        self._evict()
+
+    def _evict(self):
+        """總大小超過上限時，依 LRU 順序刪除快取項目。"""
+        with self._lock:
+            total = get_cache_total_size()
+            while total > self.max_bytes:
+                entries = get_lru_cache_entries()
+                if not entries:
+                    break
+                for entry in entries:
+                    (self.cache_dir / entry['path']).unlink(missing_ok=True)
+                    delete_cache_entry(entry['cache_key'])
+                    total -= entry['size_bytes']
+                    logger.info(f"已淘汰快取項目: {entry['cache_key'][:12]}")
+                    if total <= self.max_bytes:
+                        break
@@ -0,0 +1,92 @@
+import gzip
+import hashlib
+from datetime import datetime, timezone
+
+from flask import Response, current_app, request
+from werkzeug.http import is_resource_modified
+
+# 可壓縮的回應類型 (逐字稿 JSON、純文字字幕與 SRT)
+GZIP_MIMETYPES = ('application/json', 'text/')
+
+
+def meeting_validators(meeting, paths=()):
+    """
+    計算會議衍生內容的快取驗證器。
+
+    ETag 由會議的內容版本 (發言者改名、摘要重新產生與重新處理時遞增)、產出檔案的修改時間與大小，
+    以及請求的路徑與查詢參數組成；Last-Modified 為內容版本更新時間與檔案修改時間中較晚者。
+
+    Args:
+        meeting: 會議記錄 (sqlite3.Row)
+        paths (iterable): 回應內容所依據的檔案
+
+    Returns:
+        tuple: (etag, last_modified)
+    """
+    parts = [meeting['id'], str(meeting['content_version'] or 0), request.full_path]
+    last_modified = _as_utc(meeting['content_updated_at'])
+    for path in paths:
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            parts.append('missing')
+            continue
+        parts.append(f"{stat.st_mtime_ns:x}-{stat.st_size:x}")
+        modified = datetime.fromtimestamp(stat.st_mtime, timezone.utc)
+        last_modified = modified if last_modified is None else max(last_modified, modified)
+    etag = hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()
+    return etag, last_modified
+
+
+def _as_utc(value):
+    """資料庫的 CURRENT_TIMESTAMP 為 UTC (可能已被轉換為 datetime，也可能仍為字串)"""
+    if not value:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value.replace(tzinfo=timezone.utc)
+
+
+def not_modified_response(etag, last_modified):
+    """
+    用戶端快取的內容仍為最新時返回 304 回應，否則返回 None。
+    應在產生回應內容之前呼叫，快取有效時就不需要重新讀取與格式化逐字稿。
+    """
+    if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        return None
+    response = Response(status=304)
+    _set_validators(response, etag, last_modified)
+    return response
+
+
+def cacheable_response(response, etag, last_modified):
+    """為回應加上快取驗證器，並在用戶端支援時以 gzip 壓縮較大的文字回應"""
+    _set_validators(response, etag, last_modified)
+    return gzip_response(response)
+
+
+def _set_validators(response, etag, last_modified):
+    # gzip 與未壓縮的內容語意相同，使用弱 ETag 讓兩者可以互相驗證
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # 允許瀏覽器保存，但每次使用前都要重新驗證 (內容可能隨時因改名或重新處理而變更)
+    response.cache_control.no_cache = True
+    response.vary.add('Accept-Encoding')
+
+
+def gzip_response(response):
+    """用戶端接受 gzip 且內容為超過門檻的文字時壓縮回應"""
+    if (response.status_code != 200 or 'Content-Encoding' in response.headers
+            or not request.accept_encodings['gzip']
+            or not response.mimetype.startswith(GZIP_MIMETYPES)):
+        return response
+
+    # send_file 的回應預設直接傳遞檔案，需先讀出內容
+    response.direct_passthrough = False
+    data = response.get_data()
+    if len(data) < current_app.config['HTTP_GZIP_MIN_BYTES']:
+        return response
+    response.set_data(gzip.compress(data, compresslevel=current_app.config['HTTP_GZIP_LEVEL']))
+    response.headers['Content-Encoding'] = 'gzip'
+    return response
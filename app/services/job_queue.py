@@ -0,0 +1,144 @@
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from app.db import (enqueue_job, claim_next_job, finish_job, requeue_interrupted_jobs,
+                    heartbeat_jobs, get_meeting_by_id, get_queue_position)
+
+logger = logging.getLogger(__name__)
+
+class JobQueue:
+    """
+    以 SQLite jobs 資料表為後盾的背景工作佇列。
+
+    固定數量的 worker 執行緒會從資料表中取出排隊中的工作並呼叫 process_meeting，
+    因此同時處理的會議數量有上限；工作狀態保存在資料庫中，伺服器重啟後可以接續處理。
+    取得的工作會記錄擁有者 (主機名稱、行程 ID 與隨機值組成，行程 ID 被重複使用也不會混淆) 並定期更新心跳，
+    只有心跳超過 JOB_STALE_SECONDS 未更新的工作才會被重新排入佇列，
+    多個行程共用同一個資料庫時不會搶走彼此仍在處理的工作。
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.num_workers = 1
+        self.poll_interval = 5
+        self.heartbeat_interval = 30
+        self.stale_seconds = 120
+        self.owner_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex}"
+        self._workers = []
+        self._wakeup = threading.Condition()
+        self._started = False
+        self._start_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.num_workers = max(1, app.config['JOB_WORKERS'])
+        self.poll_interval = app.config['JOB_POLL_INTERVAL']
+        self.heartbeat_interval = app.config['JOB_HEARTBEAT_INTERVAL']
+        self.stale_seconds = app.config['JOB_STALE_SECONDS']
+        app.job_queue = self
+
+    def autostart(self):
+        """
+        在 create_app 結束前呼叫：伺服器重啟後不需等待請求，就會接手中斷與排隊中的工作。
+        debug 模式的 reloader 主行程只負責監看檔案並重新啟動子行程，不啟動 worker，
+        避免兩個行程同時處理工作。
+        """
+        if not self.app.config['JOB_QUEUE_AUTOSTART']:
+            return
+        if self.app.debug and os.environ.get('WERKZEUG_RUN_MAIN') != 'true':
+            logger.info("reloader 主行程不啟動背景工作佇列")
+            return
+        self.ensure_started()
+
+    def ensure_started(self):
+        """啟動 worker 與心跳執行緒，並將上次中斷的工作重新排入佇列 (只執行一次)。"""
+        if self._started:
+            return
+        with self._start_lock:
+            if self._started:
+                return
+            # 重啟前中斷的工作在心跳逾時後才會被接手 (之後由心跳執行緒定期檢查)
+            self._requeue_stale_jobs()
+
+            for i in range(self.num_workers):
+                worker = threading.Thread(target=self._worker_loop, name=f"job-worker-{i}", daemon=True)
+                worker.start()
+                self._workers.append(worker)
+            heartbeat = threading.Thread(target=self._heartbeat_loop, name="job-heartbeat", daemon=True)
+            heartbeat.start()
+            self._workers.append(heartbeat)
+            self._started = True
+            logger.info(f"背景工作佇列已啟動，worker 數量: {self.num_workers}")
+
+    def enqueue(self, meeting_id, file_path, num_speakers=None, supplementary_file_path=None):
+        """將會議排入處理佇列，必須在 app context 中呼叫。返回工作 ID。"""
+        job_id = enqueue_job(meeting_id, str(file_path), num_speakers, supplementary_file_path)
+
+        # 發布排隊狀態，讓前端在排隊期間連上 SSE 即可看到目前位置
+        position = get_queue_position(meeting_id)
+        self.app.progress_bus.publish(meeting_id, {'step': 'queued', 'progress': 0, 'message': f'排隊等待處理中 (第 {position} 位)'})
+        logger.info(f"會議 {meeting_id} 已排入佇列 (工作 {job_id}，第 {position} 位)")
+
+        self.ensure_started()
+        with self._wakeup:
+            self._wakeup.notify()
+        return job_id
+
+    def _requeue_stale_jobs(self):
+        stale_before = datetime.now() - timedelta(seconds=self.stale_seconds)
+        with self.app.app_context():
+            recovered = requeue_interrupted_jobs(stale_before)
+        if recovered:
+            logger.info(f"已重新排入 {recovered} 筆中斷的工作")
+            with self._wakeup:
+                self._wakeup.notify_all()
+        return recovered
+
+    def _heartbeat_loop(self):
+        """定期更新本行程執行中工作的心跳，並接手其他已結束行程遺留的工作。"""
+        while True:
+            try:
+                with self.app.app_context():
+                    heartbeat_jobs(self.owner_id)
+                self._requeue_stale_jobs()
+            except Exception as e:
+                logger.error(f"更新工作心跳時發生錯誤: {e}", exc_info=True)
+            time.sleep(self.heartbeat_interval)
+
+    def _worker_loop(self):
+        from app.services.processing import process_meeting
+
+        while True:
+            try:
+                with self.app.app_context():
+                    job = claim_next_job(self.owner_id)
+                if job is None:
+                    with self._wakeup:
+                        self._wakeup.wait(timeout=self.poll_interval)
+                    continue
+
+                logger.info(f"{threading.current_thread().name} 開始處理工作 {job['id']} (會議 {job['meeting_id']})")
+                process_meeting(
+                    self.app,
+                    job['meeting_id'],
+                    job['file_path'],
+                    job['num_speakers'],
+                    job['supplementary_file_path']
+                )
+
+                # process_meeting 會自行捕捉錯誤並更新會議狀態
+                with self.app.app_context():
+                    meeting = get_meeting_by_id(job['meeting_id'])
+                    status = 'done' if meeting and meeting['status'] == 'completed' else 'failed'
+                    finish_job(job['id'], status)
+            except Exception as e:
+                logger.error(f"背景工作 worker 發生錯誤: {e}", exc_info=True)
+                with self._wakeup:
+                    self._wakeup.wait(timeout=self.poll_interval)
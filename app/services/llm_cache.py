@@ -0,0 +1,94 @@
+import hashlib
+import json
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from app.db import (get_llm_cache_entry, add_llm_cache_entry, delete_expired_llm_cache_entries,
+                    evict_llm_cache_entries, get_llm_cache_usage)
+
+logger = logging.getLogger(__name__)
+
+class LLMResponseCache:
+    """
+    以 SQLite 保存的 LLM 回應快取。
+
+    快取鍵為「用戶端端點 + 模型 + 所有請求參數 + 提示」的 SHA-256，輸入完全相同的請求
+    (例如未變更的會議重新產生摘要) 會直接返回先前的回應，不再呼叫模型。
+    項目超過 LLM_CACHE_TTL_HOURS 即失效，總大小超過 LLM_CACHE_MAX_MB 時依最近使用時間淘汰。
+
+    摘要會在執行緒池中同時呼叫模型，因此每次存取都會自行建立 app context，不需要由呼叫端提供。
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.max_bytes = 0
+        self.ttl = None
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.max_bytes = app.config['LLM_CACHE_MAX_MB'] * 1024 * 1024
+        self.ttl = timedelta(hours=app.config['LLM_CACHE_TTL_HOURS'])
+        app.llm_cache = self
+
+        # 將快取接到共用的 LLM 呼叫層上 (所有摘要與輔助文件請求都經過 app.llm)
+        app.llm.response_cache = self
+
+    @property
+    def enabled(self):
+        return self.app is not None and self.max_bytes > 0
+
+    @staticmethod
+    def make_key(request_kwargs, llm_client=None):
+        """依請求參數 (含模型與訊息) 與用戶端端點計算快取鍵。"""
+        payload = json.dumps({
+            'endpoint': str(getattr(llm_client, 'base_url', '')),
+            'request': request_kwargs
+        }, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, cache_key):
+        """取得快取的回應，未命中或已過期時返回 None。"""
+        if not self.enabled:
+            return None
+        with self.app.app_context():
+            entry = get_llm_cache_entry(cache_key, created_after=datetime.now() - self.ttl)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        logger.info(f"LLM 回應快取命中: {cache_key[:12]}")
+        return entry['response']
+
+    def put(self, cache_key, model, response):
+        """保存回應；空白回應 (呼叫失敗) 不會被快取。"""
+        if not self.enabled or not response:
+            return
+        with self.app.app_context():
+            add_llm_cache_entry(cache_key, model, response)
+            expired = delete_expired_llm_cache_entries(datetime.now() - self.ttl)
+            evicted = evict_llm_cache_entries(self.max_bytes)
+        if expired or evicted:
+            logger.info(f"LLM 回應快取已清除 {expired} 筆過期、淘汰 {evicted} 筆項目")
+
+    def stats(self):
+        """快取統計：本行程的命中/未命中次數與資料庫中的項目數、大小。"""
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        stats = {
+            'enabled': self.enabled,
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / lookups, 4) if lookups else None,
+        }
+        if self.app is not None:
+            with self.app.app_context():
+                stats.update(get_llm_cache_usage())
+        return stats
@@ -1,116 +1,449 @@
 import logging
-import shutil
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from pathlib import Path
 from datetime import datetime
-import queue
 
 from flask import current_app
 
-from app.db import update_meeting_status
+from app.db import (close_db, update_meeting_status, save_stage_checkpoint, get_stage_checkpoints,
+                    get_meeting_by_id, save_transcript_segments, get_transcript_segments)
+from utils.subtitle_processing import build_segment_records
+from utils.waveform import generate_waveform_peaks
 
 logger = logging.getLogger(__name__)
 
+# 正在處理中的會議：process_meeting 從開始到所有階段執行緒結束都會持有，避免同一會議的產出檔案被同時寫入
+_busy_meetings = set()
+_busy_condition = threading.Condition()
+
+@contextmanager
+def _exclusive_meeting(meeting_id):
+    """同一會議同時只允許一個處理流程，後到的會等待前一個完全結束"""
+    with _busy_condition:
+        while meeting_id in _busy_meetings:
+            _busy_condition.wait()
+        _busy_meetings.add(meeting_id)
+    try:
+        yield
+    finally:
+        with _busy_condition:
+            _busy_meetings.discard(meeting_id)
+            _busy_condition.notify_all()
+
+def is_meeting_busy(meeting_id):
+    """會議是否仍有處理流程在執行 (包含失敗後尚未結束的階段執行緒)"""
+    with _busy_condition:
+        return meeting_id in _busy_meetings
+
+def _run_stage_graph(stages, max_workers=2, cancelled=None, on_failure=None):
+    """
+    依相依關係執行處理階段。
+
+    Args:
+        stages (dict): {階段名稱: (函式, [相依階段名稱, ...])}，
+                       函式會收到一個 {相依階段名稱: 回傳值} 的字典。
+        max_workers (int): 同時執行的階段數上限。
+        cancelled (threading.Event, optional): 任一階段失敗時設定，讓仍在執行的階段在步驟之間提早結束。
+        on_failure (callable, optional): 任一階段失敗時以該例外呼叫，在等待其他階段結束之前執行，
+                                         讓失敗能立即回報 (語者辨識模型的單一步驟可能執行數十分鐘)。
+
+    Returns:
+        dict: {階段名稱: 回傳值}
+
+    任一階段拋出例外時，尚未開始的階段會被取消，並等待仍在執行的階段結束後才將例外向上拋出，
+    避免失敗後還有分支在回報進度或寫入產出檔案。
+    """
+    results = {}
+    pending = dict(stages)
+    running = {}
+
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='stage')
+    try:
+        while pending or running:
+            # 提交所有相依階段都已完成的階段
+            for name, (func, deps) in list(pending.items()):
+                if all(dep in results for dep in deps):
+                    inputs = {dep: results[dep] for dep in deps}
+                    running[executor.submit(func, inputs)] = name
+                    del pending[name]
+
+            if not running:
+                raise RuntimeError(f"處理階段的相依關係無法滿足: {list(pending)}")
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                error = future.exception()
+                if error is not None:
+                    if cancelled is not None:
+                        cancelled.set()
+                    for other in running:
+                        other.cancel()
+                    if on_failure is not None:
+                        try:
+                            on_failure(error)
+                        except Exception as e:
+                            logger.error(f"回報處理階段失敗時發生錯誤: {e}", exc_info=True)
+                    raise error
+                results[name] = future.result()
+    finally:
+        # 等待仍在執行的分支結束，失敗的工作不會在背景繼續佔用 CPU 或寫入檔案
+        executor.shutdown(wait=True)
+
+    return results
+
+def _describe_artifacts(paths, base_dir):
+    """記錄產出檔案的相對路徑、大小與修改時間，用來判斷檢查點是否仍然有效"""
+    artifacts = []
+    for path in paths:
+        stat = path.stat()
+        artifacts.append({
+            'path': str(path.relative_to(base_dir)),
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns
+        })
+    return artifacts
+
+def _is_checkpoint_valid(checkpoint, paths, base_dir, params=None):
+    """檢查點存在、參數相同，且所有產出檔案都未遺失或被修改"""
+    if not checkpoint or checkpoint['params'] != params:
+        return False
+    recorded = {a['path']: a for a in checkpoint['artifacts']}
+    for path in paths:
+        artifact = recorded.get(str(path.relative_to(base_dir)))
+        if artifact is None or not path.exists():
+            return False
+        stat = path.stat()
+        if stat.st_size == 0 or stat.st_size != artifact['size'] or stat.st_mtime_ns != artifact['mtime_ns']:
+            return False
+    return True
+
+def diarize_params(num_speakers=None, threshold=None):
+    """語者辨識檢查點與結果快取的參數；process_meeting 與 recluster_meeting 都以此建立，比較方式才會一致"""
+    params = {'num_speakers': num_speakers}
+    if threshold is not None:
+        params['threshold'] = threshold
+    return params
+
+def store_transcript_segments(meeting_id, speaker_srt_path, content_changed=True):
+    """
+    解析語者字幕並寫入逐字稿片段資料表，需要在 app context 中呼叫。返回片段記錄。
+    從既有字幕檔回填時傳入 content_changed=False，不影響 HTTP 快取驗證器與逐字稿快取。
+    """
+    segments = build_segment_records(speaker_srt_path.read_text(encoding='utf-8'))
+    save_transcript_segments(meeting_id, segments, content_changed=content_changed)
+    return segments
+
+def load_transcript_records(meeting):
+    """
+    讀取會議的逐字稿片段記錄 (經由行程內的逐字稿快取)，需要在 app context 中呼叫。
+    返回的列表由所有請求共用，不可修改。字幕檔不存在時返回 None。
+    """
+    return current_app.transcript_cache.get_records(meeting['id'], lambda: read_transcript_records(meeting))
+
+def read_transcript_records(meeting):
+    """
+    從逐字稿片段資料表讀取片段記錄 (不經過快取)，需要在 app context 中呼叫。
+    舊的會議沒有片段記錄時，從語者字幕檔解析並回填；字幕檔不存在時返回 None。
+    """
+    records = get_transcript_segments(meeting['id'])
+    if records:
+        return records
+
+    if not meeting['speaker_srt_path']:
+        return None
+    subtitle_file = current_app.config['BASE_DIR'] / meeting['speaker_srt_path']
+    if not subtitle_file.exists():
+        logger.error(f"字幕檔案於檔案系統中不存在: {subtitle_file}")
+        return None
+
+    logger.info(f"會議 {meeting['id']} 尚無逐字稿片段記錄，從字幕檔解析並回填")
+    # 回填不改變逐字稿內容，已計算的 ETag / Last-Modified 仍然有效
+    return store_transcript_segments(meeting['id'], subtitle_file, content_changed=False)
+
 def process_meeting(app, meeting_id, file_path_str, num_speakers=None, supplementary_file_path=None):
     """
     處理會議音訊的主要函式。
     此函式在獨立的執行緒中運行，需要傳入 app context。
+
+    預處理完成後，轉錄 (網路 I/O) 與語者辨識 (CPU) 會同時執行，兩者皆完成後才進行合併。
+    每個階段完成後都會記錄檢查點；重新處理同一會議時，產出檔案仍有效的階段會直接沿用。
+    同一會議的處理流程不會重疊：重試排入的工作會等待前一次的所有階段執行緒結束。
     """
+    with _exclusive_meeting(meeting_id):
+        _process_meeting(app, meeting_id, file_path_str, num_speakers, supplementary_file_path)
+
+def _process_meeting(app, meeting_id, file_path_str, num_speakers, supplementary_file_path):
     with app.app_context():
-        progress_tracker = current_app.progress_tracker
-        progress_queue = queue.Queue()
-        progress_tracker[meeting_id] = progress_queue
+        progress_bus = current_app.progress_bus
+
+        # 平行分支會交錯回報，整體進度只增不減
+        progress_lock = threading.Lock()
+        overall_progress = {'value': 0}
+        # 任一階段失敗後設定：其他分支不再回報進度 (避免覆蓋 failed 事件)，並在步驟之間提早結束
+        failed = threading.Event()
+        failure_reported = threading.Event()
 
         def report_progress(step, progress, message):
             """輔助函式，用於回報進度"""
-            logger.info(f"會議 {meeting_id} 進度: {message} ({progress}%)")
-            progress_queue.put({'step': step, 'progress': progress, 'message': message})
+            if failed.is_set():
+                return
+            with progress_lock:
+                progress = max(progress, overall_progress['value'])
+                overall_progress['value'] = progress
+                logger.info(f"會議 {meeting_id} 進度: {message} ({progress}%)")
+                progress_bus.publish(meeting_id, {'step': step, 'progress': progress, 'message': message})
+
+        def report_failure(error):
+            """將會議標記為失敗並發布 failed 事件 (只執行一次)，之後其他分支不再回報進度"""
+            failed.set()
+            if failure_reported.is_set():
+                return
+            failure_reported.set()
+            update_meeting_status(meeting_id, 'failed', error_message=str(error))
+            progress_bus.publish(meeting_id, {'step': 'failed', 'progress': 100, 'message': str(error)})
+
+        def report_stage_failure(error):
+            # 其他分支 (例如語者辨識) 可能還要執行很久，先回報失敗再等待它們結束
+            logger.warning(f"會議 {meeting_id}: 處理階段失敗，等待其他執行中的階段結束: {error}")
+            report_failure(error)
+            close_db()
 
         try:
             logger.info(f"開始處理會議 {meeting_id}")
-            
+
             # 從 app context 獲取相依性
             audio_processor = current_app.audio_processor
             config = current_app.config
-            
+
             file_path = Path(file_path_str)
-            
+
             # 更新狀態為處理中
             update_meeting_status(meeting_id, 'processing')
-            
+
             # 從設定檔定義輸出路徑
-            base_name = file_path.stem
             compressed_path = config['PROCESSED_FOLDER'] / f"{meeting_id}.webm"
             wav_path = config['PROCESSED_FOLDER'] / f"{meeting_id}.wav"
             srt_path = config['OUTPUT_FOLDER'] / f"{meeting_id}.srt"
             rttm_path = config['OUTPUT_FOLDER'] / f"{meeting_id}.rttm"
             speaker_srt_path = config['OUTPUT_FOLDER'] / f"{meeting_id}_speaker.srt"
-            
+            diarization_intermediates_path = config['PROCESSED_FOLDER'] / f"{meeting_id}_diarization.npz"
+            waveform_path = config['PROCESSED_FOLDER'] / f"{meeting_id}_waveform.bin"
+            base_dir = config['BASE_DIR']
+
+            checkpoints = get_stage_checkpoints(meeting_id)
+            executed_stages = set()
+
+            # 語者數量相同時沿用重新分群指定的分群門檻，重試不會捨棄重新分群的結果
+            previous_diarize = checkpoints.get('diarize')
+            threshold = None
+            if previous_diarize and previous_diarize['params'] and \
+                    previous_diarize['params'].get('num_speakers') == num_speakers:
+                threshold = previous_diarize['params'].get('threshold')
+            diarize_stage_params = diarize_params(num_speakers, threshold)
+
+            # 相同內容曾經處理過時，直接從快取取得轉錄與語者辨識結果，並記錄為已完成的檢查點
+            artifact_cache = current_app.artifact_cache
+            meeting = get_meeting_by_id(meeting_id)
+            content_hash = meeting['content_hash'] if meeting else None
+            cacheable_stages = {
+                'transcribe': (srt_path, None),
+                'diarize': (rttm_path, diarize_stage_params),
+            }
+            for stage, (artifact_path, params) in cacheable_stages.items():
+                if _is_checkpoint_valid(checkpoints.get(stage), [artifact_path], base_dir, params):
+                    continue
+                hit, result = artifact_cache.fetch(content_hash, stage, params, artifact_path)
+                if hit:
+                    save_stage_checkpoint(meeting_id, stage, _describe_artifacts([artifact_path], base_dir), params, result)
+            checkpoints = get_stage_checkpoints(meeting_id)
+
+            # 語者辨識的中間結果與語者數量無關，有快取時語者辨識只需重新分群
+            if not diarization_intermediates_path.exists():
+                artifact_cache.fetch(content_hash, 'diarize_intermediates', None, diarization_intermediates_path)
+
+            def checkpointed(stage, func, artifacts, step, progress, params=None, invalidated_by=()):
+                """包裝處理階段：檢查點有效時跳過，否則執行並記錄檢查點"""
+                def run(inputs):
+                    if failed.is_set():
+                        raise RuntimeError(f"其他處理階段已失敗，略過階段 {stage}")
+                    upstream_rerun = any(dep in executed_stages for dep in invalidated_by)
+                    if not upstream_rerun and _is_checkpoint_valid(checkpoints.get(stage), artifacts, base_dir, params):
+                        logger.info(f"會議 {meeting_id}: 沿用已完成的階段 {stage}")
+                        report_progress(step, progress, '沿用先前完成的結果')
+                        return checkpoints[stage]['result']
+
+                    result = func(inputs)
+                    executed_stages.add(stage)
+                    # 階段在 worker 執行緒中執行，需要自己的 app context 才能寫入資料庫
+                    with app.app_context():
+                        save_stage_checkpoint(meeting_id, stage, _describe_artifacts(artifacts, base_dir), params, result)
+                    return result
+                return run
+
             # 步驟 1: 音訊預處理
-            report_progress('preprocessing', 10, '音訊預處理中...')
-            if file_path.suffix.lower() != ".webm":
-                duration = audio_processor.compress_audio(file_path, compressed_path)
-                audio_processor.convert_to_wav(file_path, wav_path)
-            else:
-                shutil.copy(file_path, compressed_path)
-                duration = audio_processor.get_audio_duration(file_path)
-                audio_processor.convert_to_wav(file_path, wav_path)
-            report_progress('preprocessing', 25, '音訊預處理完成')
-
-            # 步驟 2: Whisper 轉錄
-            report_progress('transcription', 30, '開始語音轉文字...')
-            
-            # 檢查壓縮後的檔案大小是否超過 OpenAI 限制 (25MB)
-            whisper_file_size_mb = compressed_path.stat().st_size / (1024 * 1024)
-            if whisper_file_size_mb > 25:
-                error_msg = f"壓縮後的音檔大小 ({whisper_file_size_mb:.2f}MB) 超過 Whisper API 25MB 的限制。"
-                logger.error(f"會議 {meeting_id}: {error_msg}")
-                raise Exception(error_msg)
-
-            srt_text = audio_processor.transcribe_audio(compressed_path)
-            if not srt_text:
-                raise Exception("Whisper 轉錄失敗，可能原因為 API 金鑰錯誤、網路問題或音檔內容為靜音。")
-            
-            with open(srt_path, "w", encoding="utf-8") as f:
-                f.write(srt_text)
-            report_progress('transcription', 60, '語音轉文字完成')
-
-            # 步驟 3: 語者辨識
-            report_progress('diarization', 65, '開始語者辨識...')
-            audio_processor.diarize_audio(wav_path, rttm_output_path=rttm_path, num_speakers=num_speakers)
-            
-            diarization_segments = audio_processor.parse_rttm(rttm_path)
-            speakers = set(seg['speaker'] for seg in diarization_segments)
-            actual_num_speakers = len(speakers)
-            report_progress('diarization', 85, '語者辨識完成')
-            
-            # 步驟 4: 合併字幕和語者資訊
-            report_progress('merge', 90, '合併字幕與語者資訊...')
-            audio_processor.merge_srt_with_speakers(srt_path, rttm_path, speaker_srt_path)
-            
+            def preprocess(_):
+                report_progress('preprocessing', 10, '音訊預處理中...')
+                duration = audio_processor.preprocess_audio(file_path, compressed_path, wav_path)
+                report_progress('preprocessing', 25, '音訊預處理完成')
+                return duration
+
+            # 步驟 2a: Whisper 轉錄
+            def transcribe(inputs):
+                report_progress('transcription', 30, '開始語音轉文字...')
+
+                # 超過 Whisper API 的檔案大小限制時，改用分段平行轉錄
+                whisper_file_size_mb = compressed_path.stat().st_size / (1024 * 1024)
+                if whisper_file_size_mb > config['WHISPER_MAX_FILE_SIZE_MB']:
+                    logger.info(f"會議 {meeting_id}: 壓縮後音檔 {whisper_file_size_mb:.2f}MB 超過限制，改用分段轉錄")
+                    report_progress('transcription', 35, '音檔較大，分段轉錄中...')
+                    srt_text = audio_processor.transcribe_audio_chunked(
+                        compressed_path,
+                        work_dir=config['PROCESSED_FOLDER'] / f"{meeting_id}_segments",
+                        duration=inputs['preprocess'],
+                        max_file_size_mb=config['WHISPER_MAX_FILE_SIZE_MB'],
+                        max_workers=config['TRANSCRIPTION_MAX_WORKERS'],
+                        max_retries=config['TRANSCRIPTION_MAX_RETRIES']
+                    )
+                else:
+                    srt_text = audio_processor.transcribe_audio(compressed_path,
+                                                                max_retries=config['TRANSCRIPTION_MAX_RETRIES'])
+                if not srt_text:
+                    raise Exception("Whisper 轉錄失敗，可能原因為 API 金鑰錯誤、網路問題或音檔內容為靜音。")
+
+                with open(srt_path, "w", encoding="utf-8") as f:
+                    f.write(srt_text)
+                report_progress('transcription', 60, '語音轉文字完成')
+
+            # 步驟 2b: 語者辨識 (與轉錄同時進行)
+            def diarize(_):
+                report_progress('diarization', 30, '開始語者辨識...')
+                reclustered = False
+                if diarization_intermediates_path.exists():
+                    # 已有分段與嵌入向量 (例如以不同語者數量重試)，只重新分群
+                    try:
+                        audio_processor.recluster(diarization_intermediates_path, rttm_path,
+                                                  num_speakers=num_speakers, threshold=threshold, uri=meeting_id)
+                        reclustered = True
+                    except Exception as e:
+                        logger.warning(f"會議 {meeting_id}: 重新分群失敗，改為完整語者辨識: {e}")
+                if not reclustered:
+                    if failed.is_set():
+                        raise RuntimeError("其他處理階段已失敗，略過語者辨識")
+                    audio_processor.diarize_audio(wav_path, rttm_output_path=rttm_path, num_speakers=num_speakers,
+                                                  intermediates_path=diarization_intermediates_path)
+                    if threshold is not None:
+                        # 模型本身不接受分群門檻，以剛保存的中間結果依門檻重新分群
+                        audio_processor.recluster(diarization_intermediates_path, rttm_path,
+                                                  num_speakers=num_speakers, threshold=threshold, uri=meeting_id)
+
+                diarization_segments = audio_processor.parse_rttm(rttm_path)
+                speakers = set(seg['speaker'] for seg in diarization_segments)
+                report_progress('diarization', 85, '語者辨識完成')
+                return len(speakers)
+
+            # 步驟 2c: 播放器用的波形峰值 (與轉錄、語者辨識同時進行)
+            def waveform(_):
+                # 僅供顯示使用，失敗時不影響處理結果 (播放器頁面會在需要時重新計算)
+                if failed.is_set():
+                    return
+                if waveform_path.exists() and waveform_path.stat().st_mtime >= wav_path.stat().st_mtime:
+                    return
+                try:
+                    num_levels = generate_waveform_peaks(wav_path, waveform_path)
+                    logger.info(f"會議 {meeting_id}: 已產生 {num_levels} 層波形峰值")
+                except Exception as e:
+                    logger.warning(f"會議 {meeting_id}: 產生波形峰值失敗: {e}")
+
+            # 步驟 3: 合併字幕和語者資訊
+            def merge(_):
+                report_progress('merge', 90, '合併字幕與語者資訊...')
+                audio_processor.merge_srt_with_speakers(srt_path, rttm_path, speaker_srt_path)
+
+            # 各階段會在自己的 app context 中寫入檢查點；處理期間 (可能長達數十分鐘) 不佔用外層的資料庫連線，
+            # 之後更新狀態時會重新借用
+            close_db()
+
+            # 轉錄與語者辨識的結果不受重新預處理影響 (來源音訊相同)，合併則依賴兩者的輸出
+            results = _run_stage_graph({
+                'preprocess': (checkpointed('preprocess', preprocess, [compressed_path, wav_path],
+                                            'preprocessing', 25), []),
+                'transcribe': (checkpointed('transcribe', transcribe, [srt_path],
+                                            'transcription', 60), ['preprocess']),
+                'diarize': (checkpointed('diarize', diarize, [rttm_path],
+                                         'diarization', 85, params=diarize_stage_params), ['preprocess']),
+                'merge': (checkpointed('merge', merge, [speaker_srt_path],
+                                       'merge', 90, invalidated_by=['transcribe', 'diarize']), ['transcribe', 'diarize']),
+                'waveform': (waveform, ['preprocess']),
+            }, max_workers=3, cancelled=failed, on_failure=report_stage_failure)
+
+            for stage, (artifact_path, params) in cacheable_stages.items():
+                if stage in executed_stages:
+                    artifact_cache.store(content_hash, stage, params, artifact_path, results[stage])
+            if 'diarize' in executed_stages:
+                artifact_cache.store(content_hash, 'diarize_intermediates', None, diarization_intermediates_path)
+
+            segments = store_transcript_segments(meeting_id, speaker_srt_path)
+            logger.info(f"會議 {meeting_id} 已寫入 {len(segments)} 個逐字稿片段")
+
             # 更新為完成狀態
-            base_dir = config['BASE_DIR']
             update_meeting_status(
-                meeting_id, 
+                meeting_id,
                 'completed',
                 processed_at=datetime.now().isoformat(),
-                duration=duration,
-                num_speakers=actual_num_speakers,
+                duration=results['preprocess'],
+                num_speakers=results['diarize'],
                 srt_path=str(srt_path.relative_to(base_dir)),
                 rttm_path=str(rttm_path.relative_to(base_dir)),
                 speaker_srt_path=str(speaker_srt_path.relative_to(base_dir))
             )
             report_progress('completed', 100, '處理完成！')
-            
+
             logger.info(f"會議 {meeting_id} 處理完成")
-            
+
         except Exception as e:
             logger.error(f"處理會議 {meeting_id} 失敗: {e}", exc_info=True)
-            # 這個更新也會在 app context 中運行
-            update_meeting_status(meeting_id, 'failed', error_message=str(e))
-            progress_queue.put({'step': 'failed', 'progress': 100, 'message': str(e)})
-        finally:
-            # 發送結束信號並清理
-            progress_queue.put({'status': 'done'})
-            if meeting_id in progress_tracker:
-                del progress_tracker[meeting_id]
-                logger.info(f"已清理會議 {meeting_id} 的進度追蹤器。")
+            # 這個更新也會在 app context 中運行 (處理階段失敗時已經回報過)
+            report_failure(e)
+
+def recluster_meeting(meeting_id, num_speakers=None, threshold=None):
+    """
+    以已保存的語者辨識中間結果重新分群，並重新產生 RTTM 與語者字幕。
+    需要在 app context 中呼叫。
+
+    Returns:
+        int: 新的語者數量
+
+    Raises:
+        FileNotFoundError: 會議沒有保存中間結果或字幕檔
+    """
+    audio_processor = current_app.audio_processor
+    config = current_app.config
+    base_dir = config['BASE_DIR']
+
+    intermediates_path = config['PROCESSED_FOLDER'] / f"{meeting_id}_diarization.npz"
+    srt_path = config['OUTPUT_FOLDER'] / f"{meeting_id}.srt"
+    rttm_path = config['OUTPUT_FOLDER'] / f"{meeting_id}.rttm"
+    speaker_srt_path = config['OUTPUT_FOLDER'] / f"{meeting_id}_speaker.srt"
+
+    if not intermediates_path.exists():
+        raise FileNotFoundError("此會議沒有保存語者辨識的中間結果，無法重新分群")
+    if not srt_path.exists():
+        raise FileNotFoundError("找不到此會議的字幕檔")
+
+    audio_processor.recluster(intermediates_path, rttm_path, num_speakers=num_speakers,
+                              threshold=threshold, uri=meeting_id)
+    actual_num_speakers = len(set(seg['speaker'] for seg in audio_processor.parse_rttm(rttm_path)))
+    audio_processor.merge_srt_with_speakers(srt_path, rttm_path, speaker_srt_path)
+
+    # 更新檢查點，之後的重試會沿用新的分群結果
+    save_stage_checkpoint(meeting_id, 'diarize', _describe_artifacts([rttm_path], base_dir),
+                          diarize_params(num_speakers, threshold), actual_num_speakers)
+    save_stage_checkpoint(meeting_id, 'merge', _describe_artifacts([speaker_srt_path], base_dir))
+    store_transcript_segments(meeting_id, speaker_srt_path)
+
+    update_meeting_status(meeting_id, 'completed', num_speakers=actual_num_speakers)
+    logger.info(f"會議 {meeting_id} 已重新分群，語者數量: {actual_num_speakers}")
+    return actual_num_speakers
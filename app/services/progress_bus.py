@@ -0,0 +1,82 @@
+import logging
+import queue
+import threading
+from collections import OrderedDict, defaultdict
+
+logger = logging.getLogger(__name__)
+
+# 代表處理結束的進度步驟
+TERMINAL_STEPS = ('completed', 'failed')
+
+class Subscription:
+    """單一 SSE 連線的訂閱，離開 with 區塊時自動取消訂閱。"""
+
+    def __init__(self, bus, meeting_id):
+        self.bus = bus
+        self.meeting_id = meeting_id
+        self.queue = queue.Queue()
+
+    def get(self, timeout=None):
+        """取得下一個進度事件，逾時則拋出 queue.Empty。"""
+        return self.queue.get(timeout=timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.bus.unsubscribe(self)
+
+class ProgressBus:
+    """
+    會議處理進度的廣播匯流排。
+
+    每個進度事件會送給該會議的所有訂閱者 (例如同時開啟的多個分頁)，
+    並保留每個會議最新的狀態，讓處理中途或結束後才連線的用戶端能立即取得目前進度。
+    """
+
+    def __init__(self, max_retained=1000):
+        self.max_retained = max_retained
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+        self._latest = OrderedDict()
+
+    def publish(self, meeting_id, event):
+        """發布進度事件給所有訂閱者，並記錄為該會議的最新狀態。"""
+        with self._lock:
+            self._latest[meeting_id] = event
+            self._latest.move_to_end(meeting_id)
+            while len(self._latest) > self.max_retained:
+                self._latest.popitem(last=False)
+            subscribers = list(self._subscribers.get(meeting_id, ()))
+
+        for subscription in subscribers:
+            subscription.queue.put(event)
+
+    def latest(self, meeting_id):
+        """獲取會議最新的進度事件，沒有記錄時返回 None。"""
+        with self._lock:
+            return self._latest.get(meeting_id)
+
+    def subscribe(self, meeting_id):
+        """
+        訂閱會議的進度事件。若已有最新狀態，會先放入訂閱佇列作為第一個事件。
+        """
+        subscription = Subscription(self, meeting_id)
+        with self._lock:
+            latest = self._latest.get(meeting_id)
+            if latest is not None:
+                subscription.queue.put(latest)
+            self._subscribers[meeting_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.meeting_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.meeting_id]
+
+    def subscriber_count(self, meeting_id):
+        with self._lock:
+            return len(self._subscribers.get(meeting_id, ()))
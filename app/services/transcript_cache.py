@@ -0,0 +1,179 @@
+import logging
+import sys
+import threading
+from collections import OrderedDict
+
+from utils.subtitle_processing import records_to_transcription, records_to_srt, build_segment_index
+
+logger = logging.getLogger(__name__)
+
+class TranscriptCache:
+    """
+    行程內的逐字稿快取 (LRU)。
+
+    以會議 ID 為鍵保存逐字稿片段記錄、片段的二分搜尋索引，以及第一次需要時才組合的逐字稿文字與下載用的字幕，
+    讓詳細頁面、摘要與下載等請求不必每次都重新讀取資料庫或解析字幕檔。
+    項目數超過 TRANSCRIPT_CACHE_MAX_ENTRIES 或估計記憶體用量超過 TRANSCRIPT_CACHE_MAX_MB 時，
+    淘汰最久未使用的會議。
+
+    發言者改名、重新處理 (含重新分群) 與刪除會議時，app.db 會在變更提交後呼叫 invalidate。
+    """
+
+    def __init__(self, app=None):
+        self.max_entries = 0
+        self.max_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        # 每次失效都會遞增；載入期間發生過失效時不寫入快取，避免保存已過期的資料
+        self._generation = 0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_entries = app.config['TRANSCRIPT_CACHE_MAX_ENTRIES']
+        self.max_bytes = app.config['TRANSCRIPT_CACHE_MAX_MB'] * 1024 * 1024
+        app.transcript_cache = self
+        # app.db 透過 extensions 找到快取，資料庫層不需要匯入服務模組
+        app.extensions['transcript_cache'] = self
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0 and self.max_bytes > 0
+
+    def get_records(self, meeting_id, loader):
+        """
+        取得會議的逐字稿片段記錄。
+
+        Args:
+            meeting_id (str): 會議 ID
+            loader (callable): 未命中時呼叫以載入片段記錄，返回 None 或空列表時不會被快取
+
+        Returns:
+            list: 片段記錄 (由所有請求共用，呼叫端不可修改)
+        """
+        with self._lock:
+            entry = self._entries.get(meeting_id)
+            if entry is not None:
+                self._entries.move_to_end(meeting_id)
+                self.hits += 1
+                return entry['records']
+            self.misses += 1
+            generation = self._generation
+
+        records = loader()
+        if records and self.enabled:
+            self._store(meeting_id, records, generation)
+        return records
+
+    def get_transcription(self, meeting_id, loader):
+        """取得組合後的逐字稿文字 (與片段記錄保存在同一個項目中)；沒有片段記錄時返回 None"""
+        records = self.get_records(meeting_id, loader)
+        if records is None:
+            return None
+        return self.transcription_of(meeting_id, records)
+
+    def transcription_of(self, meeting_id, records):
+        """取得已由 get_records 取得的片段記錄所組合的逐字稿文字，組合結果會保存在快取項目中"""
+        return self._derived(meeting_id, records, 'text', None, lambda: records_to_transcription(records))
+
+    def speaker_srt_of(self, meeting_id, records, speaker_names):
+        """取得已由 get_records 取得的片段記錄所組合、套用發言者名稱後的語者字幕 (下載用)"""
+        names_key = tuple(sorted(speaker_names.items())) if speaker_names else ()
+        return self._derived(meeting_id, records, 'speaker_srt', names_key,
+                             lambda: records_to_srt(records, speaker_names))
+
+    def _derived(self, meeting_id, records, name, key, build):
+        """取得由片段記錄衍生的內容；項目仍保存同一份記錄且 key 相同時直接返回，否則組合後保存"""
+        with self._lock:
+            entry = self._entries.get(meeting_id)
+            if entry is not None and entry['records'] is records:
+                cached = entry['derived'].get(name)
+                if cached is not None and cached[0] == key:
+                    return cached[1]
+
+        value = build()
+        with self._lock:
+            entry = self._entries.get(meeting_id)
+            # 組合期間項目可能已失效或被新的片段取代
+            if entry is not None and entry['records'] is records:
+                old = entry['derived'].get(name)
+                change = sys.getsizeof(value) - (sys.getsizeof(old[1]) if old is not None else 0)
+                entry['derived'][name] = (key, value)
+                entry['size'] += change
+                self._bytes += change
+                self._evict_locked()
+        return value
+
+    def segment_index_of(self, meeting_id, records):
+        """取得已由 get_records 取得的片段記錄的二分搜尋索引 (寫入快取時建立)；記錄未被快取時臨時建立"""
+        with self._lock:
+            entry = self._entries.get(meeting_id)
+            if entry is not None and entry['records'] is records:
+                return entry['index']
+        return build_segment_index(records)
+
+    def _store(self, meeting_id, records, generation):
+        index = build_segment_index(records)
+        size = _estimate_size(records) + sum(sys.getsizeof(values) for values in index.values())
+        if size > self.max_bytes:
+            logger.info(f"會議 {meeting_id} 的逐字稿 ({size / 1024 / 1024:.1f}MB) 超過快取上限，不予快取")
+            return
+        with self._lock:
+            if generation != self._generation:
+                return
+            old = self._entries.pop(meeting_id, None)
+            if old is not None:
+                self._bytes -= old['size']
+            self._entries[meeting_id] = {'records': records, 'index': index, 'derived': {}, 'size': size}
+            self._bytes += size
+            self._evict_locked()
+
+    def _evict_locked(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, entry = self._entries.popitem(last=False)
+            self._bytes -= entry['size']
+            self.evictions += 1
+
+    def invalidate(self, meeting_id):
+        """移除會議的快取項目 (片段或發言者名稱變更、會議刪除後呼叫)"""
+        with self._lock:
+            self._generation += 1
+            entry = self._entries.pop(meeting_id, None)
+            if entry is not None:
+                self._bytes -= entry['size']
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """快取統計：命中率、項目數與估計的記憶體用量"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+def _estimate_size(records):
+    """估計片段記錄佔用的記憶體 (列表、每個字典與其中的值)"""
+    size = sys.getsizeof(records)
+    for record in records:
+        size += sys.getsizeof(record) + sum(sys.getsizeof(value) for value in record.values())
+    return size
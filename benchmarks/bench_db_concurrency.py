@@ -0,0 +1,136 @@
+"""
+資料庫同時讀寫的效能比較：每次開新連線 + 預設日誌模式 (舊) vs. 連線池 + WAL (get_db)。
+
+模擬背景工作頻繁更新會議狀態，同時有多個請求讀取會議列表與逐字稿片段，
+每個操作都在獨立的 app context 中執行 (與請求/背景工作相同)，
+比較各模式的吞吐量、延遲與 "database is locked" 錯誤數。
+
+使用方式:
+    python -m benchmarks.bench_db_concurrency [秒數] [寫入執行緒數] [讀取執行緒數]
+"""
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from flask import Flask, current_app, g
+
+import app.db as db
+from app.db import (init_db, add_meeting, save_transcript_segments, update_meeting_status,
+                    get_meetings_page, count_meetings_by_status, get_transcript_segments)
+
+NUM_MEETINGS = 200
+SEGMENTS_PER_MEETING = 300
+
+
+def legacy_get_db():
+    """舊版實作：每個 app context 開啟新的連線，使用預設的 rollback journal"""
+    if 'db' not in g:
+        g.db = sqlite3.connect(current_app.config['DB_PATH'], detect_types=sqlite3.PARSE_DECLTYPES)
+        g.db.row_factory = sqlite3.Row
+    return g.db
+
+
+def legacy_close_db(e=None):
+    conn = g.pop('db', None)
+    if conn is not None:
+        conn.close()
+
+
+def make_app(legacy: bool) -> Flask:
+    app = Flask(__name__)
+    app.config['DB_PATH'] = Path(tempfile.mkdtemp()) / 'bench.db'
+    app.teardown_appcontext(legacy_close_db if legacy else db.close_db)
+    with app.app_context():
+        init_db()
+        if legacy:
+            conn = sqlite3.connect(app.config['DB_PATH'])
+            conn.execute('PRAGMA journal_mode=DELETE')
+            conn.close()
+        rng = random.Random(0)
+        for m in range(NUM_MEETINGS):
+            meeting_id = f"meeting-{m:04d}"
+            add_meeting(meeting_id, f"{meeting_id}.mp3", f"{meeting_id}.mp3")
+            save_transcript_segments(meeting_id, [{
+                'index': i + 1, 'start': i * 3.0, 'end': i * 3.0 + 2.5,
+                'speaker': f"發言者{rng.randrange(4):02d}", 'content': '今天我們討論專案進度與客戶需求',
+                'original_content': '[發言者00]: 今天我們討論專案進度與客戶需求'
+            } for i in range(SEGMENTS_PER_MEETING)])
+    return app
+
+
+def run(legacy: bool, duration: float, writers: int, readers: int) -> dict:
+    app = make_app(legacy)
+    stop = threading.Event()
+    results = {'write': [], 'read': [], 'errors': 0}
+    lock = threading.Lock()
+
+    def worker(kind, seed):
+        rng = random.Random(seed)
+        latencies, errors = [], 0
+        while not stop.is_set():
+            meeting_id = f"meeting-{rng.randrange(NUM_MEETINGS):04d}"
+            t0 = time.perf_counter()
+            try:
+                with app.app_context():
+                    if kind == 'write':
+                        update_meeting_status(meeting_id, rng.choice(('processing', 'completed')))
+                    else:
+                        get_meetings_page(limit=20)
+                        count_meetings_by_status()
+                        get_transcript_segments(meeting_id)
+            except sqlite3.OperationalError as e:
+                if 'locked' not in str(e):
+                    raise
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - t0)
+        with lock:
+            results[kind].extend(latencies)
+            results['errors'] += errors
+
+    original = db.get_db
+    if legacy:
+        db.get_db = legacy_get_db
+    try:
+        threads = [threading.Thread(target=worker, args=('write', i)) for i in range(writers)]
+        threads += [threading.Thread(target=worker, args=('read', 100 + i)) for i in range(readers)]
+        for thread in threads:
+            thread.start()
+        time.sleep(duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+    finally:
+        db.get_db = original
+    return results
+
+
+def _summary(latencies: list, duration: float) -> str:
+    if not latencies:
+        return f"{0:>10.0f} {'-':>10} {'-':>10}"
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1] if len(latencies) >= 20 else latencies[-1]
+    return f"{len(latencies) / duration:>10.0f} {statistics.median(latencies) * 1000:>10.2f} {p95 * 1000:>10.2f}"
+
+
+def main():
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 5.0
+    writers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    readers = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+
+    print(f"{writers} 個寫入執行緒、{readers} 個讀取執行緒，各模式執行 {duration:.0f} 秒")
+    print(f"{'mode':<16} {'op':<6} {'ops/s':>10} {'p50 (ms)':>10} {'p95 (ms)':>10}")
+    for label, legacy in (('new conn+DELETE', True), ('pool+WAL', False)):
+        results = run(legacy, duration, writers, readers)
+        for kind in ('write', 'read'):
+            print(f"{label:<16} {kind:<6} {_summary(results[kind], duration)}")
+        print(f"{label:<16} locked errors: {results['errors']}")
+
+
+if __name__ == '__main__':
+    main()
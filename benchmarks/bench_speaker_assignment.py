@@ -0,0 +1,94 @@
+"""
+字幕語者指派的效能比較：逐一掃描 (舊) vs. 區間索引 (assign_speakers)。
+
+以合成的 RTTM 片段與字幕測試不同規模 (包含少數橫跨整段錄音的長片段)，並確認兩者輸出完全相同。
+
+使用方式:
+    python -m benchmarks.bench_speaker_assignment
+"""
+import random
+import time
+
+from utils.speaker_assignment import assign_speakers
+
+
+def find_best_speaker_naive(seg_start: float, seg_end: float, diarization_segments: list) -> str:
+    """舊版實作：對每個字幕掃描所有 RTTM 片段"""
+    best, best_overlap = None, 0.0
+    for d in diarization_segments:
+        overlap_start = max(seg_start, d['start'])
+        overlap_end = min(seg_end, d['end'])
+        overlap = max(0.0, overlap_end - overlap_start)
+        if overlap > best_overlap:
+            best_overlap = overlap
+            best = d['speaker']
+    return best or "unknown"
+
+
+def make_synthetic_meeting(num_turns: int, num_subtitles: int, num_speakers: int = 6, seed: int = 0,
+                           long_turns: int = 0):
+    """產生合成的語者片段 (含重疊發言與空白) 與字幕時間；long_turns 為橫跨幾乎整段錄音的片段數"""
+    rng = random.Random(seed)
+    segments = []
+    t = 0.0
+    for _ in range(num_turns):
+        t += rng.uniform(0.0, 1.5)
+        duration = rng.uniform(0.3, 12.0)
+        segments.append({
+            'start': round(t, 3),
+            'end': round(t + duration, 3),
+            'speaker': f"SPEAKER_{rng.randrange(num_speakers):02d}",
+        })
+        # 約 15% 的片段與下一段重疊
+        t += duration * (0.7 if rng.random() < 0.15 else 1.0)
+
+    total = t
+    for i in range(long_turns):
+        segments.insert(rng.randrange(len(segments) + 1), {
+            'start': round(i * 5.0, 3),
+            'end': round(total - i, 3),
+            'speaker': f"SPEAKER_{rng.randrange(num_speakers):02d}",
+        })
+
+    starts, ends = [], []
+    step = total / num_subtitles
+    for i in range(num_subtitles):
+        start = i * step + rng.uniform(0.0, step * 0.2)
+        starts.append(round(start, 3))
+        ends.append(round(start + rng.uniform(0.5, step), 3))
+    return segments, starts, ends
+
+
+def _time(func, repeat: int = 3) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    # (片段數, 字幕數, 長片段數)
+    sizes = [(100, 150, 0), (1000, 1500, 0), (3000, 4500, 0), (5000, 7500, 0), (3000, 6000, 5)]
+    print(f"{'turns':>8} {'subs':>8} {'long':>5} {'naive (s)':>12} {'indexed (s)':>12} {'speedup':>9}")
+    for num_turns, num_subs, long_turns in sizes:
+        segments, starts, ends = make_synthetic_meeting(num_turns, num_subs, long_turns=long_turns)
+
+        naive_result = []
+        indexed_result = []
+
+        def run_naive():
+            naive_result[:] = [find_best_speaker_naive(s, e, segments) for s, e in zip(starts, ends)]
+
+        def run_indexed():
+            indexed_result[:] = assign_speakers(starts, ends, segments)
+
+        naive_time = _time(run_naive, repeat=1 if num_turns > 1000 else 3)
+        indexed_time = _time(run_indexed)
+        assert naive_result == indexed_result, "兩種實作的輸出不一致"
+        print(f"{num_turns:>8} {num_subs:>8} {long_turns:>5} {naive_time:>12.4f} {indexed_time:>12.4f} {naive_time / indexed_time:>8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
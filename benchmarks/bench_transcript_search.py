@@ -0,0 +1,112 @@
+"""
+逐字稿全文搜尋 (FTS5) 的查詢延遲測試。
+
+以合成的會議逐字稿建立索引 (預設 1000 場、每場 1 小時、約 700 個片段)，
+詞頻依 Zipf 分佈，測量最常見詞、一般詞、少見詞、多關鍵字與英文關鍵字的查詢時間。
+
+使用方式:
+    python -m benchmarks.bench_transcript_search [會議數量] [排序候選上限]
+"""
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from flask import Flask
+
+from app.db import init_db, add_meeting, save_transcript_segments, search_transcripts
+from utils.search_text import build_match_query
+
+VOCABULARY = [
+    '今天', '我們', '討論', '專案', '進度', '客戶', '需求', '預算', '時程', '測試', '上線', '問題',
+    '會議', '報告', '設計', '系統', '資料', '分析', '確認', '下週', '負責', '處理', '結果', '方案',
+    'API', 'deadline', 'release', 'bug', 'demo', 'sprint', 'review', 'server',
+]
+RARE_WORDS = ['Acme', '星河計畫', '東京分公司', 'Kubernetes']
+COMMON_CHARS = '的一是不了人我在有他這中大來上國個到說們為子和你地出道也時年得就那要下以生會自著去之過家學對可她裡後小麼心多天而能好都然沒日於起還發成事只作當想看文無開手十用主行方又如前所本見經頭面公同三已老從動兩長'
+
+
+def make_vocabulary(rng: random.Random, size: int = 3000) -> tuple:
+    """產生詞彙表與 Zipf 權重 (排名越前面的詞越常出現)"""
+    words = list(VOCABULARY)
+    seen = set(words)
+    while len(words) < size:
+        word = ''.join(rng.choices(COMMON_CHARS, k=2))
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    weights = [1.0 / (rank + 1) for rank in range(len(words))]
+    return words, weights
+
+
+def make_segments(rng: random.Random, num_segments: int, vocabulary: tuple) -> list:
+    words_list, weights = vocabulary
+    segments = []
+    t = 0.0
+    for i in range(num_segments):
+        duration = rng.uniform(2.0, 8.0)
+        words = rng.choices(words_list, weights=weights, k=rng.randint(4, 14))
+        if rng.random() < 0.001:
+            words.insert(rng.randrange(len(words)), rng.choice(RARE_WORDS))
+        content = ''.join(f' {w} ' if w.isascii() else w for w in words).strip()
+        speaker = f"發言者{rng.randrange(6):02d}"
+        segments.append({
+            'index': i + 1,
+            'start': round(t, 3),
+            'end': round(t + duration, 3),
+            'speaker': speaker,
+            'content': content,
+            'original_content': f"[{speaker}]: {content}",
+        })
+        t += duration
+    return segments
+
+
+def _time(func, repeat: int = 20) -> list:
+    timings = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - t0)
+    return timings
+
+
+def main():
+    num_meetings = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    max_candidates = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    segments_per_meeting = 700
+
+    app = Flask(__name__)
+    app.config['DB_PATH'] = Path(tempfile.mkdtemp()) / 'bench.db'
+    rng = random.Random(0)
+    vocabulary = make_vocabulary(rng)
+
+    with app.app_context():
+        init_db()
+        t0 = time.perf_counter()
+        for m in range(num_meetings):
+            meeting_id = f"meeting-{m:05d}"
+            add_meeting(meeting_id, f"{meeting_id}.mp3", f"{meeting_id}.mp3")
+            save_transcript_segments(meeting_id, make_segments(rng, segments_per_meeting, vocabulary))
+        print(f"已建立 {num_meetings} 場會議 / {num_meetings * segments_per_meeting} 個片段的索引 "
+              f"({time.perf_counter() - t0:.1f} 秒)")
+
+        # 今天 為出現頻率最高的詞 (最差情況)，客戶 與 預算 屬於常見詞
+        queries = ['今天', '客戶', 'Acme', '星河計畫', '預算 時程', 'release bug', '東京分公司 客戶']
+        print(f"{'query':<16} {'hits':>6} {'median (ms)':>12} {'p95 (ms)':>10}")
+        for query in queries:
+            match_query = build_match_query(query)
+            hits = []
+
+            def run():
+                hits[:] = search_transcripts(match_query, limit=20, max_candidates=max_candidates)
+
+            timings = sorted(_time(run))
+            p95 = timings[int(len(timings) * 0.95) - 1]
+            print(f"{query:<16} {len(hits):>6} {statistics.median(timings) * 1000:>12.2f} {p95 * 1000:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
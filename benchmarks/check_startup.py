@@ -0,0 +1,92 @@
+"""
+應用程式啟動時間檢查。
+
+在乾淨的子行程中計時 `import app` 與 `create_app()`，期間禁止載入重量級套件
+(torch、pyannote、openai、PyMuPDF、python-docx、python-pptx)：任何一個在啟動時被匯入都會直接失敗，
+總時間超過預算 (預設 2 秒) 也會以非零狀態結束，可放在部署或 CI 流程中執行。
+
+使用方式:
+    python -m benchmarks.check_startup [預算秒數]
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+# 啟動時不應載入的套件 (都改為第一次使用時才匯入)
+HEAVY_MODULES = ('torch', 'pyannote', 'openai', 'fitz', 'pymupdf', 'docx', 'pptx')
+
+# 在子行程中執行：阻擋重量級套件後計時建立應用程式
+CHILD_SCRIPT = r'''
+import importlib.abc
+import json
+import sys
+import time
+from pathlib import Path
+
+heavy = tuple(sys.argv[1].split(","))
+blocked = []
+
+class BlockHeavyModules(importlib.abc.MetaPathFinder):
+    def find_spec(self, name, path=None, target=None):
+        if name.split(".")[0] in heavy:
+            blocked.append(name)
+            raise ImportError(f"啟動時不應匯入 {name}")
+        return None
+
+sys.meta_path.insert(0, BlockHeavyModules())
+work_dir = Path(sys.argv[2])
+
+t0 = time.perf_counter()
+from config import Config
+from app import create_app
+
+class StartupConfig(Config):
+    DB_PATH = work_dir / "startup.db"
+    UPLOADS_FOLDER = work_dir / "uploads"
+    PROCESSED_FOLDER = work_dir / "processed"
+    OUTPUT_FOLDER = work_dir / "output"
+    ARTIFACT_CACHE_FOLDER = work_dir / "cache"
+
+t1 = time.perf_counter()
+create_app(StartupConfig)
+t2 = time.perf_counter()
+print(json.dumps({"import": t1 - t0, "create_app": t2 - t1, "blocked": blocked}))
+'''
+
+
+def main():
+    budget = float(sys.argv[1]) if len(sys.argv) > 1 else 2.0
+    root = Path(__file__).resolve().parent.parent
+    env = dict(os.environ)
+    env.setdefault('HF_TOKEN', 'startup-check')
+    env.setdefault('OPENAI_API_KEY', 'startup-check')
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [str(root), env.get('PYTHONPATH')]))
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        result = subprocess.run(
+            [sys.executable, '-c', CHILD_SCRIPT, ','.join(HEAVY_MODULES), work_dir],
+            cwd=root, env=env, capture_output=True, text=True
+        )
+    if result.returncode != 0:
+        print(result.stderr, file=sys.stderr)
+        print("啟動失敗 (可能在啟動時匯入了重量級套件)")
+        sys.exit(1)
+
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    total = timings['import'] + timings['create_app']
+    print(f"import app: {timings['import'] * 1000:.0f} ms, create_app(): {timings['create_app'] * 1000:.0f} ms, "
+          f"合計 {total * 1000:.0f} ms (預算 {budget * 1000:.0f} ms)")
+    if timings['blocked']:
+        print(f"啟動時嘗試匯入重量級套件: {', '.join(sorted(set(timings['blocked'])))}")
+        sys.exit(1)
+    if total > budget:
+        print("啟動時間超過預算")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == '__main__':
+    main()
@@ -26,10 +26,70 @@ class Config:
     AZURE_OPENAI_API_VERSION = os.getenv("AZURE_OPENAI_API_VERSION", "2024-05-01-preview")
     AZURE_OPENAI_MODEL = os.getenv("AZURE_OPENAI_MODEL", "gpt-4o-mini")
 
+    # Whisper 分段轉錄設定
+    WHISPER_MAX_FILE_SIZE_MB = 25
+    TRANSCRIPTION_MAX_WORKERS = int(os.getenv("TRANSCRIPTION_MAX_WORKERS", 4))
+    TRANSCRIPTION_MAX_RETRIES = int(os.getenv("TRANSCRIPTION_MAX_RETRIES", 3))
+    # 單次 Whisper 請求的逾時 (秒)
+    TRANSCRIPTION_TIMEOUT_SECONDS = float(os.getenv("TRANSCRIPTION_TIMEOUT_SECONDS", 600))
+
+    # 摘要 LLM 呼叫設定 (同時請求數上限、每分鐘請求數上限、失敗重試次數)
+    LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o-mini")
+    LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 4))
+    LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", 300))
+    LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 3))
+    # 單次請求逾時 (秒) 與連線池大小 (保持連線重複使用，避免每次請求重新握手)
+    LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", 120))
+    LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", 20))
+
+    # 長會議摘要：單次請求的逐字稿估計 token 上限，超過時改為分段摘要再合併 (map-reduce)
+    SUMMARY_MAX_INPUT_TOKENS = int(os.getenv("SUMMARY_MAX_INPUT_TOKENS", 16000))
+    SUMMARY_CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", 4000))
+
+    # LLM 回應快取 (相同的模型、參數與提示直接返回先前的回應；大小設為 0 可停用)
+    LLM_CACHE_MAX_MB = int(os.getenv("LLM_CACHE_MAX_MB", 64))
+    LLM_CACHE_TTL_HOURS = int(os.getenv("LLM_CACHE_TTL_HOURS", 24 * 7))
+
+    # 行程內的逐字稿快取 (解析後的片段與逐字稿文字，依最近使用淘汰；任一上限設為 0 可停用)
+    TRANSCRIPT_CACHE_MAX_ENTRIES = int(os.getenv("TRANSCRIPT_CACHE_MAX_ENTRIES", 64))
+    TRANSCRIPT_CACHE_MAX_MB = int(os.getenv("TRANSCRIPT_CACHE_MAX_MB", 64))
+
+    # 背景工作佇列設定 (同時處理的會議數量上限)
+    JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))
+    JOB_POLL_INTERVAL = 5
+    # 建立 app 時即啟動 worker 並接手中斷的工作 (設為 0 則延到第一次排入工作時才啟動)
+    JOB_QUEUE_AUTOSTART = os.getenv("JOB_QUEUE_AUTOSTART", "1") != "0"
+    # 執行中工作的心跳間隔；超過 JOB_STALE_SECONDS 沒有心跳的工作視為擁有者已結束，會重新排入佇列
+    JOB_HEARTBEAT_INTERVAL = int(os.getenv("JOB_HEARTBEAT_INTERVAL", 30))
+    JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", 120))
+
+    # 會議列表每頁筆數
+    MEETINGS_PAGE_SIZE = 20
+
+    # 逐字稿搜尋時參與相關度排序的命中片段上限 (限制常見詞的查詢時間)
+    SEARCH_MAX_CANDIDATES = int(os.getenv("SEARCH_MAX_CANDIDATES", 5000))
+
+    # SSE 進度串流的心跳間隔 (秒)
+    SSE_HEARTBEAT_INTERVAL = 15
+
+    # 逐字稿與下載回應超過此大小 (bytes) 且用戶端支援時以 gzip 壓縮
+    HTTP_GZIP_MIN_BYTES = int(os.getenv("HTTP_GZIP_MIN_BYTES", 1024))
+    HTTP_GZIP_LEVEL = 6
+
     # 資料庫檔案路徑
     DB_PATH = BASE_DIR / "meeting_assistant.db"
+    # 資料庫連線池大小 (請求與背景工作共用)，以及等待空閒連線的時間 (秒)，逾時則開啟額外的連線
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 8))
+    DB_POOL_TIMEOUT = 1
+    # 遇到寫入鎖時的等待上限 (毫秒) 與每個連線的頁面快取大小 (KB)
+    DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", 5000))
+    DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", 16 * 1024))
 
     # 資料夾路徑設定
     UPLOADS_FOLDER = BASE_DIR / "app" / "static" / "uploads"
     PROCESSED_FOLDER = BASE_DIR / "app" / "static" / "processed"
     OUTPUT_FOLDER = BASE_DIR / "app" / "static" / "output"
+
+    # 重複上傳的處理結果快取 (設為 0 可停用)
+    ARTIFACT_CACHE_FOLDER = BASE_DIR / "cache" / "artifacts"
+    ARTIFACT_CACHE_MAX_MB = int(os.getenv("ARTIFACT_CACHE_MAX_MB", 1024))
@@ -1,5 +1,11 @@
+import os
+
 from app import create_app
 
+if __name__ == "__main__":
+    # 讓 create_app 得知將以 debug 模式 (含 reloader) 執行，背景工作佇列只在 reloader 子行程啟動
+    os.environ.setdefault('FLASK_DEBUG', '1')
+
 # 透過應用程式工廠建立 app 實例
 app = create_app()
 
@@ -1,23 +1,58 @@
 import os
+import re
+import copy
 import subprocess
 import logging
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
 from pathlib import Path
-from openai import OpenAI
-from pyannote.audio import Pipeline
-import torch
+import numpy as np
 import srt
 
+from utils.llm_provider import get_provider
+from utils.speaker_assignment import assign_speakers
+
 logger = logging.getLogger(__name__)
 
+# Whisper API 單一檔案上傳上限 (MB)
+WHISPER_MAX_FILE_SIZE_MB = 25
+# 單次 Whisper 請求的逾時 (秒)：接近上傳上限的檔案需要較長的上傳與處理時間，不沿用摘要請求的逾時
+WHISPER_TIMEOUT_SECONDS = 600
+
 class AudioProcessor:
-    def __init__(self, hf_token: str, openai_client: OpenAI):
+    """
+    音訊前處理、Whisper 轉錄與 pyannote 語者辨識。
+
+    torch / pyannote 與 openai 都在第一次使用時才載入，建立物件 (應用程式啟動) 不會匯入這些套件。
+    """
+
+    def __init__(self, hf_token: str, openai_client=None, llm_provider=None,
+                 transcription_timeout: float = WHISPER_TIMEOUT_SECONDS):
         self.hf_token = hf_token
-        self.openai_client = openai_client
+        self._openai_client = openai_client
+        self.llm_provider = llm_provider
+        self.transcription_timeout = transcription_timeout
         self.diarization_pipeline = None
 
+    @property
+    def openai_client(self):
+        """Whisper 使用的 OpenAI 用戶端，未指定時沿用 LLMProvider 共用的用戶端 (與摘要共用連線池)"""
+        if self._openai_client is None:
+            self._openai_client = (self.llm_provider or get_provider()).client
+        return self._openai_client
+
+    @openai_client.setter
+    def openai_client(self, client):
+        self._openai_client = client
+
     def _init_diarization_model(self):
         """延遲初始化語者辨識模型"""
         if self.diarization_pipeline is None:
+            import torch
+            from pyannote.audio import Pipeline
+
             logger.info("載入 pyannote.audio 語者辨識模型...")
             self.diarization_pipeline = Pipeline.from_pretrained(
                 "pyannote/speaker-diarization-3.1",
@@ -75,39 +110,311 @@ class AudioProcessor:
         subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
         logger.info(f"已轉換為 wav: {output_path.name}")
 
-    def transcribe_audio(self, audio_path: Path) -> str:
-        """使用 Whisper API 進行語音轉文字"""
+    def preprocess_audio(self, input_path: Path, compressed_path: Path, wav_path: Path) -> float:
+        """
+        單次解碼同時產生 Whisper 用的 16kHz 單聲道 opus 檔與語者辨識用的 WAV 檔。
+
+        先以 ffprobe 取得長度 (同時決定壓縮位元率)，再讓 ffmpeg 只解碼一次來源，
+        經由 asplit 分流寫出兩個輸出。若來源本身即為 webm，則直接複製並只輸出 WAV。
+
+        Returns:
+            float: 音訊長度（秒）
+        """
+        duration = self.get_audio_duration(input_path)
+        filter_graph = "[0:a]aformat=sample_rates=16000:channel_layouts=mono"
+
+        if input_path.suffix.lower() == ".webm":
+            shutil.copy(input_path, compressed_path)
+            cmd = [
+                "ffmpeg", "-y", "-i", str(input_path),
+                "-filter_complex", f"{filter_graph}[wav]",
+                "-map", "[wav]", str(wav_path)
+            ]
+        else:
+            bitrate = self._get_bitrate_by_duration(duration)
+            cmd = [
+                "ffmpeg", "-y", "-i", str(input_path),
+                "-filter_complex", f"{filter_graph},asplit=2[opus][wav]",
+                "-map", "[opus]", "-c:a", "libopus", "-b:a", bitrate, str(compressed_path),
+                "-map", "[wav]", str(wav_path)
+            ]
+        subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        logger.info(f"預處理完成: {compressed_path.name}, {wav_path.name} (長度: {duration:.1f} 秒)")
+        return duration
+
+    def _request_transcription(self, audio_path: Path) -> str:
+        """呼叫 Whisper API 取得 SRT 字幕，失敗時直接拋出例外"""
+        # 共用用戶端的逾時是為摘要請求設定的，Whisper 請求改用自己的逾時 (仍共用同一個連線池)
+        client = self.openai_client.with_options(timeout=self.transcription_timeout)
+        with open(audio_path, "rb") as audio_file:
+            return client.audio.transcriptions.create(
+                model="whisper-1",
+                file=audio_file,
+                response_format="srt"
+            )
+
+    def transcribe_audio(self, audio_path: Path, max_retries: int = 3) -> str:
+        """使用 Whisper API 進行語音轉文字，失敗時以指數退避重試"""
         try:
-            with open(audio_path, "rb") as audio_file:
-                transcript = self.openai_client.audio.transcriptions.create(
-                    model="whisper-1",
-                    file=audio_file,
-                    response_format="srt"
-                )
-            return transcript
+            return self._transcribe_with_retry(audio_path, max_retries)
         except Exception as e:
             logger.error(f"Whisper 轉錄失敗 [{audio_path}]: {e}")
             return ""
 
-    def diarize_audio(self, audio_path: Path, rttm_output_path: Path, num_speakers: int = None):
-        """執行語者辨識"""
+    def detect_silences(self, input_path: Path, noise_db: int = -30, min_silence: float = 0.5) -> list:
+        """使用 ffmpeg silencedetect 找出靜音區間，回傳 [(開始秒數, 結束秒數), ...]"""
+        cmd = [
+            "ffmpeg", "-hide_banner", "-nostats", "-i", str(input_path),
+            "-af", f"silencedetect=noise={noise_db}dB:d={min_silence}",
+            "-f", "null", "-"
+        ]
+        result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True)
+        output = result.stderr.decode("utf-8", errors="ignore")
+
+        silences = []
+        silence_start = None
+        for line in output.splitlines():
+            start_match = re.search(r"silence_start: (-?[\d.]+)", line)
+            if start_match:
+                silence_start = max(0.0, float(start_match.group(1)))
+                continue
+            end_match = re.search(r"silence_end: ([\d.]+)", line)
+            if end_match and silence_start is not None:
+                silences.append((silence_start, float(end_match.group(1))))
+                silence_start = None
+        return silences
+
+    def _plan_split_points(self, duration: float, silences: list, max_segment_seconds: float) -> list:
+        """
+        在不超過 max_segment_seconds 的前提下，盡量選擇靜音區間的中點作為切割點。
+        若某段範圍內沒有靜音，則直接在上限處硬切。
+        """
+        candidates = sorted((start + end) / 2 for start, end in silences)
+        split_points = []
+        segment_start = 0.0
+        while duration - segment_start > max_segment_seconds:
+            limit = segment_start + max_segment_seconds
+            # 選擇上限之前最後一個靜音點，但避免產生過短的片段
+            usable = [c for c in candidates if segment_start + max_segment_seconds * 0.5 < c <= limit]
+            split_at = usable[-1] if usable else limit
+            split_points.append(split_at)
+            segment_start = split_at
+        return split_points
+
+    def split_audio(self, input_path: Path, output_dir: Path, split_points: list, duration: float) -> list:
+        """依切割點將音訊切成多段 (不重新編碼)，回傳 [(片段路徑, 起始秒數), ...]"""
+        output_dir.mkdir(parents=True, exist_ok=True)
+        boundaries = [0.0] + list(split_points) + [duration]
+        segments = []
+        for i, (start, end) in enumerate(zip(boundaries[:-1], boundaries[1:])):
+            segment_path = output_dir / f"segment_{i:03d}{input_path.suffix}"
+            cmd = [
+                "ffmpeg", "-y", "-ss", f"{start:.3f}", "-i", str(input_path),
+                "-t", f"{end - start:.3f}", "-c", "copy",
+                str(segment_path)
+            ]
+            subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            segments.append((segment_path, start))
+        logger.info(f"已將 {input_path.name} 切割為 {len(segments)} 個片段")
+        return segments
+
+    def _transcribe_with_retry(self, audio_path: Path, max_retries: int) -> str:
+        """轉錄單一檔案 (整段音訊或分段後的片段)，失敗時以指數退避重試，只重送該檔案"""
+        max_retries = max(1, max_retries)
+        for attempt in range(1, max_retries + 1):
+            try:
+                return self._request_transcription(audio_path)
+            except Exception as e:
+                if attempt == max_retries:
+                    logger.error(f"轉錄失敗，已重試 {max_retries} 次 [{audio_path.name}]: {e}")
+                    raise
+                wait_seconds = 2 ** (attempt - 1)
+                logger.warning(f"轉錄失敗 [{audio_path.name}] (第 {attempt} 次)，{wait_seconds} 秒後重試: {e}")
+                time.sleep(wait_seconds)
+
+    def _stitch_srt_segments(self, srt_texts: list, offsets: list) -> str:
+        """依各片段的起始時間平移字幕並重新編號，合併為單一 SRT"""
+        merged = []
+        for srt_text, offset in zip(srt_texts, offsets):
+            shift = timedelta(seconds=offset)
+            for sub in srt.parse(srt_text):
+                sub.start += shift
+                sub.end += shift
+                merged.append(sub)
+        return srt.compose(merged, reindex=True, start_index=1)
+
+    def transcribe_audio_chunked(self, audio_path: Path, work_dir: Path, duration: float = None,
+                                 max_file_size_mb: float = WHISPER_MAX_FILE_SIZE_MB,
+                                 max_workers: int = 4, max_retries: int = 3) -> str:
+        """
+        分段平行轉錄超過 Whisper 檔案大小限制的音訊。
+
+        音訊會在靜音處切割成小於上限的片段，以有限數量的執行緒同時上傳，
+        最後依時間偏移合併字幕並重新編號。任一片段失敗只會重試該片段。
+        """
+        if duration is None:
+            duration = self.get_audio_duration(audio_path)
+        if duration <= 0:
+            raise ValueError(f"無法取得音檔長度，無法分段轉錄: {audio_path}")
+
+        file_size_mb = audio_path.stat().st_size / (1024 * 1024)
+        # 保留 10% 餘裕，避免容器額外開銷使片段超過上限
+        max_segment_seconds = duration * (max_file_size_mb * 0.9) / file_size_mb
+
+        silences = self.detect_silences(audio_path)
+        split_points = self._plan_split_points(duration, silences, max_segment_seconds)
+
+        try:
+            segments = self.split_audio(audio_path, work_dir, split_points, duration)
+            paths = [path for path, _ in segments]
+            offsets = [offset for _, offset in segments]
+
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                srt_texts = list(executor.map(
+                    lambda path: self._transcribe_with_retry(path, max_retries), paths
+                ))
+
+            logger.info(f"分段轉錄完成: {audio_path.name} ({len(segments)} 個片段)")
+            return self._stitch_srt_segments(srt_texts, offsets)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def diarize_audio(self, audio_path: Path, rttm_output_path: Path, num_speakers: int = None,
+                      intermediates_path: Path = None):
+        """
+        執行語者辨識。
+
+        若指定 intermediates_path，會一併保存分段 (segmentation)、語者計數與語者嵌入向量，
+        之後可透過 recluster 以不同的語者數量重新分群，不必重跑模型。
+        """
         try:
             logger.info(f"開始語者辨識: {audio_path.name}")
             self._init_diarization_model()
-            
+
+            captured = {}
+
+            def capture_intermediates(step_name, step_artifact, file=None, total=None, completed=None):
+                # 只保留各步驟的最終結果 (帶有 completed 的是批次進度回報)
+                if completed is None and step_artifact is not None:
+                    captured[step_name] = copy.deepcopy(step_artifact)
+
+            hook = capture_intermediates if intermediates_path else None
             if num_speakers and num_speakers > 0:
-                diarization = self.diarization_pipeline(str(audio_path), num_speakers=num_speakers)
+                diarization = self.diarization_pipeline(str(audio_path), num_speakers=num_speakers, hook=hook)
             else:
-                diarization = self.diarization_pipeline(str(audio_path))
-                
+                diarization = self.diarization_pipeline(str(audio_path), hook=hook)
+
             with open(rttm_output_path, "w", encoding="utf-8") as f:
                 diarization.write_rttm(f)
             logger.info(f"RTTM 已儲存: {rttm_output_path.name}")
+
+            if intermediates_path:
+                self._save_diarization_intermediates(intermediates_path, captured)
             return diarization
         except Exception as e:
             logger.error(f"語者辨識失敗 [{audio_path}]: {e}")
             raise e
 
+    def _save_diarization_intermediates(self, output_path: Path, captured: dict):
+        """保存語者辨識的中間結果 (npz)，缺少任一步驟時略過"""
+        required = ('segmentation', 'speaker_counting', 'embeddings')
+        if not all(step in captured for step in required):
+            logger.warning(f"語者辨識中間結果不完整，略過保存: {sorted(captured)}")
+            return
+
+        segmentation = captured['segmentation']
+        count = captured['speaker_counting']
+        seg_window = segmentation.sliding_window
+        count_window = count.sliding_window
+        # np.savez 會自動補上 .npz 副檔名，先寫到暫存檔再改名以避免讀到寫一半的檔案
+        tmp_path = output_path.with_name(output_path.stem + '.tmp.npz')
+        np.savez_compressed(
+            tmp_path,
+            segmentation=segmentation.data,
+            segmentation_window=np.array([seg_window.start, seg_window.duration, seg_window.step]),
+            count=count.data,
+            count_window=np.array([count_window.start, count_window.duration, count_window.step]),
+            embeddings=captured['embeddings']
+        )
+        tmp_path.replace(output_path)
+        logger.info(f"語者辨識中間結果已儲存: {output_path.name}")
+
+    def recluster(self, intermediates_path: Path, rttm_output_path: Path, num_speakers: int = None,
+                  threshold: float = None, uri: str = None):
+        """
+        使用已保存的分段與嵌入向量，只重新執行分群步驟並輸出新的 RTTM。
+
+        對應 pyannote SpeakerDiarization.apply 中分群之後的流程，
+        因此只需數秒，不必重新執行分段與嵌入模型。
+
+        Args:
+            intermediates_path (Path): diarize_audio 保存的中間結果
+            rttm_output_path (Path): 新 RTTM 輸出路徑
+            num_speakers (int): 指定語者數量 (None 表示自動判斷)
+            threshold (float): 自訂分群門檻 (None 表示沿用模型預設值)
+            uri (str): RTTM 中的檔案識別名稱
+        """
+        from pyannote.audio.utils.signal import binarize
+        from pyannote.core import SlidingWindow, SlidingWindowFeature
+
+        self._init_diarization_model()
+        pipeline = self.diarization_pipeline
+
+        with np.load(intermediates_path) as data:
+            seg_start, seg_duration, seg_step = data['segmentation_window']
+            segmentations = SlidingWindowFeature(
+                data['segmentation'],
+                SlidingWindow(start=seg_start, duration=seg_duration, step=seg_step)
+            )
+            count_start, count_duration, count_step = data['count_window']
+            count = SlidingWindowFeature(
+                data['count'],
+                SlidingWindow(start=count_start, duration=count_duration, step=count_step)
+            )
+            embeddings = data['embeddings']
+
+        if num_speakers is not None and num_speakers <= 0:
+            num_speakers = None
+        num_speakers, min_speakers, max_speakers = pipeline.set_num_speakers(num_speakers=num_speakers)
+
+        if pipeline._segmentation.model.specifications.powerset:
+            binarized_segmentations = segmentations
+        else:
+            binarized_segmentations = binarize(segmentations, onset=pipeline.segmentation.threshold, initial_state=False)
+
+        clustering = pipeline.clustering
+        if threshold is not None:
+            # 複製分群器以免影響共用 pipeline 的設定
+            clustering = copy.deepcopy(pipeline.clustering)
+            clustering.threshold = threshold
+
+        hard_clusters, _, _ = clustering(
+            embeddings=embeddings,
+            segmentations=binarized_segmentations,
+            num_clusters=num_speakers,
+            min_clusters=min_speakers,
+            max_clusters=max_speakers,
+        )
+
+        count.data = np.minimum(count.data, max_speakers).astype(np.int8)
+        inactive_speakers = np.sum(binarized_segmentations.data, axis=1) == 0
+        hard_clusters[inactive_speakers] = -2
+        discrete_diarization = pipeline.reconstruct(segmentations, hard_clusters, count)
+
+        diarization = pipeline.to_annotation(
+            discrete_diarization,
+            min_duration_on=0.0,
+            min_duration_off=pipeline.segmentation.min_duration_off,
+        )
+        diarization.uri = uri or intermediates_path.stem
+        mapping = {label: expected for label, expected in zip(diarization.labels(), pipeline.classes())}
+        diarization = diarization.rename_labels(mapping=mapping)
+
+        with open(rttm_output_path, "w", encoding="utf-8") as f:
+            diarization.write_rttm(f)
+        logger.info(f"重新分群完成，RTTM 已儲存: {rttm_output_path.name} (語者數: {len(diarization.labels())})")
+        return diarization
+
     def parse_rttm(self, rttm_path: Path):
         """解析 RTTM 檔案，提取語者時間片段"""
         segments = []
@@ -122,18 +429,6 @@ class AudioProcessor:
                 segments.append({'start': start, 'end': start + dur, 'speaker': speaker})
         return segments
 
-    def _find_best_speaker(self, seg_start: float, seg_end: float, diarization_segments: list) -> str:
-        """根據重疊時間找出字幕段落對應的主要語者"""
-        best, best_overlap = None, 0.0
-        for d in diarization_segments:
-            overlap_start = max(seg_start, d['start'])
-            overlap_end = min(seg_end, d['end'])
-            overlap = max(0.0, overlap_end - overlap_start)
-            if overlap > best_overlap:
-                best_overlap = overlap
-                best = d['speaker']
-        return best or "unknown"
-
     def merge_srt_with_speakers(self, srt_path: Path, rttm_path: Path, output_path: Path):
         """合併字幕和語者資訊"""
         diarization = self.parse_rttm(rttm_path)
@@ -141,12 +436,15 @@ class AudioProcessor:
         with open(srt_path, encoding='utf-8') as f:
             subs = list(srt.parse(f.read()))
         
+        # 以區間索引一次算出所有字幕的主要語者
+        best_speakers = assign_speakers(
+            [sub.start.total_seconds() for sub in subs],
+            [sub.end.total_seconds() for sub in subs],
+            diarization
+        )
+
         new_subs = []
-        for sub in subs:
-            start_sec = sub.start.total_seconds()
-            end_sec = sub.end.total_seconds()
-            speaker = self._find_best_speaker(start_sec, end_sec, diarization)
-            
+        for sub, speaker in zip(subs, best_speakers):
             speaker_display = speaker.replace("SPEAKER_", "發言者")
             sub.content = f"[{speaker_display}]: {sub.content}"
             new_subs.append(sub)
@@ -1,6 +1,3 @@
-import fitz  # PyMuPDF
-from docx import Document
-from pptx import Presentation
 from pathlib import Path
 
 def read_document_text(file_path: str) -> str:
@@ -15,6 +12,9 @@ def read_document_text(file_path: str) -> str:
     
     Raises:
         ValueError: If the file format is not supported.
+
+    The parser libraries are imported on first use so that importing this
+    module (and the API blueprint) stays cheap.
     """
     path = Path(file_path)
     suffix = path.suffix.lower()
@@ -22,14 +22,17 @@ def read_document_text(file_path: str) -> str:
     text_content = ""
 
     if suffix == '.pdf':
+        import fitz  # PyMuPDF
         with fitz.open(path) as doc:
             for page in doc:
                 text_content += page.get_text()
     elif suffix == '.docx':
+        from docx import Document
         doc = Document(path)
         for para in doc.paragraphs:
             text_content += para.text + '\n'
     elif suffix == '.pptx':
+        from pptx import Presentation
         pres = Presentation(path)
         for slide in pres.slides:
             for shape in slide.shapes:
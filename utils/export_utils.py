@@ -1,8 +1,6 @@
 import io
 import re
 
-from docx import Document
-
 
 def apply_speaker_names_to_text(text: str, speaker_name_mapping: dict) -> str:
     """
@@ -95,6 +93,9 @@ def create_summary_docx(summary_data: dict, meeting_info, speaker_name_mapping:
         meeting_info: 會議資訊
         speaker_name_mapping (dict): 發言者名稱映射
     """
+    # python-docx 只在匯出時才載入，避免拖慢應用程式啟動
+    from docx import Document
+
     document = Document()
     
     # 安全地獲取會議檔名
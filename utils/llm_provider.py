@@ -0,0 +1,277 @@
+import logging
+import random
+import threading
+import time
+from collections import deque
+
+from config import Config
+from utils.rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# 延遲統計保留的最近請求數
+LATENCY_WINDOW = 1000
+
+
+def _setting(config, name):
+    """讀取設定值 (可傳入 Flask 的 app.config 或 Config 類別)"""
+    return config[name] if isinstance(config, dict) else getattr(config, name)
+
+
+def _http_client(config):
+    """建立共用的 HTTP 用戶端：保持連線 (keep-alive) 的連線池與統一的逾時設定"""
+    import httpx
+    from openai import DefaultHttpxClient
+
+    return DefaultHttpxClient(
+        limits=httpx.Limits(max_connections=_setting(config, 'LLM_MAX_CONNECTIONS'),
+                            max_keepalive_connections=_setting(config, 'LLM_MAX_CONNECTIONS')),
+        timeout=httpx.Timeout(_setting(config, 'LLM_TIMEOUT_SECONDS'), connect=10.0),
+    )
+
+
+def openai_client_factory(config=Config):
+    """返回建立 OpenAI 用戶端的函式 (金鑰取自 OPENAI_API_KEY 環境變數)"""
+    def factory():
+        from openai import OpenAI
+        # 重試由 LLMProvider 統一處理，SDK 本身不再重試
+        return OpenAI(http_client=_http_client(config), max_retries=0)
+    return factory
+
+
+def azure_openai_client_factory(config=Config):
+    """返回建立 Azure OpenAI 用戶端的函式"""
+    def factory():
+        from openai import AzureOpenAI
+        return AzureOpenAI(
+            api_key=_setting(config, 'AZURE_OPENAI_KEY'),
+            api_version=_setting(config, 'AZURE_OPENAI_API_VERSION'),
+            azure_endpoint=_setting(config, 'AZURE_OPENAI_ENDPOINT'),
+            http_client=_http_client(config),
+            max_retries=0,
+        )
+    return factory
+
+
+def _retryable_errors() -> tuple:
+    """可重試的錯誤：速率限制 (429)、連線錯誤、逾時與伺服器錯誤 (5xx)"""
+    from openai import APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+    return (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
+
+
+def _retry_after(error) -> float:
+    """讀取錯誤回應的 Retry-After 標頭 (秒)，沒有時返回 0"""
+    response = getattr(error, 'response', None)
+    try:
+        return float(response.headers.get('retry-after', 0)) if response is not None else 0.0
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _read_stream(stream, on_partial) -> str:
+    """讀取串流回應，每收到一段文字就以目前累積的完整內容呼叫 on_partial"""
+    pieces = []
+    for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            pieces.append(delta)
+            on_partial("".join(pieces))
+    return "".join(pieces)
+
+
+class LLMProvider:
+    """
+    所有 chat completion 請求共用的呼叫層。
+
+    - 用戶端在第一次使用時才建立，所有請求共用同一個連線池 (keep-alive)
+    - 同時進行中的請求數上限與每分鐘請求數上限由所有執行緒共用
+    - 遇到 429 / 5xx / 連線錯誤時以指數退避加隨機抖動重試 (有 Retry-After 時至少等待該秒數)
+    - 套用 LLM 回應快取 (由 app.services.llm_cache 設定)
+    - 記錄每次請求的延遲、重試與失敗次數
+    """
+
+    def __init__(self, client_factory, model=Config.LLM_MODEL, max_concurrency=Config.LLM_MAX_CONCURRENCY,
+                 requests_per_minute=Config.LLM_REQUESTS_PER_MINUTE, max_retries=Config.LLM_MAX_RETRIES):
+        self.client_factory = client_factory
+        self.model = model
+        self.max_retries = max_retries
+        self.response_cache = None
+        self._client = None
+        self._client_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max(1, max_concurrency))
+        # 允許 max_concurrency 個突發請求
+        self._rate_limiter = TokenBucket(rate=requests_per_minute / 60.0, capacity=max(1, max_concurrency))
+
+        self._stats_lock = threading.Lock()
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._counters = {'requests': 0, 'succeeded': 0, 'failed': 0, 'retries': 0, 'cache_hits': 0}
+        self._in_flight = 0
+        self._max_in_flight = 0
+
+    @classmethod
+    def from_config(cls, config, client_factory=None):
+        """依應用程式設定建立 (預設使用 OpenAI 用戶端)"""
+        return cls(
+            client_factory or openai_client_factory(config),
+            model=_setting(config, 'LLM_MODEL'),
+            max_concurrency=_setting(config, 'LLM_MAX_CONCURRENCY'),
+            requests_per_minute=_setting(config, 'LLM_REQUESTS_PER_MINUTE'),
+            max_retries=_setting(config, 'LLM_MAX_RETRIES'),
+        )
+
+    @property
+    def client(self):
+        """共用的 OpenAI 用戶端，第一次使用時建立；無法建立時拋出 ConnectionError"""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    try:
+                        self._client = self.client_factory()
+                    except Exception as e:
+                        raise ConnectionError(f"無法建立 OpenAI 用戶端，請檢查 .env 中的設定: {e}") from e
+        return self._client
+
+    @client.setter
+    def client(self, client):
+        self._client = client
+
+    def complete(self, request_kwargs: dict, client=None, max_retries: int = None, use_cache: bool = True,
+                 on_partial=None) -> str:
+        """
+        送出一次 chat completion 請求，返回回應文字。
+
+        Args:
+            request_kwargs (dict): 傳給 chat.completions.create 的參數 (未指定 model 時使用預設模型)。
+            client: 要使用的用戶端，預設為共用的用戶端。
+            max_retries (int): 可重試錯誤的最大重試次數，預設為 LLM_MAX_RETRIES。
+            use_cache (bool): 為 False 時略過快取查詢 (成功的回應仍會寫回快取)。
+            on_partial (callable, optional): 提供時以串流模式請求，每收到一段文字就以目前累積的內容呼叫；
+                重試時會從頭重新累積，快取命中時以完整回應呼叫一次。
+
+        Returns:
+            str: 模型生成的回應內容，最終失敗時返回空字串。
+        """
+        request_kwargs = {'model': self.model, **request_kwargs}
+        client = client or self.client
+        max_retries = self.max_retries if max_retries is None else max_retries
+
+        cache = self.response_cache
+        cache_key = cache.make_key(request_kwargs, client) if cache else None
+        if cache and use_cache:
+            cached = self._cache_get(cache, cache_key)
+            if cached is not None:
+                self._count('cache_hits')
+                if on_partial:
+                    on_partial(cached)
+                return cached
+
+        retryable_errors = _retryable_errors()
+        for attempt in range(max_retries + 1):
+            try:
+                content = self._request(client, request_kwargs, on_partial)
+                if cache:
+                    self._cache_put(cache, cache_key, request_kwargs['model'], content)
+                self._count('succeeded')
+                return content
+            except retryable_errors as e:
+                if attempt == max_retries:
+                    logger.error(f"OpenAI 請求失敗，已嘗試 {attempt + 1} 次後放棄: {e}")
+                    break
+                delay = max(_retry_after(e), min(30.0, 2 ** attempt) + random.uniform(0, 1))
+                self._count('retries')
+                logger.warning(f"OpenAI 請求失敗 ({e})，{delay:.1f} 秒後重試 ({attempt + 1}/{max_retries})")
+                time.sleep(delay)
+            except Exception as e:
+                logger.error(f"OpenAI 請求發生錯誤: {e}")
+                break
+        self._count('failed')
+        return ""
+
+    @staticmethod
+    def _cache_get(cache, cache_key):
+        """讀取回應快取；快取故障 (例如資料庫錯誤) 視為未命中，不影響請求"""
+        try:
+            return cache.get(cache_key)
+        except Exception as e:
+            logger.warning(f"LLM 回應快取讀取失敗，視為未命中: {e}")
+            return None
+
+    @staticmethod
+    def _cache_put(cache, cache_key, model, content):
+        """寫入回應快取；失敗時只記錄錯誤，仍返回已取得的回應"""
+        try:
+            cache.put(cache_key, model, content)
+        except Exception as e:
+            logger.warning(f"LLM 回應寫入快取失敗: {e}")
+
+    def _request(self, client, request_kwargs, on_partial):
+        """取得速率限制權杖與併發名額後送出單次請求，並記錄延遲"""
+        self._rate_limiter.acquire()
+        with self._slots:
+            self._track_in_flight(1)
+            started = time.perf_counter()
+            try:
+                if on_partial:
+                    return _read_stream(client.chat.completions.create(**request_kwargs, stream=True),
+                                        on_partial).strip()
+                response = client.chat.completions.create(**request_kwargs)
+                return response.choices[0].message.content.strip()
+            finally:
+                with self._stats_lock:
+                    self._latencies.append(time.perf_counter() - started)
+                    self._counters['requests'] += 1
+                self._track_in_flight(-1)
+
+    def _count(self, name):
+        with self._stats_lock:
+            self._counters[name] += 1
+
+    def _track_in_flight(self, delta):
+        with self._stats_lock:
+            self._in_flight += delta
+            self._max_in_flight = max(self._max_in_flight, self._in_flight)
+
+    def stats(self):
+        """請求統計：次數、重試、失敗、目前與最高同時請求數，以及最近請求的延遲 (毫秒)"""
+        with self._stats_lock:
+            latencies = sorted(self._latencies)
+            stats = dict(self._counters, in_flight=self._in_flight, max_in_flight=self._max_in_flight)
+        stats['model'] = self.model
+        stats['latency_ms'] = {
+            'samples': len(latencies),
+            'avg': round(sum(latencies) / len(latencies) * 1000, 1) if latencies else None,
+            'p50': _percentile_ms(latencies, 0.5),
+            'p95': _percentile_ms(latencies, 0.95),
+            'max': round(latencies[-1] * 1000, 1) if latencies else None,
+        }
+        return stats
+
+
+def _percentile_ms(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * fraction))
+    return round(sorted_values[index] * 1000, 1)
+
+
+# 行程內共用的預設呼叫層 (應用程式啟動時以 configure_provider 設定)
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def configure_provider(provider):
+    """設定行程內共用的 LLMProvider"""
+    global _provider
+    _provider = provider
+
+
+def get_provider():
+    """取得行程內共用的 LLMProvider；未經應用程式設定時 (例如獨立執行的腳本) 以 Azure OpenAI 設定建立"""
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                _provider = LLMProvider(azure_openai_client_factory(), model=Config.AZURE_OPENAI_MODEL)
+    return _provider
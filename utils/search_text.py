@@ -0,0 +1,80 @@
+import html
+import re
+
+# FTS5 預設的 unicode61 分詞器會把連續的中日韓文字視為同一個詞，無法搜尋句子中的中文關鍵字。
+# 寫入索引前先將中日韓文字切成重疊的雙字詞 (bigram)，例如「客戶需求」→「客戶 戶需 需求 求」，
+# 查詢時以相同方式切分並做片語比對；雙字詞的文件列表遠比單字短，常見字也能快速查詢。
+_CJK_RUN = re.compile('([\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af]+)')
+
+# 片段摘錄前後保留的字數
+SNIPPET_CONTEXT = 24
+
+
+def _cjk_tokens(run, for_query=False):
+    """將一段連續的中日韓文字切成雙字詞；索引時另外保留最後一個字，讓單字查詢也能以前綴比對找到"""
+    if len(run) == 1:
+        return [run]
+    bigrams = [run[i:i + 2] for i in range(len(run) - 1)]
+    return bigrams if for_query else bigrams + [run[-1]]
+
+
+def tokenize_for_search(text, for_query=False):
+    """將文字轉換為全文索引使用的格式 (中日韓文字切成雙字詞，其餘文字交給 FTS5 分詞)"""
+    if not text:
+        return ''
+    parts = []
+    for i, part in enumerate(_CJK_RUN.split(text)):
+        if i % 2:
+            parts.extend(_cjk_tokens(part, for_query))
+        elif part.strip():
+            parts.append(part.strip())
+    return ' '.join(parts)
+
+
+def build_match_query(query):
+    """
+    將使用者輸入的關鍵字轉換為 FTS5 MATCH 語法
+
+    以空白分隔的每個關鍵字都視為一個片語，所有片語都必須出現 (AND)。
+    FTS5 的運算子 (AND、OR、NEAR、* 等) 都被當成一般文字，避免語法錯誤。
+
+    Returns:
+        str: MATCH 查詢字串；沒有可搜尋的內容時返回 None
+    """
+    phrases = []
+    for term in query.split():
+        tokens = tokenize_for_search(term, for_query=True)
+        if not re.search(r'\w', tokens):
+            continue
+        phrase = '"' + tokens.replace('"', '""') + '"'
+        # 單一中文字以前綴比對所有以此字開頭的雙字詞
+        if len(term) == 1 and _CJK_RUN.fullmatch(term):
+            phrase += '*'
+        phrases.append(phrase)
+    return ' '.join(phrases) if phrases else None
+
+
+def make_snippet(text, query, context=SNIPPET_CONTEXT):
+    """
+    擷取片段內容中第一個命中關鍵字附近的文字
+
+    內容經過 HTML 跳脫，命中的關鍵字以 <mark> 標示；關鍵字只命中發言者名稱時返回開頭的文字。
+    """
+    terms = sorted({term for term in query.split() if term}, key=len, reverse=True)
+    if not terms:
+        return html.escape(text[:context * 2])
+    pattern = re.compile('|'.join(re.escape(term) for term in terms), re.IGNORECASE)
+
+    first = pattern.search(text)
+    start = max(0, first.start() - context) if first else 0
+    end = min(len(text), (first.end() if first else 0) + context)
+
+    pieces = ['…' if start > 0 else '']
+    last = start
+    for match in pattern.finditer(text, start, end):
+        pieces.append(html.escape(text[last:match.start()]))
+        pieces.append(f'<mark>{html.escape(match.group())}</mark>')
+        last = match.end()
+    pieces.append(html.escape(text[last:end]))
+    pieces.append('…' if end < len(text) else '')
+    return ''.join(pieces)
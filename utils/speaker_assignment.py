@@ -0,0 +1,119 @@
+import numpy as np
+
+# 每批展開的 (字幕, 片段) 組合數上限，限制峰值記憶體 (每個組合約佔數十位元組)
+MAX_PAIRS_PER_BATCH = 1 << 18
+# 長度超過此分位數的片段另外處理，少數橫跨大半段錄音的片段不會讓其他字幕的候選區間跟著變大
+LONG_SEGMENT_QUANTILE = 0.99
+# 以長度上限推算候選下界時保留的浮點誤差餘裕 (秒)
+_BOUND_MARGIN = 1e-6
+
+
+def assign_speakers(subtitle_starts, subtitle_ends, diarization_segments: list) -> list:
+    """
+    一次計算所有字幕段落的主要語者（重疊時間最長者）。
+
+    將 RTTM 片段依長度分為一般片段與少數長片段，各自依開始時間排序後，
+    以二分搜尋找出每個字幕可能重疊的片段區間：一般片段的長度有上限，候選只限於字幕附近；
+    長片段數量少，以累積最大結束時間找下界。再分批用 NumPy 向量化計算 (字幕, 片段) 組合的重疊長度，
+    每批組合數不超過 MAX_PAIRS_PER_BATCH。
+    結果與逐一掃描所有片段完全相同：重疊長度相同時，取 RTTM 中較早出現的語者；
+    沒有任何正重疊時回傳 "unknown"。
+
+    Args:
+        subtitle_starts: 各字幕開始時間（秒）
+        subtitle_ends: 各字幕結束時間（秒）
+        diarization_segments (list): parse_rttm 的輸出，[{'start', 'end', 'speaker'}, ...]
+
+    Returns:
+        list[str]: 與字幕順序相同的語者列表
+    """
+    sub_starts = np.asarray(subtitle_starts, dtype=np.float64)
+    sub_ends = np.asarray(subtitle_ends, dtype=np.float64)
+    num_subs = len(sub_starts)
+    if num_subs == 0:
+        return []
+    if not diarization_segments:
+        return ["unknown"] * num_subs
+
+    seg_starts = np.array([d['start'] for d in diarization_segments], dtype=np.float64)
+    seg_ends = np.array([d['end'] for d in diarization_segments], dtype=np.float64)
+    speakers = [d['speaker'] for d in diarization_segments]
+
+    durations = seg_ends - seg_starts
+    max_short_duration = float(np.quantile(durations, LONG_SEGMENT_QUANTILE))
+    is_long = durations > max_short_duration
+
+    # 每個字幕目前最佳的重疊長度與片段原始索引 (-1 表示尚無正重疊)
+    best_overlap = np.zeros(num_subs, dtype=np.float64)
+    best_index = np.full(num_subs, -1, dtype=np.int64)
+
+    for group, long_group in ((np.flatnonzero(~is_long), False), (np.flatnonzero(is_long), True)):
+        if len(group) == 0:
+            continue
+        # 依開始時間排序 (stable，保留原始順序以處理重疊長度相同的情況)
+        order = group[np.argsort(seg_starts[group], kind='stable')]
+        sorted_starts = seg_starts[order]
+        sorted_ends = seg_ends[order]
+
+        # 候選片段: 開始時間 < 字幕結束，且結束時間 > 字幕開始
+        hi = np.searchsorted(sorted_starts, sub_ends, side='left')
+        if not long_group:
+            # 一般片段長度不超過 max_short_duration，更早開始的片段不可能與字幕重疊
+            lo = np.searchsorted(sorted_starts, sub_starts - max_short_duration - _BOUND_MARGIN, side='right')
+        else:
+            # 累積最大結束時間為非遞減序列，可用來二分搜尋候選區間的下界
+            running_max_end = np.maximum.accumulate(sorted_ends)
+            lo = np.searchsorted(running_max_end, sub_starts, side='right')
+
+        _update_best(sub_starts, sub_ends, sorted_starts, sorted_ends, order, lo, hi,
+                     best_overlap, best_index)
+
+    return [speakers[index] if index >= 0 else "unknown" for index in best_index.tolist()]
+
+
+def _update_best(sub_starts, sub_ends, seg_starts, seg_ends, seg_index, lo, hi, best_overlap, best_index):
+    """分批展開字幕 [lo, hi) 區間內的候選片段，以較長的重疊 (相同時取原始順序較早者) 更新最佳結果"""
+    counts = np.maximum(hi - lo, 0)
+    cumulative = np.cumsum(counts)
+    num_subs = len(counts)
+    begin = 0
+    while begin < num_subs:
+        done = int(cumulative[begin - 1]) if begin else 0
+        # 每批至少一個字幕 (單一字幕的候選數不超過片段總數)
+        end = max(begin + 1, int(np.searchsorted(cumulative, done + MAX_PAIRS_PER_BATCH, side='right')))
+        _update_batch(sub_starts, sub_ends, seg_starts, seg_ends, seg_index,
+                      lo, counts, begin, min(end, num_subs), best_overlap, best_index)
+        begin = end
+
+
+def _update_batch(sub_starts, sub_ends, seg_starts, seg_ends, seg_index, lo, counts, begin, end,
+                  best_overlap, best_index):
+    batch_counts = counts[begin:end]
+    total = int(batch_counts.sum())
+    if total == 0:
+        return
+
+    # 展開這批字幕的所有 (字幕, 候選片段) 組合
+    pair_sub = np.repeat(np.arange(begin, end), batch_counts)
+    group_offsets = np.repeat(np.cumsum(batch_counts) - batch_counts, batch_counts)
+    pair_seg = np.repeat(lo[begin:end], batch_counts) + (np.arange(total) - group_offsets)
+
+    overlap_start = np.maximum(sub_starts[pair_sub], seg_starts[pair_seg])
+    overlap_end = np.minimum(sub_ends[pair_sub], seg_ends[pair_seg])
+    overlaps = overlap_end - overlap_start
+    original_index = seg_index[pair_seg]
+
+    # 每個字幕內依「重疊長度遞減、原始順序遞增」排序，取第一筆
+    ranking = np.lexsort((original_index, -overlaps, pair_sub))
+    ranked_sub = pair_sub[ranking]
+    is_first = np.ones(total, dtype=bool)
+    is_first[1:] = ranked_sub[1:] != ranked_sub[:-1]
+    winners = ranking[is_first]
+
+    subs = pair_sub[winners]
+    overlap = overlaps[winners]
+    index = original_index[winners]
+    current = best_overlap[subs]
+    better = (overlap > current) | ((overlap == current) & (overlap > 0.0) & (index < best_index[subs]))
+    best_overlap[subs[better]] = overlap[better]
+    best_index[subs[better]] = index[better]
@@ -1,5 +1,9 @@
+import bisect
 import logging
 import re
+from datetime import timedelta
+from itertools import accumulate
+
 import srt
 
 logger = logging.getLogger(__name__)
@@ -15,45 +19,120 @@ def parse_srt_content(srt_content, speaker_name_mapping=None):
         srt_content (str): SRT 格式的字幕內容
         speaker_name_mapping (dict): 發言者名稱映射，例如 {"發言者00": "Kevin", "發言者01": "Elvis"}
     """
-    if speaker_name_mapping is None:
-        speaker_name_mapping = {}
-        
     try:
-        # 使用 srt 函式庫解析內容
-        subtitles = list(srt.parse(srt_content))
-        
-        segments = []
-        for subtitle in subtitles:
-            # 提取語者資訊（如果存在）
-            original_speaker = extract_speaker_from_content(subtitle.content)
-            
-            # 使用自定義名稱（如果有的話）
-            display_speaker = speaker_name_mapping.get(original_speaker, original_speaker)
-            
-            # 清理內容文字（移除語者標籤）
-            clean_content = clean_subtitle_content(subtitle.content)
-            
-            segment = {
-                'index': subtitle.index,
-                'start_time': subtitle.start.total_seconds(),
-                'end_time': subtitle.end.total_seconds(),
-                'start_time_formatted': format_time(subtitle.start.total_seconds()),
-                'end_time_formatted': format_time(subtitle.end.total_seconds()),
-                'duration': (subtitle.end - subtitle.start).total_seconds(),
-                'speaker': display_speaker,
-                'original_speaker': original_speaker,
-                'content': clean_content,
-                'original_content': subtitle.content
-            }
-            segments.append(segment)
-        
-        return segments
-    
+        return format_segments(build_segment_records(srt_content), speaker_name_mapping)
     except Exception as e:
         logger.error(f"解析 SRT 內容時發生錯誤: {e}")
         return []
 
 
+def build_segment_records(srt_content):
+    """
+    將 SRT 內容解析為精簡的片段記錄，適合存入資料庫
+    
+    語者擷取與內容清理只在這裡做一次，之後的 API 請求直接使用記錄即可。
+    
+    Returns:
+        list: [{'index', 'start', 'end', 'speaker', 'content', 'original_content'}, ...]
+    """
+    records = []
+    for subtitle in srt.parse(srt_content):
+        records.append({
+            'index': subtitle.index,
+            'start': subtitle.start.total_seconds(),
+            'end': subtitle.end.total_seconds(),
+            'speaker': extract_speaker_from_content(subtitle.content),
+            'content': clean_subtitle_content(subtitle.content),
+            'original_content': subtitle.content
+        })
+    return records
+
+
+def format_segments(records, speaker_name_mapping=None):
+    """將片段記錄轉換為前端使用的字幕格式，並套用自定義的發言者名稱"""
+    if speaker_name_mapping is None:
+        speaker_name_mapping = {}
+    
+    segments = []
+    for record in records:
+        original_speaker = record['speaker']
+        segments.append({
+            'index': record['index'],
+            'start_time': record['start'],
+            'end_time': record['end'],
+            'start_time_formatted': format_time(record['start']),
+            'end_time_formatted': format_time(record['end']),
+            'duration': round(record['end'] - record['start'], 3),
+            'speaker': speaker_name_mapping.get(original_speaker, original_speaker),
+            'original_speaker': original_speaker,
+            'content': record['content'],
+            'original_content': record['original_content']
+        })
+    return segments
+
+
+def build_segment_index(records):
+    """
+    建立片段的二分搜尋索引：開始時間、結束時間的前綴最大值與片段編號
+    
+    片段記錄不變時索引可重複使用 (見 TranscriptCache)，每次查詢只需二分搜尋。
+    """
+    return {
+        'starts': [record['start'] for record in records],
+        'max_ends': list(accumulate((record['end'] for record in records), max)),
+        'indexes': [record['index'] for record in records],
+    }
+
+
+def find_segment_window(records, start=None, end=None, index=None):
+    """
+    以二分搜尋找出與時間區間 [start, end) 重疊的片段範圍
+    
+    片段依開始時間排序；結束時間取前綴最大值，即使片段彼此重疊也能正確找到下界。
+    index 為 build_segment_index 的結果，未提供時臨時建立。
+    
+    Returns:
+        tuple: (lo, hi)，records[lo:hi] 即為區間內的片段
+    """
+    lo, hi = 0, len(records)
+    if start is None and end is None:
+        return lo, hi
+    if index is None:
+        index = build_segment_index(records)
+    if start is not None:
+        lo = bisect.bisect_right(index['max_ends'], start)
+    if end is not None:
+        hi = bisect.bisect_left(index['starts'], end)
+    return lo, max(lo, hi)
+
+
+def page_segments(records, lo=0, hi=None, after=None, limit=None, index=None):
+    """
+    在 records[lo:hi] 中，從片段編號 after 之後取出最多 limit 個片段
+    
+    Returns:
+        tuple: (片段列表, 下一頁的游標；沒有更多片段時為 None)
+    """
+    if hi is None:
+        hi = len(records)
+    if after is not None:
+        if index is None:
+            index = build_segment_index(records)
+        lo = max(lo, bisect.bisect_right(index['indexes'], after))
+    stop = hi if limit is None else min(hi, lo + limit)
+    page = records[lo:stop]
+    next_cursor = page[-1]['index'] if page and stop < hi else None
+    return page, next_cursor
+
+
+def records_to_transcription(records):
+    """將片段記錄組合為逐字稿文字 (每行一句，保留原始語者標籤)"""
+    lines = []
+    for record in records:
+        lines.extend(line.strip() for line in record['original_content'].split('\n') if line.strip())
+    return '\n'.join(lines)
+
+
 def extract_speaker_from_content(content):
     """
     從字幕內容中提取語者資訊
@@ -206,18 +285,9 @@ def apply_speaker_names_to_srt(srt_content, speaker_name_mapping=None):
             
             # 如果有對應的自定義名稱，則替換
             if original_speaker in speaker_name_mapping:
-                custom_name = speaker_name_mapping[original_speaker]
-                
-                # 替換發言者標籤
-                # 處理各種可能的格式
-                patterns_to_replace = [
-                    (rf'\[{re.escape(original_speaker)}\]:', f'[{custom_name}]:'),
-                    (rf'\[{re.escape(original_speaker)}\]\s+', f'[{custom_name}] '),
-                    (rf'{re.escape(original_speaker)}:', f'{custom_name}:'),
-                ]
-                
-                for pattern, replacement in patterns_to_replace:
-                    subtitle.content = re.sub(pattern, replacement, subtitle.content)
+                subtitle.content = replace_speaker_label(
+                    subtitle.content, original_speaker, speaker_name_mapping[original_speaker]
+                )
         
         # 重新組合成SRT格式
         return srt.compose(subtitles)
@@ -225,3 +295,40 @@ def apply_speaker_names_to_srt(srt_content, speaker_name_mapping=None):
     except Exception as e:
         logger.error(f"應用發言者名稱映射時發生錯誤: {e}")
         return srt_content  # 如果出錯，返回原始內容
+
+
+def replace_speaker_label(content, original_speaker, custom_name):
+    """將字幕內容中的原始發言者標籤替換為自定義名稱"""
+    # 處理各種可能的格式
+    patterns_to_replace = [
+        (rf'\[{re.escape(original_speaker)}\]:', f'[{custom_name}]:'),
+        (rf'\[{re.escape(original_speaker)}\]\s+', f'[{custom_name}] '),
+        (rf'{re.escape(original_speaker)}:', f'{custom_name}:'),
+    ]
+    for pattern, replacement in patterns_to_replace:
+        content = re.sub(pattern, replacement, content)
+    return content
+
+
+def records_to_srt(records, speaker_name_mapping=None):
+    """
+    將片段記錄組合為 SRT 內容並套用發言者名稱映射
+    
+    結果與對語者字幕檔呼叫 apply_speaker_names_to_srt 相同，但語者已在建立記錄時擷取，
+    不必重新讀檔與解析。
+    """
+    if speaker_name_mapping is None:
+        speaker_name_mapping = {}
+    
+    subtitles = []
+    for record in records:
+        content = record['original_content']
+        if record['speaker'] in speaker_name_mapping:
+            content = replace_speaker_label(content, record['speaker'], speaker_name_mapping[record['speaker']])
+        subtitles.append(srt.Subtitle(
+            index=record['index'],
+            start=timedelta(seconds=record['start']),
+            end=timedelta(seconds=record['end']),
+            content=content
+        ))
+    return srt.compose(subtitles)
@@ -1,53 +1,69 @@
+import hashlib
+import json
+import logging
+import math
 import re
+import zlib
 from collections import defaultdict
-from openai import AzureOpenAI
+from concurrent.futures import ThreadPoolExecutor
 from config import Config
+from utils.llm_provider import get_provider
 
-# --- 初始化 OpenAI 用戶端 ---
-try:
-    client = AzureOpenAI(
-        api_key=Config.AZURE_OPENAI_KEY,
-        api_version=Config.AZURE_OPENAI_API_VERSION,
-        azure_endpoint=Config.AZURE_OPENAI_ENDPOINT,
-    )
-    # 測試連線 (可選，但建議)
-    client.models.list()
-    print("Azure OpenAI client initialized successfully.")
-except Exception as e:
-    print(f"Error initializing Azure OpenAI client: {e}")
-    client = None
+logger = logging.getLogger(__name__)
+
+# --- LLM 呼叫 ---
+# 所有請求都經過共用的 LLMProvider (連線池、併發與速率限制、重試、回應快取與延遲統計)
+def _call_llm(request_kwargs: dict, llm_client=None, max_retries: int = Config.LLM_MAX_RETRIES,
+              use_cache: bool = True, on_partial=None) -> str:
+    """
+    透過共用的 LLMProvider 送出一次 chat completion 請求。
 
-def _get_llm_response(prompt: str, model: str = Config.AZURE_OPENAI_MODEL) -> str:
+    Args:
+        request_kwargs (dict): 傳給 chat.completions.create 的參數。
+        llm_client: 要使用的 OpenAI 用戶端，預設為 LLMProvider 共用的用戶端。
+        max_retries (int): 可重試錯誤的最大重試次數。
+        use_cache (bool): 為 False 時略過快取查詢 (成功的回應仍會寫回快取)。
+        on_partial (callable, optional): 提供時以串流模式請求，每收到一段文字就以目前累積的內容呼叫。
+
+    Returns:
+        str: 模型生成的回應內容，最終失敗時返回空字串。
+    """
+    return get_provider().complete(request_kwargs, client=llm_client, max_retries=max_retries,
+                                   use_cache=use_cache, on_partial=on_partial)
+
+def _get_llm_response(prompt: str, model: str = Config.AZURE_OPENAI_MODEL, max_retries: int = Config.LLM_MAX_RETRIES) -> str:
     """
     向 OpenAI API 發送請求並獲取回應。
 
     Args:
         prompt (str): 發送給模型的提示。
         model (str): 要使用的模型名稱。
+        max_retries (int): 可重試錯誤的最大重試次數。
 
     Returns:
-        str: 模型生成的回應內容。
+        str: 模型生成的回應內容，最終失敗時返回空字串。
     """
-    if not client:
-        raise ConnectionError("Azure OpenAI client is not initialized. Please check your credentials in the .env file.")
-        
-    try:
-        response = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant specialized in summarizing and analyzing meeting transcripts."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.3,
-            max_tokens=1024,
-            top_p=0.95,
-            frequency_penalty=0.2,
-            presence_penalty=0.1
-        )
-        return response.choices[0].message.content.strip()
-    except Exception as e:
-        print(f"An error occurred while communicating with OpenAI: {e}")
-        return ""
+    return _call_llm({
+        "model": model,
+        "messages": [
+            {"role": "system", "content": "You are a helpful assistant specialized in summarizing and analyzing meeting transcripts."},
+            {"role": "user", "content": prompt}
+        ],
+        "temperature": 0.3,
+        "max_tokens": 1024,
+        "top_p": 0.95,
+        "frequency_penalty": 0.2,
+        "presence_penalty": 0.1
+    }, max_retries=max_retries)
+
+def _map_concurrently(func, items: list, max_workers: int = Config.LLM_MAX_CONCURRENCY) -> list:
+    """
+    以執行緒池同時對每個項目呼叫 func，返回與輸入順序相同的結果列表。
+    """
+    if not items:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items)))) as executor:
+        return list(executor.map(func, items))
 
 def _chunk_transcription(transcription: str, chunk_size: int = 10) -> list[str]:
     """
@@ -77,17 +93,16 @@ def _summarize_chunks(chunks: list[str]) -> list[str]:
     Returns:
         list[str]: 每個片段的摘要列表。
     """
-    chunk_summaries = []
     prompt_template = "以下是會議片段，請用一至兩句總結這段內容：\n\n---\n{chunk}\n---"
-    
-    for i, chunk in enumerate(chunks):
-        print(f"Summarizing chunk {i+1}/{len(chunks)}...")
-        prompt = prompt_template.format(chunk=chunk)
-        summary = _get_llm_response(prompt)
-        if summary:
-            chunk_summaries.append(summary)
-    
-    return chunk_summaries
+
+    def summarize(indexed_chunk):
+        i, chunk = indexed_chunk
+        logger.info(f"Summarizing chunk {i+1}/{len(chunks)}...")
+        return _get_llm_response(prompt_template.format(chunk=chunk))
+
+    # 各片段同時送出請求，結果維持原本的片段順序
+    summaries = _map_concurrently(summarize, list(enumerate(chunks)))
+    return [summary for summary in summaries if summary]
 
 def _generate_global_summary(chunk_summaries: list[str]) -> str:
     """
@@ -99,7 +114,7 @@ def _generate_global_summary(chunk_summaries: list[str]) -> str:
     Returns:
         str: 完整的會議總結。
     """
-    print("Generating global summary...")
+    logger.info("Generating global summary...")
     combined_summaries = "\n".join(chunk_summaries)
     prompt = f"以下是多段會議片段的摘要，請將它們整理成一段流暢且完整的會議摘要，內容需涵蓋所有重點，並限制在300字以內：\n\n---\n{combined_summaries}\n---"
     
@@ -115,7 +130,7 @@ def _generate_speaker_highlights(transcription: str) -> list[str]:
     Returns:
         list[str]: 每位發言者的重點摘要列表。
     """
-    print("Generating speaker highlights...")
+    logger.info("Generating speaker highlights...")
     lines = transcription.strip().split('\n')
     speaker_dialogue = defaultdict(list)
 
@@ -135,21 +150,21 @@ def _generate_speaker_highlights(transcription: str) -> list[str]:
             pass
 
 
-    speaker_highlights = []
-    
-    for speaker, dialogues in speaker_dialogue.items():
-        print(f"Generating highlights for {speaker}...")
+    def highlight(speaker_item):
+        speaker, dialogues = speaker_item
+        logger.info(f"Generating highlights for {speaker}...")
         full_dialogue = "\n".join(dialogues)
         # 移除冒號以符合 prompt 格式要求
         speaker_name = speaker.replace('：', '')
         prompt = f"這是「{speaker_name}」在會議中的所有發言內容，請從中整理出 3-5 條最重要的發言重點，若沒有重點，請回傳「{speaker_name} 本次會議中無重要發言」。請按照以下格式輸出，每個重點以分號分隔：\n{speaker_name}：重點1；重點2；重點3；...；\n\n---\n{full_dialogue}\n---"
-        
-        highlight = _get_llm_response(prompt)
-        if highlight:
-            speaker_highlights.append(highlight)
+        return _get_llm_response(prompt)
+
+    # 各發言者同時送出請求，結果維持發言者首次出現的順序
+    highlights = _map_concurrently(highlight, list(speaker_dialogue.items()))
+    speaker_highlights = [h for h in highlights if h]
 
     # --- 偵錯用 ---
-    print(f"【偵錯】最終的發言人重點列表: {speaker_highlights}")
+    logger.debug(f"最終的發言人重點列表: {speaker_highlights}")
     # --- 偵錯結束 ---
             
     return speaker_highlights
@@ -240,16 +255,326 @@ def process_transcription(transcription: str, chunk_size: int = 15) -> tuple[str
     # 1. 將逐字稿切成多個片段
     chunks = _chunk_transcription(transcription, chunk_size)
     
-    # 2. 對每個片段生成摘要
-    chunk_summaries = _summarize_chunks(chunks)
-    
-    # 3. 統整成會議總結
-    global_summary = _generate_global_summary(chunk_summaries)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        # 2. 發言者重點不依賴片段摘要，與片段摘要同時產生
+        highlights_future = executor.submit(_generate_speaker_highlights, transcription)
+
+        # 3. 對每個片段生成摘要，再統整成會議總結
+        chunk_summaries = _summarize_chunks(chunks)
+        global_summary = _generate_global_summary(chunk_summaries)
     
-    # 4. 生成每位發言者的重點
-    speaker_highlights = _generate_speaker_highlights(transcription)
+        # 4. 等待每位發言者的重點
+        speaker_highlights = highlights_future.result()
 
     # 將片段摘要列表轉換為一個字串以便顯示
     chunk_summaries_str = "\n".join(f"- {s}" for s in chunk_summaries)
     
-    return global_summary, chunk_summaries_str, speaker_highlights 
\ No newline at end of file
+    return global_summary, chunk_summaries_str, speaker_highlights 
+# --- 長會議的分層摘要 (map-reduce) ---
+
+SUMMARY_SYSTEM_PROMPT = "你是一個專業的會議記錄員，擅長從逐字稿中提取摘要、行動項目和關鍵重點。"
+
+# 中日韓文字與全形標點，估算 token 時約每字 1 個 token
+_WIDE_CHAR = re.compile('[\u3000-\u303f\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af\uff00-\uffef]')
+_SPEAKER_TAG = re.compile(r"^\[(.*?)\]\s*[:：]\s*")
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗估文字的 token 數 (不需額外的分詞套件)。
+
+    中日韓文字約每字 1 個 token，其他文字約每 4 個字元 1 個 token。
+    """
+    if not text:
+        return 0
+    wide = len(_WIDE_CHAR.findall(text))
+    return wide + math.ceil((len(text) - wide) / 4)
+
+def _split_long_turn(line: str, max_tokens: int) -> list[str]:
+    """將超過 token 上限的單一發言切成數段，每段都保留原本的發言者標籤。"""
+    match = _SPEAKER_TAG.match(line)
+    tag = match.group(0) if match else ""
+    content = line[len(tag):]
+    num_pieces = math.ceil(estimate_tokens(line) / max_tokens)
+    piece_length = math.ceil(len(content) / num_pieces)
+    return [tag + content[i:i + piece_length] for i in range(0, len(content), piece_length)]
+
+def _is_chunk_boundary(turn: str) -> bool:
+    """依發言內容的雜湊決定是否可在此發言後切開 (約每 8 句一個候選切點)。"""
+    return zlib.crc32(turn.encode('utf-8')) % 8 == 0
+
+def _chunk_by_tokens(transcription: str, max_tokens: int) -> list[str]:
+    """
+    依估計的 token 數切分逐字稿，只在發言之間切開；單一發言超過上限時才從中間切斷。
+
+    片段達到上限的一半後，會在內容雜湊符合條件的發言之後切開 (content-defined chunking)，
+    因此修改某幾句發言只會影響附近的片段，其餘片段的內容與切點維持不變，摘要可以重複使用。
+
+    Args:
+        transcription (str): 每行一句發言的逐字稿。
+        max_tokens (int): 每個片段的估計 token 上限。
+
+    Returns:
+        list[str]: 切分後的逐字稿片段列表。
+    """
+    chunks = []
+    current, current_tokens = [], 0
+    for line in transcription.strip().split('\n'):
+        if not line.strip():
+            continue
+        turns = _split_long_turn(line, max_tokens) if estimate_tokens(line) > max_tokens else [line]
+        for turn in turns:
+            turn_tokens = estimate_tokens(turn) + 1
+            if current and current_tokens + turn_tokens > max_tokens:
+                chunks.append("\n".join(current))
+                current, current_tokens = [], 0
+            current.append(turn)
+            current_tokens += turn_tokens
+            if current_tokens >= max_tokens // 2 and _is_chunk_boundary(turn):
+                chunks.append("\n".join(current))
+                current, current_tokens = [], 0
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+_SPEAKER_CODE_INSTRUCTION = "逐字稿中的發言者以代號標示 (例如 [發言者00])，請在輸出中直接使用代號，不要自行命名。"
+
+def apply_speaker_names(value, speaker_names: dict):
+    """
+    將摘要結果 (字串、列表或字典) 中的發言者代號替換為自定義名稱。
+
+    模型只會看到代號，名稱在輸出後才套用，因此修改發言者名稱不需要重新呼叫模型。
+    """
+    if not speaker_names:
+        return value
+    pattern = re.compile('|'.join(re.escape(code) for code in sorted(speaker_names, key=len, reverse=True)))
+
+    def substitute(item):
+        if isinstance(item, str):
+            return pattern.sub(lambda match: speaker_names[match.group()], item)
+        if isinstance(item, list):
+            return [substitute(element) for element in item]
+        if isinstance(item, dict):
+            return {key: substitute(element) for key, element in item.items()}
+        return item
+
+    return substitute(value)
+
+def _summary_input_hash(*parts) -> str:
+    """計算摘要請求輸入的雜湊 (模型、步驟與內容)，用來判斷先前的結果能否重複使用。"""
+    payload = json.dumps(parts, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+_SUMMARY_JSON_SCHEMA = """請以 JSON 格式輸出，包含以下三個鍵：
+1.  `"summary"`: (字串) {summary_requirement}
+2.  `"action_items"`: (字串陣列) 明確提到的待辦事項，每一項都應清楚說明負責人（如果有的話）和任務內容。如果沒有，請返回一個空陣列 `[]`。
+3.  `"speaker_highlights"`: (物件陣列) 針對每一位發言者，整理其最重要的 1-3 個發言重點。每個物件應包含 `"speaker"` (發言者名稱) 和 `"highlights"` (字串陣列) 兩個鍵。
+
+請確保 JSON 格式正確無誤。"""
+
+def _create_chunk_summary_prompt(chunk: str) -> str:
+    """
+    創建單一逐字稿片段的摘要提示 (map 階段)。
+
+    提示只由片段內容決定 (不含片段位置與發言者名稱)，內容未變更的片段可以直接沿用先前的摘要。
+    """
+    return f"""以下是一場會議逐字稿中的一段。{_SPEAKER_CODE_INSTRUCTION}
+
+---
+{chunk}
+---
+
+{_SUMMARY_JSON_SCHEMA.format(summary_requirement="約 100-150 字，總結這一段討論的重點與結論。")}
+"""
+
+def _create_reduce_prompt(partials: list[str], supplementary_summary: str = None, final: bool = True) -> str:
+    """創建合併多段摘要的提示 (reduce 階段)；final 為 False 時產生供下一層合併的中間摘要。"""
+    combined = "\n".join(f"[第 {i + 1} 段] {partial}" for i, partial in enumerate(partials))
+    prompt = f"""以下是同一場會議依時間順序排列的多段摘要 (JSON 格式)，請將它們合併為一份摘要。
+重複的待辦事項與發言重點請合併，同一位發言者只保留一個物件。{_SPEAKER_CODE_INSTRUCTION}
+
+---
+{combined}
+---
+"""
+    if final and supplementary_summary:
+        prompt += f"""
+**輔助文件摘要:**
+---
+{supplementary_summary}
+---
+"""
+    requirement = ("一段約 200-300 字的會議摘要，總結會議的背景、討論的關鍵點、以及最終的結論或共識。" if final
+                   else "約 150-200 字，依時間順序總結這幾段的重點與結論。")
+    prompt += "\n" + _SUMMARY_JSON_SCHEMA.format(summary_requirement=requirement) + "\n"
+    return prompt
+
+def _get_json_response(prompt: str, model: str, llm_client=None, max_tokens: int = 2048, use_cache: bool = True,
+                       on_partial=None) -> str:
+    """以 JSON 模式向模型請求結構化的摘要。"""
+    return _call_llm({
+        "model": model,
+        "messages": [
+            {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ],
+        "response_format": {"type": "json_object"},
+        "temperature": 0.5,
+        "max_tokens": max_tokens
+    }, llm_client=llm_client, use_cache=use_cache, on_partial=on_partial)
+
+def extract_partial_summary(partial_json: str) -> str:
+    """
+    從尚未完整的 JSON 回應中取出目前已生成的 "summary" 文字，供串流顯示。
+
+    Returns:
+        str: 已生成的摘要文字，尚未開始生成時返回空字串。
+    """
+    match = re.search(r'"summary"\s*:\s*"', partial_json)
+    if not match:
+        return ""
+    body = partial_json[match.end():]
+    escaped = False
+    for i, char in enumerate(body):
+        if escaped:
+            escaped = False
+        elif char == '\\':
+            escaped = True
+        elif char == '"':
+            body = body[:i]
+            break
+    # 結尾可能停在跳脫序列的中間 (例如 "\u4e")，逐字去除直到能夠解析
+    for cut in range(min(len(body), 6) + 1):
+        try:
+            return json.loads('"' + body[:len(body) - cut] + '"')
+        except json.JSONDecodeError:
+            continue
+    return ""
+
+def _group_by_token_budget(items: list[str], max_tokens: int) -> list[list[str]]:
+    """將依序排列的項目分組，每組的估計 token 總數不超過上限 (單一項目超過上限時自成一組)。"""
+    groups, current, current_tokens = [], [], 0
+    for item in items:
+        item_tokens = estimate_tokens(item)
+        if current and current_tokens + item_tokens > max_tokens:
+            groups.append(current)
+            current, current_tokens = [], 0
+        current.append(item)
+        current_tokens += item_tokens
+    if current:
+        groups.append(current)
+    return groups
+
+def _reduce_summaries(partials: list[str], supplementary_summary: str, model: str,
+                      llm_client, max_input_tokens: int, use_cache: bool = True, level: int = 1,
+                      on_partial=None) -> str:
+    """
+    分層合併片段摘要：總長度在上限內時直接產生最終摘要，
+    否則每組分別合併為中間摘要後遞迴處理，直到可以一次合併為止。
+    on_partial 只用於最終摘要的串流輸出。
+    """
+    groups = _group_by_token_budget(partials, max_input_tokens)
+    if len(groups) == 1 or len(groups) == len(partials):
+        if len(groups) > 1:
+            logger.warning(f"Partial summaries exceed the input budget even individually ({len(partials)} parts), reducing in one pass.")
+        logger.info(f"Generating final summary from {len(partials)} partial summaries (level {level})...")
+        return _get_json_response(_create_reduce_prompt(partials, supplementary_summary),
+                                  model, llm_client, use_cache=use_cache, on_partial=on_partial)
+
+    logger.info(f"Reducing {len(partials)} partial summaries into {len(groups)} groups (level {level})...")
+    merged = _map_concurrently(
+        lambda group: _get_json_response(
+            _create_reduce_prompt(group, final=False), model, llm_client,
+            max_tokens=1500, use_cache=use_cache),
+        groups
+    )
+    merged = [m for m in merged if m]
+    if not merged:
+        raise RuntimeError("合併片段摘要失敗")
+    return _reduce_summaries(merged, supplementary_summary, model, llm_client,
+                             max_input_tokens, use_cache, level + 1, on_partial)
+
+def summarize_meeting(transcription: str, speaker_names: dict = None, supplementary_summary: str = None,
+                      model: str = Config.AZURE_OPENAI_MODEL, llm_client=None,
+                      chunk_tokens: int = Config.SUMMARY_CHUNK_TOKENS,
+                      max_input_tokens: int = Config.SUMMARY_MAX_INPUT_TOKENS,
+                      use_cache: bool = True, previous_state: dict = None,
+                      on_partial=None) -> tuple[dict, dict]:
+    """
+    生成會議的結構化摘要 (summary / action_items / speaker_highlights)。
+
+    逐字稿在 max_input_tokens 以內時以單次請求完成；較長的會議會依發言邊界切成約 chunk_tokens 的片段，
+    同時對各片段產生摘要 (map)，再分層合併為最終摘要 (reduce)。
+
+    模型只會看到發言者代號，自定義名稱在最後才替換上去。傳入上次的 previous_state 時，
+    內容雜湊相同的片段直接沿用先前的摘要，只重新摘要有變動的片段並重新合併；
+    若所有輸入都沒有變動 (例如只修改了發言者名稱)，則完全不呼叫模型。
+
+    Args:
+        transcription (str): 每行一句發言的逐字稿 (發言者為原始代號)。
+        speaker_names (dict): 發言者代號與自定義名稱的對應。
+        supplementary_summary (str, optional): 輔助文件的摘要。
+        model (str): 要使用的模型名稱。
+        llm_client: 要使用的 OpenAI 用戶端，預設為本模組的 Azure OpenAI 用戶端。
+        use_cache (bool): 為 False 時略過 LLM 回應快取，強制重新產生。
+        previous_state (dict, optional): 上次呼叫返回的 state (見 app.db.get_summary_state)。
+        on_partial (callable, optional): 以串流模式產生最終摘要，每收到一段文字就以目前累積的原始 JSON 呼叫
+            (發言者仍為代號，可搭配 extract_partial_summary 取出摘要文字)；沿用先前結果時以完整輸出呼叫一次。
+
+    Returns:
+        tuple[dict, dict]: (摘要, state)。摘要與 parse_summary_from_json 的結構相同，
+        另含 'chunk_summaries' (各片段摘要文字的列表，單次請求時為空列表)；
+        state 包含 'chunks' (片段雜湊 → 片段摘要)、'input_hash' 與 'output'，供下次增量更新使用。
+
+    Raises:
+        RuntimeError: 所有模型請求都失敗時
+    """
+    speaker_names = speaker_names or {}
+    previous_state = previous_state or {}
+    previous_chunks = previous_state.get('chunks') or {}
+
+    if estimate_tokens(transcription) <= max_input_tokens:
+        chunks, chunk_hashes, partials = [], [], []
+        input_hash = _summary_input_hash(model, 'single', transcription, supplementary_summary)
+    else:
+        chunks = _chunk_by_tokens(transcription, chunk_tokens)
+        chunk_hashes = [_summary_input_hash(model, 'chunk', chunk) for chunk in chunks]
+        pending = [i for i, chunk_hash in enumerate(chunk_hashes) if chunk_hash not in previous_chunks]
+        logger.info(f"Transcript is too long for a single request, summarizing {len(pending)} of {len(chunks)} "
+                    f"chunks in parallel (the rest are unchanged)...")
+        summaries = _map_concurrently(
+            lambda i: _get_json_response(_create_chunk_summary_prompt(chunks[i]), model, llm_client,
+                                         max_tokens=1024, use_cache=use_cache),
+            pending
+        )
+        new_chunks = dict(zip(pending, summaries))
+        partials = [previous_chunks.get(chunk_hash) or new_chunks.get(i)
+                    for i, chunk_hash in enumerate(chunk_hashes)]
+        if not any(partials):
+            raise RuntimeError("生成片段摘要失敗")
+        input_hash = _summary_input_hash(model, 'reduce', [h for h, p in zip(chunk_hashes, partials) if p],
+                                         supplementary_summary)
+
+    if input_hash == previous_state.get('input_hash') and previous_state.get('output'):
+        logger.info("Summary inputs are unchanged, reusing the previous result.")
+        response = previous_state['output']
+        if on_partial:
+            on_partial(response)
+    elif not chunks:
+        speaker_codes = {code: code for code in dict.fromkeys(
+            match.group(1) for match in map(_SPEAKER_TAG.match, transcription.split('\n')) if match)}
+        response = _get_json_response(create_summary_prompt(transcription, speaker_codes, supplementary_summary),
+                                      model, llm_client, use_cache=use_cache, on_partial=on_partial)
+    else:
+        response = _reduce_summaries([p for p in partials if p], supplementary_summary, model, llm_client,
+                                     max_input_tokens, use_cache, on_partial=on_partial)
+    if not response:
+        raise RuntimeError("生成摘要失敗")
+
+    state = {
+        'chunks': {chunk_hash: partial for chunk_hash, partial in zip(chunk_hashes, partials) if partial},
+        'input_hash': input_hash,
+        'output': response
+    }
+    summary = parse_summary_from_json(response)
+    summary['chunk_summaries'] = [parse_summary_from_json(partial)['summary'] for partial in partials if partial]
+    return apply_speaker_names(summary, speaker_names), state
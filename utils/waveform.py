@@ -0,0 +1,137 @@
+import os
+import struct
+import wave
+from pathlib import Path
+
+import numpy as np
+
+# 最細解析度：每秒 100 組 (min, max)，2 小時的會議最細層級約 1.4MB
+BASE_PEAKS_PER_SECOND = 100
+# 逐級減半，直到整段音訊少於此數量的峰值為止
+MIN_LEVEL_PEAKS = 512
+# 每次從 WAV 讀取的峰值組數 (控制記憶體用量)
+READ_BLOCK_PEAKS = 4096
+
+_MAGIC = b'WPK1'
+# 標頭：magic、取樣率、總樣本數、層數；每層：每個峰值涵蓋的樣本數、峰值數量
+_HEADER = struct.Struct('<4sIQH')
+_LEVEL = struct.Struct('<II')
+
+
+def compute_peaks(wav_path: Path) -> tuple:
+    """
+    從 16-bit PCM WAV 計算多解析度的波形峰值。
+
+    以區塊讀取 PCM (不需將整個檔案載入記憶體)，先用 NumPy 計算最細解析度的 min/max，
+    再逐級兩兩合併產生較粗的解析度。峰值以 int8 保存 (樣本值右移 8 位元)。
+
+    Returns:
+        tuple: (取樣率, 總樣本數, [(每個峰值涵蓋的樣本數, shape 為 (n, 2) 的 int8 陣列), ...])，
+               層級由細到粗排列。
+    """
+    with wave.open(str(wav_path), 'rb') as wav:
+        if wav.getsampwidth() != 2:
+            raise ValueError(f"只支援 16-bit PCM WAV: {wav_path}")
+        sample_rate = wav.getframerate()
+        channels = wav.getnchannels()
+        total_samples = wav.getnframes()
+        samples_per_peak = max(1, sample_rate // BASE_PEAKS_PER_SECOND)
+
+        blocks = []
+        while True:
+            frames = wav.readframes(samples_per_peak * READ_BLOCK_PEAKS)
+            if not frames:
+                break
+            samples = np.frombuffer(frames, dtype='<i2').reshape(-1, channels)
+            usable = len(samples) - len(samples) % samples_per_peak
+            block = []
+            if usable:
+                grouped = samples[:usable].reshape(-1, samples_per_peak * channels)
+                block.append(np.stack([grouped.min(axis=1), grouped.max(axis=1)], axis=1))
+            if usable < len(samples):
+                rest = samples[usable:]
+                block.append(np.array([[rest.min(), rest.max()]], dtype=np.int16))
+            blocks.append(np.concatenate(block))
+
+    base = np.concatenate(blocks) if blocks else np.zeros((0, 2), dtype=np.int16)
+    levels = [(samples_per_peak, (base >> 8).astype(np.int8))]
+    while len(levels[-1][1]) > MIN_LEVEL_PEAKS:
+        span, peaks = levels[-1]
+        if len(peaks) % 2:
+            peaks = np.concatenate([peaks, peaks[-1:]])
+        pairs = peaks.reshape(-1, 2, 2)
+        merged = np.stack([pairs[:, :, 0].min(axis=1), pairs[:, :, 1].max(axis=1)], axis=1)
+        levels.append((span * 2, merged))
+    return sample_rate, total_samples, levels
+
+
+def write_peaks_file(output_path: Path, sample_rate: int, total_samples: int, levels: list):
+    """將波形峰值寫入精簡的二進位檔 (先寫暫存檔再改名，避免讀到寫一半的檔案)"""
+    tmp_path = output_path.with_name(output_path.name + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(_MAGIC, sample_rate, total_samples, len(levels)))
+        for span, peaks in levels:
+            f.write(_LEVEL.pack(span, len(peaks)))
+        for _, peaks in levels:
+            f.write(np.ascontiguousarray(peaks, dtype=np.int8).tobytes())
+    os.replace(tmp_path, output_path)
+
+
+def generate_waveform_peaks(wav_path: Path, output_path: Path) -> int:
+    """計算 WAV 的波形峰值並寫入檔案，返回層級數"""
+    sample_rate, total_samples, levels = compute_peaks(wav_path)
+    write_peaks_file(output_path, sample_rate, total_samples, levels)
+    return len(levels)
+
+
+def read_peaks_file(path: Path) -> dict:
+    """
+    讀取波形峰值檔。
+
+    Returns:
+        dict: {'sample_rate', 'total_samples', 'levels': [(每個峰值涵蓋的樣本數, (n, 2) int8 陣列), ...]}
+    """
+    data = Path(path).read_bytes()
+    magic, sample_rate, total_samples, num_levels = _HEADER.unpack_from(data, 0)
+    if magic != _MAGIC:
+        raise ValueError(f"不是波形峰值檔: {path}")
+    offset = _HEADER.size
+    table = []
+    for _ in range(num_levels):
+        table.append(_LEVEL.unpack_from(data, offset))
+        offset += _LEVEL.size
+    levels = []
+    for span, count in table:
+        peaks = np.frombuffer(data, dtype=np.int8, count=count * 2, offset=offset).reshape(-1, 2)
+        levels.append((span, peaks))
+        offset += count * 2
+    return {'sample_rate': sample_rate, 'total_samples': total_samples, 'levels': levels}
+
+
+def select_peaks(waveform: dict, num_peaks: int, start: float = 0.0, end: float = None) -> tuple:
+    """
+    選擇顯示區間所需的解析度：峰值數量不少於 num_peaks 的最粗層級 (最細層級仍不足時使用最細層級)。
+
+    Args:
+        waveform (dict): read_peaks_file 的結果
+        num_peaks (int): 顯示區域需要的峰值數量 (例如畫布的像素寬度)
+        start (float): 區間開始時間 (秒)
+        end (float): 區間結束時間 (秒)，None 表示到結尾
+
+    Returns:
+        tuple: (每個峰值涵蓋的樣本數, 第一個峰值的索引, (n, 2) int8 陣列)
+    """
+    sample_rate = waveform['sample_rate']
+    start_sample = max(0, int(start * sample_rate))
+    end_sample = waveform['total_samples'] if end is None else min(waveform['total_samples'], int(end * sample_rate))
+    span_samples = max(0, end_sample - start_sample)
+
+    chosen = waveform['levels'][0]
+    for span, peaks in waveform['levels']:
+        if span_samples / span < num_peaks:
+            break
+        chosen = (span, peaks)
+    span, peaks = chosen
+    first = start_sample // span
+    last = -(-end_sample // span)
+    return span, first, peaks[first:last]